@@ -0,0 +1,329 @@
+"""Book issuance analytics.
+
+Issuance counts are stored at three granularities: daily
+(BookIssuanceRecord), weekly (BookIssuanceWeekly) and monthly
+(BookIssuanceMonthly). ``record_book_issuance`` keeps all three current, so
+a chart over several years reads a few dozen monthly rows instead of
+hundreds of daily ones.
+"""
+import atexit
+import threading
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .models import Book, BookIssuanceRecord, BookIssuanceWeekly, BookIssuanceMonthly
+
+DAILY, WEEKLY, MONTHLY = 'daily', 'weekly', 'monthly'
+
+# Longest window (in days) served at each granularity; anything longer is monthly.
+DAILY_MAX_DAYS = 90
+WEEKLY_MAX_DAYS = 730
+# Longest window served at all (ten years)
+MAX_DAYS = 3650
+
+# Opt-in write-behind buffering of issuance counts (see IssuanceBuffer)
+ANALYTICS_WRITE_BEHIND = getattr(settings, 'ANALYTICS_WRITE_BEHIND', False)
+ANALYTICS_FLUSH_EVENTS = getattr(settings, 'ANALYTICS_FLUSH_EVENTS', 100)
+ANALYTICS_FLUSH_INTERVAL = getattr(settings, 'ANALYTICS_FLUSH_INTERVAL', 30)
+
+
+def week_start(day):
+    """Monday of the week containing `day`."""
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def pick_granularity(days):
+    if days <= DAILY_MAX_DAYS:
+        return DAILY
+    if days <= WEEKLY_MAX_DAYS:
+        return WEEKLY
+    return MONTHLY
+
+
+# granularity -> (model, date field, bucket start function, next bucket function)
+ROLLUPS = {
+    DAILY: (BookIssuanceRecord, 'date', lambda d: d, lambda d: d + timedelta(days=1)),
+    WEEKLY: (BookIssuanceWeekly, 'week_start', week_start, lambda d: d + timedelta(days=7)),
+    MONTHLY: (BookIssuanceMonthly, 'month_start', month_start, next_month),
+}
+
+
+def _upsert_increments(counts):
+    """Add `counts` ({(book_id, date): n}) to the daily, weekly and monthly tables.
+
+    One ``INSERT ... ON CONFLICT DO UPDATE SET quantity_issued = quantity_issued + excluded...``
+    statement per table, so concurrent writers never lose an increment
+    (supported by SQLite >= 3.24 and PostgreSQL).
+    """
+    if not counts:
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model, field, bucket, _ in ROLLUPS.values():
+            merged = {}
+            for (book_id, day), n in counts.items():
+                key = (book_id, bucket(day))
+                merged[key] = merged.get(key, 0) + n
+            table = connection.ops.quote_name(model._meta.db_table)
+            column = connection.ops.quote_name(model._meta.get_field(field).column)
+            cursor.executemany(
+                f"INSERT INTO {table} (book_id, {column}, quantity_issued) VALUES (%s, %s, %s) "
+                f"ON CONFLICT (book_id, {column}) "
+                f"DO UPDATE SET quantity_issued = {table}.quantity_issued + excluded.quantity_issued",
+                [(book_id, connection.ops.adapt_datefield_value(day), n) for (book_id, day), n in merged.items()],
+            )
+        # last-analytics-write marker for conditional GET on the analytics endpoints
+        Book.objects.filter(pk__in={book_id for book_id, _ in counts}).update(analytics_updated_at=timezone.now())
+
+
+class IssuanceBuffer:
+    """Write-behind buffer for issuance counts.
+
+    Increments are merged per (book, date) in memory and written with one
+    bulk upsert once ANALYTICS_FLUSH_EVENTS issues have been buffered, or by
+    a timer ANALYTICS_FLUSH_INTERVAL seconds after the first buffered count
+    (so an idle worker does not sit on them), and at interpreter exit.
+    A flush triggered while the caller is inside a transaction waits for it
+    to commit, so the upsert neither joins nor outlives the caller's atomic
+    block. Counts still buffered when a worker is killed are lost, which is
+    why this is opt-in via ANALYTICS_WRITE_BEHIND.
+    """
+
+    def __init__(self, max_events, max_age):
+        self.max_events = max_events
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._events = 0
+        self._flush_pending = False
+        self._timer = None
+
+    def add(self, book_id, day, n=1):
+        with self._lock:
+            key = (book_id, day)
+            self._counts[key] = self._counts.get(key, 0) + n
+            self._events += n
+            if self._timer is None:
+                self._timer = threading.Timer(self.max_age, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+            due = self._events >= self.max_events and not self._flush_pending
+            if due:
+                self._flush_pending = True
+        if due:
+            # runs straight away outside a transaction, otherwise after the caller commits
+            transaction.on_commit(self.flush, robust=True)
+
+    def _flush_on_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            connection.close()  # this thread's own connection
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            self._events = 0
+            self._flush_pending = False
+        try:
+            _upsert_increments(counts)
+        except Exception:
+            # put the counts back so the next flush retries them
+            with self._lock:
+                for key, n in counts.items():
+                    self._counts[key] = self._counts.get(key, 0) + n
+                    self._events += n
+            raise
+
+
+issuance_buffer = IssuanceBuffer(ANALYTICS_FLUSH_EVENTS, ANALYTICS_FLUSH_INTERVAL)
+if ANALYTICS_WRITE_BEHIND:
+    atexit.register(issuance_buffer.flush)
+
+
+def record_book_issuance(book, issued_date=None):
+    """Record a book issuance in the analytics (daily, weekly and monthly counts)."""
+    if issued_date is None:
+        issued_date = date.today()
+
+    record_book_issuances({(book.pk, issued_date): 1})
+
+
+def record_book_issuances(counts):
+    """Record several issuances at once; `counts` maps (book_id, date) to a number of issues."""
+    if ANALYTICS_WRITE_BEHIND:
+        for (book_id, day), n in counts.items():
+            issuance_buffer.add(book_id, day, n)
+    else:
+        _upsert_increments(counts)
+
+
+def get_book_analytics_data(book, days=90, granularity=None):
+    """Get analytics data for a book over the last N days.
+
+    Returns a dense series with one point per day, week or month (zero when
+    nothing was issued). When `granularity` is not given it is chosen from
+    `days`: daily up to 90 days, weekly up to two years, monthly beyond.
+    Weekly/monthly windows start at the beginning of the bucket containing
+    the start date. `days` is clamped to 1..MAX_DAYS.
+    """
+    days = min(max(int(days), 1), MAX_DAYS)
+    granularity = granularity or pick_granularity(days)
+    model, field, bucket, step = ROLLUPS[granularity]
+
+    end_date = date.today()
+    start_date = end_date - timedelta(days=days)
+    first_bucket = bucket(start_date)
+
+    counts = dict(
+        model.objects.filter(
+            book=book,
+            **{f'{field}__gte': first_bucket, f'{field}__lte': end_date}
+        ).values_list(field, 'quantity_issued')
+    )
+
+    dates = []
+    quantities = []
+    current = first_bucket
+    while current <= end_date:
+        dates.append(str(current))
+        quantities.append(counts.get(current, 0))
+        current = step(current)
+
+    total = sum(quantities)
+    return {
+        'granularity': granularity,
+        'dates': dates,
+        'quantities': quantities,
+        'total_issued': total,
+        'avg_per_day': total / ((end_date - first_bucket).days + 1),
+    }
+
+
+def touch_analytics(book_ids, batch_size=500):
+    """Set analytics_updated_at on the given books, so their cached/conditional analytics are rebuilt."""
+    book_ids = sorted(book_ids)
+    now = timezone.now()
+    for start in range(0, len(book_ids), batch_size):
+        Book.objects.filter(pk__in=book_ids[start:start + batch_size]).update(analytics_updated_at=now)
+
+
+def rebuild_rollups(start=None, end=None, batch_size=1000, touch=True):
+    """Recompute the weekly and monthly rollups from the daily records.
+
+    Only buckets overlapping [start, end] are rebuilt (widened to whole
+    weeks/months); with no bounds everything is rebuilt. Daily rows are
+    streamed in (book, date) order, so memory holds one book's buckets at a
+    time. Returns the ids of the books whose rollups changed; unless `touch`
+    is False their analytics_updated_at is set as well.
+    """
+    changed = set()
+    for granularity in (WEEKLY, MONTHLY):
+        model, field, bucket, step = ROLLUPS[granularity]
+        daily = BookIssuanceRecord.objects.all()
+        rollups = model.objects.all()
+        if start is not None:
+            daily = daily.filter(date__gte=bucket(start))
+            rollups = rollups.filter(**{f'{field}__gte': bucket(start)})
+        if end is not None:
+            last = step(bucket(end))
+            daily = daily.filter(date__lt=last)
+            rollups = rollups.filter(**{f'{field}__lt': last})
+
+        old = set(rollups.values_list('book_id', field, 'quantity_issued'))
+        new = set()
+        rollups.delete()
+        rows = daily.order_by('book_id', 'date').values_list('book_id', 'date', 'quantity_issued')
+        pending = []
+        current_book, totals = None, {}
+        for book_id, day, quantity in rows.iterator(chunk_size=batch_size):
+            if book_id != current_book:
+                pending.extend(model(book_id=current_book, quantity_issued=q, **{field: d}) for d, q in totals.items())
+                new.update((current_book, d, q) for d, q in totals.items())
+                current_book, totals = book_id, {}
+                if len(pending) >= batch_size:
+                    model.objects.bulk_create(pending, batch_size=batch_size)
+                    pending = []
+            key = bucket(day)
+            totals[key] = totals.get(key, 0) + quantity
+        pending.extend(model(book_id=current_book, quantity_issued=q, **{field: d}) for d, q in totals.items())
+        model.objects.bulk_create(pending, batch_size=batch_size)
+        new.update((current_book, d, q) for d, q in totals.items())
+        changed.update(book_id for book_id, _, _ in old ^ new)
+    if touch:
+        touch_analytics(changed)
+    return changed
+
+
+def rebuild_issuance_records(since=None, until=None, batch_size=1000):
+    """Rebuild BookIssuanceRecord (and the rollups) from Issue.issued_date.
+
+    Works one calendar month at a time, each in its own transaction: the
+    month's daily records are replaced by a ``GROUP BY book, issued_date``
+    of its issues (written with batched bulk_create) and the rollups
+    overlapping it are rebuilt. A long rebuild therefore never holds the
+    write lock for more than a month of data, and if it is interrupted the
+    months already done stay consistent. `since` defaults to the earliest
+    issue or record, `until` to today. Books whose records or rollups
+    changed get analytics_updated_at set once at the end. Returns the number
+    of daily records written.
+    """
+    from .models import Issue
+
+    if since is None:
+        firsts = [
+            Issue.objects.aggregate(first=Min('issued_date'))['first'],
+            BookIssuanceRecord.objects.aggregate(first=Min('date'))['first'],
+        ]
+        firsts = [d for d in firsts if d is not None]
+        if not firsts:
+            return 0
+        since = min(firsts)
+    if until is None:
+        until = date.today()
+
+    written = 0
+    changed = set()
+    window_start = since
+    while window_start <= until:
+        window_end = min(next_month(window_start) - timedelta(days=1), until)
+        with transaction.atomic():
+            records = BookIssuanceRecord.objects.filter(date__gte=window_start, date__lte=window_end)
+            old = set(records.values_list('book_id', 'date', 'quantity_issued'))
+            records.delete()
+            grouped = (
+                Issue.objects.filter(issued_date__gte=window_start, issued_date__lte=window_end)
+                .order_by()
+                .values_list('book_id', 'issued_date')
+                .annotate(n=Count('pk'))
+                .order_by('book_id', 'issued_date')
+            )
+            batch = []
+            new = set()
+            for book_id, issued_date, n in grouped.iterator(chunk_size=batch_size):
+                new.add((book_id, issued_date, n))
+                batch.append(BookIssuanceRecord(book_id=book_id, date=issued_date, quantity_issued=n))
+                if len(batch) >= batch_size:
+                    BookIssuanceRecord.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            BookIssuanceRecord.objects.bulk_create(batch)
+            written += len(batch)
+            changed.update(book_id for book_id, _, _ in old ^ new)
+            changed |= rebuild_rollups(window_start, window_end, batch_size=batch_size, touch=False)
+        window_start = window_end + timedelta(days=1)
+    touch_analytics(changed)
+    return written
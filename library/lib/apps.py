@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class LibConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'lib'
+
+    def ready(self):
+        # Register signal handlers (search index sync etc.)
+        from . import signals  # noqa: F401
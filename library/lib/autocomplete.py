@@ -0,0 +1,227 @@
+"""In-process autocomplete index for the live book search.
+
+Each worker process keeps a small in-memory index over ``Book.name`` and
+``Book.author`` so that ``ajax_search_books`` can answer keystroke queries
+without touching the database for the matching step:
+
+* a sorted prefix array of ``(key, field, pk)`` tuples, where the keys are
+  the normalised full title/author and every word-suffix of them, searched
+  with ``bisect`` for "starts with" and "word starts with" matches;
+* a trigram posting list (``trigram -> set of book pks``) used both for
+  substring matches and for typo-tolerant fuzzy matches.
+
+The index is loaded on first use (or eagerly by ``warm_up()`` from
+``library/wsgi.py``), kept current by the Book signal handlers in
+``lib/signals.py`` and fully reloaded every ``AUTOCOMPLETE_MAX_AGE`` seconds
+so that edits made in other worker processes are eventually picked up.
+"""
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+# Reload the whole index after this many seconds (edits from other processes).
+AUTOCOMPLETE_MAX_AGE = getattr(settings, 'AUTOCOMPLETE_MAX_AGE', 300)
+# Minimum share of the query's trigrams a title/author must contain to count as a fuzzy hit.
+AUTOCOMPLETE_FUZZY_THRESHOLD = getattr(settings, 'AUTOCOMPLETE_FUZZY_THRESHOLD', 0.5)
+
+# Match tiers, best first.
+TIER_NAME_PREFIX = 0
+TIER_NAME_WORD = 1
+TIER_NAME_SUBSTRING = 2
+TIER_AUTHOR_PREFIX = 3
+TIER_AUTHOR_SUBSTRING = 4
+TIER_FUZZY = 5
+
+# Prefix-array field tags
+_NAME, _NAME_WORD, _AUTHOR, _AUTHOR_WORD = 0, 1, 2, 3
+_PREFIX_TIERS = {
+    _NAME: TIER_NAME_PREFIX,
+    _NAME_WORD: TIER_NAME_WORD,
+    _AUTHOR: TIER_AUTHOR_PREFIX,
+    _AUTHOR_WORD: TIER_AUTHOR_PREFIX,
+}
+
+
+def normalize(text):
+    """Casefold, strip accents and punctuation, collapse whitespace."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = ''.join(ch if ch.isalnum() else ' ' for ch in text.casefold())
+    return ' '.join(text.split())
+
+
+def trigrams(text, pad=True):
+    """Return the set of character trigrams in `text` (padded at word edges)."""
+    if pad:
+        text = f"  {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _word_suffixes(text):
+    """Yield every suffix of `text` that starts at a word boundary (excluding the full string)."""
+    for i, ch in enumerate(text):
+        if ch == ' ' and i + 1 < len(text):
+            yield text[i + 1:]
+
+
+class AutocompleteIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._docs = {}       # pk -> (name, author, category_id, name_norm, author_norm)
+        self._prefix = []     # sorted [(key, field, pk)]
+        self._postings = {}   # trigram -> {pk}
+        self._loaded_at = None
+
+    # -- maintenance -------------------------------------------------------
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def is_stale(self):
+        return not self.loaded or time.monotonic() - self._loaded_at > AUTOCOMPLETE_MAX_AGE
+
+    def load(self):
+        """(Re)build the index from the database in a single query."""
+        from .models import Book
+        rows = Book.objects.values_list('pk', 'name', 'author', 'category_id').iterator(chunk_size=2000)
+        docs, prefix, postings = {}, [], {}
+        for pk, name, author, category_id in rows:
+            doc = self._make_doc(name, author, category_id)
+            docs[pk] = doc
+            prefix.extend(self._prefix_entries(pk, doc))
+            for tri in self._doc_trigrams(doc):
+                postings.setdefault(tri, set()).add(pk)
+        prefix.sort()
+        with self._lock:
+            self._docs, self._prefix, self._postings = docs, prefix, postings
+            self._loaded_at = time.monotonic()
+
+    def ensure_loaded(self):
+        if self.is_stale():
+            self.load()
+
+    def add_book(self, book):
+        """Insert or update a single book (called from post_save)."""
+        with self._lock:
+            if not self.loaded:
+                return
+            self._remove(book.pk)
+            doc = self._make_doc(book.name, book.author, book.category_id)
+            self._docs[book.pk] = doc
+            for entry in self._prefix_entries(book.pk, doc):
+                insort(self._prefix, entry)
+            for tri in self._doc_trigrams(doc):
+                self._postings.setdefault(tri, set()).add(book.pk)
+
+    def remove_book(self, book_id):
+        """Drop a book from the index (called from post_delete)."""
+        with self._lock:
+            if self.loaded:
+                self._remove(book_id)
+
+    def _remove(self, pk):
+        doc = self._docs.pop(pk, None)
+        if doc is None:
+            return
+        for entry in self._prefix_entries(pk, doc):
+            i = bisect_left(self._prefix, entry)
+            if i < len(self._prefix) and self._prefix[i] == entry:
+                del self._prefix[i]
+        for tri in self._doc_trigrams(doc):
+            pks = self._postings.get(tri)
+            if pks is not None:
+                pks.discard(pk)
+                if not pks:
+                    del self._postings[tri]
+
+    @staticmethod
+    def _make_doc(name, author, category_id):
+        return (name or '', author or '', category_id, normalize(name), normalize(author))
+
+    @staticmethod
+    def _prefix_entries(pk, doc):
+        name_norm, author_norm = doc[3], doc[4]
+        entries = [(name_norm, _NAME, pk)]
+        entries.extend((suffix, _NAME_WORD, pk) for suffix in _word_suffixes(name_norm))
+        if author_norm:
+            entries.append((author_norm, _AUTHOR, pk))
+            entries.extend((suffix, _AUTHOR_WORD, pk) for suffix in _word_suffixes(author_norm))
+        return entries
+
+    @staticmethod
+    def _doc_trigrams(doc):
+        return trigrams(doc[3]) | trigrams(doc[4])
+
+    # -- querying ----------------------------------------------------------
+
+    def search(self, query, category_id=None):
+        """Return matching books as a list of ``(tier, name_norm, pk)``, best first.
+
+        Matching covers title/author prefixes, word prefixes, substrings (3+
+        characters) and, for queries of 3+ characters, fuzzy trigram matches
+        so that small typos ("hary poter") still find the book.
+        """
+        q = normalize(query)
+        if not q:
+            return []
+        self.ensure_loaded()
+        with self._lock:
+            best = {}
+
+            def hit(pk, tier):
+                if category_id is not None and self._docs[pk][2] != category_id:
+                    return
+                if tier < best.get(pk, TIER_FUZZY + 1):
+                    best[pk] = tier
+
+            # 1. prefix array: title/author (or one of their words) starts with q
+            i = bisect_left(self._prefix, (q,))
+            while i < len(self._prefix) and self._prefix[i][0].startswith(q):
+                _, field, pk = self._prefix[i]
+                hit(pk, _PREFIX_TIERS[field])
+                i += 1
+
+            if len(q) >= 3:
+                # 2. substring: intersect the postings of every trigram of q, then verify
+                query_tris = trigrams(q, pad=False)
+                postings = [self._postings.get(tri, ()) for tri in query_tris]
+                if all(postings):
+                    for pk in set.intersection(*map(set, postings)):
+                        doc = self._docs[pk]
+                        if q in doc[3]:
+                            hit(pk, TIER_NAME_SUBSTRING)
+                        elif q in doc[4]:
+                            hit(pk, TIER_AUTHOR_SUBSTRING)
+
+                # 3. fuzzy: share of the (left-padded) query trigrams present in the doc
+                fuzzy_tris = trigrams(q)
+                fuzzy_tris.discard(q[-2:] + ' ')  # user is still typing; no right word edge
+                counts = {}
+                for tri in fuzzy_tris:
+                    for pk in self._postings.get(tri, ()):
+                        counts[pk] = counts.get(pk, 0) + 1
+                needed = AUTOCOMPLETE_FUZZY_THRESHOLD * len(fuzzy_tris)
+                for pk, common in counts.items():
+                    if common >= needed:
+                        hit(pk, TIER_FUZZY)
+
+            results = [(tier, self._docs[pk][3], pk) for pk, tier in best.items()]
+        results.sort()
+        return results
+
+
+# The per-process index used by the views.
+index = AutocompleteIndex()
+
+
+def warm_up():
+    """Load the index eagerly (e.g. at WSGI startup) so the first keystroke is fast."""
+    try:
+        index.load()
+    except Exception:
+        # Database not migrated/available yet; the index will load on first use.
+        pass
@@ -0,0 +1,193 @@
+"""Cache backend shared by all worker processes on one host.
+
+LocMemCache is per process, so under several WSGI workers each one keeps
+its own copy of cached data and its own catalog version counter
+(lib/catalog_cache.py). SQLiteCache keeps entries in one SQLite file in WAL
+mode instead: readers never block each other or the single writer, so every
+worker sees the same data without running a cache server.
+
+    CACHES = {'default': {
+        'BACKEND': 'lib.cache_backends.SQLiteCache',
+        'LOCATION': '/path/to/cache.sqlite3',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 5000, 'CULL_FREQUENCY': 3},
+    }}
+
+* TTLs: each row stores an absolute expiry time; expired rows are ignored on
+  read and removed when the cache is culled.
+* LRU eviction: reads refresh a row's ``accessed`` time (at most once per
+  ACCESS_RESOLUTION seconds per row, so hot keys do not turn every read into
+  a write). Once MAX_ENTRIES is exceeded, expired rows and then the least
+  recently used 1/CULL_FREQUENCY of the entries are deleted. The size is
+  checked every CULL_INTERVAL writes per process, so the table can overshoot
+  MAX_ENTRIES by that much per worker.
+* Integers are stored as SQLite integers, so ``incr``/``decr`` is a single
+  ``UPDATE ... SET value = value + ?`` and is atomic across processes.
+  Everything else is pickled.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB,
+    expires REAL,
+    accessed REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_accessed_idx ON cache (accessed);
+"""
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get('OPTIONS', {})
+        self._access_resolution = float(options.get('ACCESS_RESOLUTION', 1.0))
+        self._cull_interval = int(options.get('CULL_INTERVAL', 100))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5.0))
+        self._local = threading.local()
+        self._writes = 0
+
+    # connection and encoding
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        # a connection must not be shared with a forked worker
+        if conn is None or self._local.pid != os.getpid():
+            # autocommit: every statement is its own transaction, so no lock is held between calls
+            conn = sqlite3.connect(self._path, timeout=self._busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')  # a cache can lose the last writes on power loss
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _encode(self, value):
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    @staticmethod
+    def _decode(value):
+        return value if isinstance(value, int) else pickle.loads(value)
+
+    def _live(self, key, now):
+        """Value of a non-expired row (None if missing or expired), refreshing its LRU time."""
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires, accessed = row
+        if expires is not None and expires <= now:
+            return None
+        if now - accessed >= self._access_resolution:
+            conn.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return row
+
+    def _after_write(self):
+        self._writes += 1
+        if self._writes >= self._cull_interval:
+            self._writes = 0
+            self._cull()
+
+    def _cull(self):
+        conn = self._conn()
+        now = time.time()
+        conn.execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?', (now,))
+        count = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            if self._cull_frequency == 0:
+                conn.execute('DELETE FROM cache')
+            else:
+                conn.execute(
+                    'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                    (count // self._cull_frequency,),
+                )
+
+    # cache API
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._live(key, time.time())
+        return default if row is None else self._decode(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        self._conn().execute(
+            'INSERT INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires, '
+            'accessed = excluded.accessed',
+            (key, self._encode(value), self.get_backend_timeout(timeout), now),
+        )
+        self._after_write()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        # insert, or take over the row only if it has expired
+        cursor = self._conn().execute(
+            'INSERT INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires, '
+            'accessed = excluded.accessed WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (key, self._encode(value), self.get_backend_timeout(timeout), now, now),
+        )
+        added = cursor.rowcount == 1
+        if added:
+            self._after_write()
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        cursor = self._conn().execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        rows = self._conn().execute(
+            "UPDATE cache SET value = value + ?, accessed = ? "
+            "WHERE key = ? AND typeof(value) = 'integer' AND (expires IS NULL OR expires > ?) "
+            "RETURNING value",
+            (delta, now, key, now),
+        ).fetchall()  # fetch everything so the statement (and its write lock) is finished
+        if rows:
+            return rows[0][0]
+        row = self._live(key, now)
+        if row is None:
+            raise ValueError(f"Key '{key}' not found")
+        # a pickled number (e.g. a float): not atomic, like the database cache
+        new_value = self._decode(row[0]) + delta
+        self._conn().execute('UPDATE cache SET value = ? WHERE key = ?', (self._encode(new_value), key))
+        return new_value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._conn().execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._live(key, time.time()) is not None
+
+    def clear(self):
+        self._conn().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # connections are kept per thread for the life of the worker
+        pass
@@ -0,0 +1,82 @@
+"""Versioned cache for catalog pages (home, book lists, search).
+
+Every cache key embeds the current catalog version. Any Book, Category or
+BookRating write, and every stock change, bumps the version (see
+lib/signals.py and lib/stock.py), so all cached catalog data goes stale at
+once without tracking individual keys; old entries simply expire after
+CATALOG_CACHE_TTL. Query results are cached with ``cached_catalog`` and
+rendered fragments with ``{% cache %}`` keyed on ``catalog_version``.
+
+The version lives in the default cache, so all workers must share it (a
+per-process LocMemCache only stays fresh within one process).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Category
+
+CATALOG_CACHE_TTL = getattr(settings, 'CATALOG_CACHE_TTL', 300)
+CATALOG_VERSION_KEY = 'lib:catalog_version'
+
+
+def catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Start from the clock rather than 1: if the counter is evicted, the new
+        # value is still larger than any version used before, so no old entry comes back.
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def _bump():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:  # counter missing (never set or evicted)
+        catalog_version()
+
+
+def bump_catalog_version():
+    """Invalidate all cached catalog data once the current transaction commits."""
+    transaction.on_commit(_bump)
+
+
+def viewer_role(request):
+    if request.session.get('admin_id'):
+        return 'admin'
+    if request.session.get('reader_id'):
+        return 'reader'
+    return 'anonymous'
+
+
+def catalog_key(name, *parts):
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'lib:catalog:{catalog_version()}:{name}:{digest}'
+
+
+def cached_catalog(name, parts, compute, timeout=CATALOG_CACHE_TTL):
+    """Return compute() cached under (catalog version, name, parts)."""
+    key = catalog_key(name, *parts)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
+
+
+def catalog_categories():
+    """All categories, cached with the catalog (they are listed on most catalog pages)."""
+    return cached_catalog('categories', (), lambda: list(Category.objects.all()))
+
+
+def catalog_context(request):
+    """Template context for catalog fragments: ``{% cache ttl name catalog_version viewer_role ... %}``."""
+    return {
+        'catalog_version': catalog_version(),
+        'viewer_role': viewer_role(request),
+        'catalog_cache_ttl': CATALOG_CACHE_TTL,
+    }
@@ -0,0 +1,310 @@
+"""Batch circulation operations.
+
+Approving a term's worth of issue requests one GET at a time costs around
+eight queries per request. ``bulk_approve_requests`` validates a whole
+batch with a few grouped queries and writes it in one transaction.
+"""
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .analytics import record_book_issuances
+from .catalog_cache import bump_catalog_version
+from .holds import allocate_next_hold, cancel_holds, place_hold
+from .quotas import change_counters, change_counters_many, quota_used
+from .models import Book, Issue, IssueRequest, Notification, normalize_isbn
+from .stock import release_copy, reserve_copy, return_copy
+
+# maximum number of books a reader can have at once (including pending requests)
+MAX_ISSUED_PER_READER = getattr(settings, 'MAX_ISSUED_PER_READER', 5)
+
+APPROVED, REJECTED, SKIPPED, HELD = 'approved', 'rejected', 'skipped', 'held'
+ISSUED, RETURNED, FAILED = 'issued', 'returned', 'failed'
+
+
+def loan_due_date(reader, issued_date):
+    """Staff members get ~6 months, everybody else two weeks."""
+    if getattr(reader, 'is_staff_member', False):
+        return issued_date + timedelta(days=182)
+    return issued_date + timedelta(days=14)
+
+
+def close_request(req, approved=False, rejected=False):
+    """Mark a pending IssueRequest approved or rejected and release its quota slot.
+
+    The update is conditional on the request still being pending, so a
+    double-clicked approve/reject cannot decrement the counter twice.
+    Returns False if the request had already been handled.
+    """
+    with transaction.atomic():
+        closed = IssueRequest.objects.filter(pk=req.pk, approved=False, rejected=False).update(
+            approved=approved, rejected=rejected
+        )
+        if closed:
+            change_counters(req.reader_id, pending=-1)
+    req.approved, req.rejected = req.approved or approved, req.rejected or rejected
+    return bool(closed)
+
+
+def _take_copies(book_id, wanted):
+    """Reserve `wanted` copies of a book; returns how many were actually taken.
+
+    Tries a single conditional update for the whole lot and, if stock is short,
+    falls back to reserving one copy at a time.
+    """
+    if Book.objects.filter(pk=book_id, number_in_stock__gte=wanted).update(
+        number_in_stock=F('number_in_stock') - wanted, updated_at=timezone.now()
+    ):
+        bump_catalog_version()
+        return wanted
+    taken = 0
+    while taken < wanted and reserve_copy(book_id):
+        taken += 1
+    return taken
+
+
+def _outcome(request_id, status, message, req=None):
+    result = {'request_id': request_id, 'status': status, 'message': message}
+    if req is not None:
+        result.update({'reader': req.reader.name, 'book': req.book.name})
+    return result
+
+
+def bulk_approve_requests(request_ids):
+    """Approve a batch of pending IssueRequests, applying the same rules as approve_request.
+
+    A request is rejected when the reader is over MAX_ISSUED_PER_READER or
+    already has the book issued, and put on hold when no copy is left.
+    Returns one outcome dict per requested id (in input order) with
+    ``status`` approved/rejected/held/skipped and a human readable ``message``.
+    """
+    request_ids = list(dict.fromkeys(int(pk) for pk in request_ids))
+    pending = {
+        req.pk: req for req in
+        IssueRequest.objects.filter(pk__in=request_ids, approved=False, rejected=False)
+        .select_related('reader', 'book')
+    }
+    reader_ids = {req.reader_id for req in pending.values()}
+    book_ids = {req.book_id for req in pending.values()}
+
+    # Quotas come from the Reader counters loaded with the requests; one grouped
+    # query finds the currently open (reader, book) pairs
+    open_pairs = set(
+        Issue.objects.filter(reader_id__in=reader_ids, book_id__in=book_ids, returned_date__isnull=True)
+        .values_list('reader_id', 'book_id')
+    )
+    stock = {req.book_id: req.book.number_in_stock for req in pending.values()}
+
+    outcomes = {}
+    to_approve = []
+    to_reject = []
+    to_hold = []
+    for pk in request_ids:
+        req = pending.get(pk)
+        if req is None:
+            outcomes[pk] = _outcome(pk, SKIPPED, "Request is not pending (already handled or missing).")
+            continue
+        reader, book = req.reader, req.book
+        total_count = quota_used(reader)
+        if total_count > MAX_ISSUED_PER_READER:
+            to_reject.append(req)
+            outcomes[pk] = _outcome(pk, REJECTED, (
+                f"{reader.name} already has {total_count} books/pending requests, "
+                f"which exceeds the limit of {MAX_ISSUED_PER_READER}."
+            ), req)
+        elif (req.reader_id, req.book_id) in open_pairs:
+            to_reject.append(req)
+            outcomes[pk] = _outcome(pk, REJECTED, f"{reader.name} already has '{book.name}' issued.", req)
+        elif stock[req.book_id] <= 0:
+            to_hold.append(req)
+        else:
+            stock[req.book_id] -= 1
+            open_pairs.add((req.reader_id, req.book_id))
+            to_approve.append(req)
+            outcomes[pk] = _outcome(pk, APPROVED, f"'{book.name}' issued to {reader.name}.", req)
+
+    issued_date = date.today()
+    with transaction.atomic():
+        # Take the copies per book with conditional updates; if stock moved since we read it,
+        # fall back to reserving one copy at a time for that book.
+        approved = []
+        per_book = defaultdict(list)
+        for req in to_approve:
+            per_book[req.book_id].append(req)
+        for book_id, reqs in per_book.items():
+            taken = _take_copies(book_id, len(reqs))
+            approved.extend(reqs[:taken])
+            to_hold.extend(reqs[taken:])
+
+        issues = Issue.objects.bulk_create([
+            Issue(reader=req.reader, book=req.book, issued_date=issued_date,
+                  due_date=loan_due_date(req.reader, issued_date))
+            for req in approved
+        ])
+        Notification.objects.bulk_create([
+            Notification(
+                reader=issue.reader,
+                issue=issue,
+                notification_type='issued',
+                title=f"Book Issued: {issue.book.name}",
+                message=f"You have been issued '{issue.book.name}' by {issue.book.author}. Due date: {issue.due_date}"
+            )
+            for issue in issues
+        ])
+        IssueRequest.objects.filter(pk__in=[req.pk for req in approved]).update(approved=True)
+        IssueRequest.objects.filter(pk__in=[req.pk for req in to_reject]).update(rejected=True)
+        change_counters_many(
+            loans=Counter(req.reader_id for req in approved),
+            pending={reader_id: -n for reader_id, n in Counter(req.reader_id for req in approved + to_reject).items()},
+        )
+        record_book_issuances(Counter((issue.book_id, issued_date) for issue in issues))
+
+        for req in to_hold:
+            _, position = place_hold(req)
+            outcomes[req.pk] = _outcome(req.pk, HELD, (
+                f"No copies of '{req.book.name}' are available; {req.reader.name} is number {position} in the hold queue."
+            ), req)
+
+    return [outcomes[pk] for pk in request_ids]
+
+
+def bulk_reject_requests(request_ids):
+    """Reject a batch of pending IssueRequests and notify the readers."""
+    request_ids = list(dict.fromkeys(int(pk) for pk in request_ids))
+    pending = {
+        req.pk: req for req in
+        IssueRequest.objects.filter(pk__in=request_ids, approved=False, rejected=False)
+        .select_related('reader', 'book')
+    }
+    with transaction.atomic():
+        IssueRequest.objects.filter(pk__in=pending.keys()).update(rejected=True)
+        change_counters_many(pending={
+            reader_id: -n for reader_id, n in Counter(req.reader_id for req in pending.values()).items()
+        })
+        cancel_holds(pending.keys())
+        Notification.objects.bulk_create([
+            Notification(
+                reader=req.reader,
+                issue=None,
+                notification_type='request_rejected',
+                title=f"Request Rejected: {req.book.name}",
+                message=f"Your request to issue '{req.book.name}' was rejected by the library administrator."
+            )
+            for req in pending.values()
+        ])
+    return [
+        _outcome(pk, REJECTED, "Request rejected.", pending[pk]) if pk in pending
+        else _outcome(pk, SKIPPED, "Request is not pending (already handled or missing).")
+        for pk in request_ids
+    ]
+
+
+def _scan_outcome(isbn, status, message, book=None):
+    result = {'isbn': isbn, 'status': status, 'message': message}
+    if book is not None:
+        result['book'] = book.name
+    return result
+
+
+def checkout_batch(reader, isbns, issued_date=None):
+    """Issue every scanned ISBN to `reader` with the same rules as issue_book.
+
+    Books are resolved with one ``isbn__in`` query, open loans with another,
+    and all copies/issues are written in one transaction. An ISBN fails (without
+    affecting the rest of the batch) when it is unknown, already issued to the
+    reader, scanned twice, or out of stock. Returns one outcome per scan.
+    """
+    issued_date = issued_date or date.today()
+    due_date = loan_due_date(reader, issued_date)
+    scans = [normalize_isbn(isbn) for isbn in isbns]
+    books = {book.isbn: book for book in Book.objects.filter(isbn__in=set(scans))}
+    open_books = set(
+        Issue.objects.filter(reader=reader, book__in=books.values(), returned_date__isnull=True)
+        .values_list('book_id', flat=True)
+    )
+
+    outcomes = [None] * len(scans)
+    wanted = {}  # book_id -> scan position
+    for i, isbn in enumerate(scans):
+        book = books.get(isbn)
+        if book is None:
+            outcomes[i] = _scan_outcome(isbn, FAILED, "No book with this ISBN.")
+        elif book.pk in wanted:
+            outcomes[i] = _scan_outcome(isbn, FAILED, "Scanned twice in this batch.", book)
+        elif book.pk in open_books:
+            outcomes[i] = _scan_outcome(isbn, FAILED, f"{reader.name} already has '{book.name}' issued.", book)
+        else:
+            wanted[book.pk] = i
+
+    with transaction.atomic():
+        issues = []
+        for book_id, i in wanted.items():
+            book = books[scans[i]]
+            if _take_copies(book_id, 1):
+                issues.append(Issue(reader=reader, book=book, issued_date=issued_date, due_date=due_date))
+                outcomes[i] = _scan_outcome(scans[i], ISSUED, f"'{book.name}' issued to {reader.name}.", book)
+            else:
+                outcomes[i] = _scan_outcome(scans[i], FAILED, f"'{book.name}' is out of stock!", book)
+        Issue.objects.bulk_create(issues)
+        change_counters(reader.pk, loans=len(issues))
+        record_book_issuances(Counter((issue.book_id, issued_date) for issue in issues))
+    return outcomes
+
+
+def return_batch(reader, isbns, returned_date=None):
+    """Close `reader`'s open loans for every scanned ISBN and restock the copies.
+
+    The loans are found with one query and closed with one conditional
+    update; if another desk returned one of them in the meantime, the batch
+    falls back to return_copy per loan so no copy is restocked twice.
+    Each returned copy is then offered to the book's hold queue.
+    """
+    returned_date = returned_date or date.today()
+    scans = [normalize_isbn(isbn) for isbn in isbns]
+    open_issues = {
+        issue.book.isbn: issue for issue in
+        Issue.objects.filter(reader=reader, book__isbn__in=set(scans), returned_date__isnull=True)
+        .select_related('book')
+    }
+
+    outcomes = []
+    to_close = []
+    seen = set()
+    for isbn in scans:
+        issue = open_issues.pop(isbn, None)
+        if issue is None and isbn in seen:
+            outcomes.append(_scan_outcome(isbn, FAILED, "Scanned twice in this batch."))
+        elif issue is None:
+            outcomes.append(_scan_outcome(isbn, FAILED, f"{reader.name} has no open loan for this ISBN."))
+        else:
+            to_close.append(issue)
+            seen.add(isbn)
+            outcomes.append(_scan_outcome(isbn, RETURNED, f"'{issue.book.name}' returned.", issue.book))
+
+    with transaction.atomic():
+        closed = Issue.objects.filter(
+            pk__in=[issue.pk for issue in to_close], returned_date__isnull=True
+        ).update(returned_date=returned_date)
+        if closed == len(to_close):
+            for book_id in {issue.book_id for issue in to_close}:
+                release_copy(book_id)
+            change_counters(reader.pk, loans=-closed)
+        else:
+            transaction.set_rollback(True)
+    if closed == len(to_close):
+        returned = {issue.pk for issue in to_close}
+    else:
+        returned = {issue.pk for issue in to_close if return_copy(issue, returned_date)}
+        for outcome, issue in zip([o for o in outcomes if o['status'] == RETURNED], to_close):
+            if issue.pk not in returned:
+                outcome.update(status=FAILED, message=f"'{issue.book.name}' was already returned.")
+
+    # returned copies go to readers waiting on a hold first
+    for issue in to_close:
+        if issue.pk in returned:
+            allocate_next_hold(issue.book_id)
+    return outcomes
@@ -0,0 +1,74 @@
+"""Conditional GET (ETag / Last-Modified) for the book detail and analytics pages.
+
+The validators come from one indexed lookup of ``Book.updated_at`` (set on
+every edit, stock change and rating change) and
+``Book.analytics_updated_at`` (set by every analytics write, see
+lib/analytics.py). A client that already has the current page gets a 304
+before the view runs its analytics and popular-books queries, so polling
+chart widgets cost a single query.
+
+Analytics windows end today, so today's date is part of every validator.
+book_details also shows the "Most Popular" sidebar, so its ETag includes the
+popularity pool's version (lib/popularity.py); book_description does not, so
+revalidating it never recomputes the pool. book_details renders a different
+page per viewer, so its ETag includes the viewer and it sends no
+Last-Modified (a date alone cannot tell an anonymous copy from a reader's).
+"""
+import hashlib
+from datetime import date, datetime, time
+
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .catalog_cache import viewer_role
+from .models import Book
+from .popularity import pool_version
+
+
+def book_versions(request, pk):
+    """(updated_at, analytics_updated_at) of the book, or None if it does not exist.
+
+    Memoized on the request so the ETag and Last-Modified functions share one query.
+    """
+    memo = request.__dict__.setdefault('_book_versions', {})
+    if pk not in memo:
+        memo[pk] = Book.objects.filter(pk=pk).values_list('updated_at', 'analytics_updated_at').first()
+    return memo[pk]
+
+
+def _etag(request, pk, *parts):
+    versions = book_versions(request, pk)
+    if versions is None:
+        return None  # let the view answer 404
+    raw = repr((pk, *versions, date.today(), *parts))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def _pool_version(request):
+    if not hasattr(request, '_pool_version'):
+        request._pool_version = pool_version()
+    return request._pool_version
+
+
+def _last_modified(request, pk, *extra):
+    versions = book_versions(request, pk)
+    if versions is None:
+        return None
+    midnight = timezone.make_aware(datetime.combine(date.today(), time.min))
+    return max(v for v in (*versions, *extra, midnight) if v is not None)
+
+
+def book_page_etag(request, pk):
+    viewer = request.session.get('admin_id') or request.session.get('reader_id')
+    return _etag(request, pk, request.path, viewer_role(request), viewer, _pool_version(request))
+
+
+def book_data_etag(request, pk):
+    return _etag(request, pk, request.get_full_path())
+
+
+# book_details: per-viewer ETag only
+book_page_condition = condition(etag_func=book_page_etag)
+# book_description and book_analytics_api look the same for everyone
+book_data_condition = condition(etag_func=book_data_etag, last_modified_func=_last_modified)
+book_description_condition = book_data_condition
@@ -0,0 +1,83 @@
+"""Overdue fine accrual.
+
+``accrue_fines`` brings every unpaid fine for an open, overdue Issue up to
+date in a handful of set-based statements. It is meant to run nightly via
+``python manage.py accrue_fines``; views only read from Fine.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateField, DecimalField, ExpressionWrapper, Func, IntegerField, OuterRef, Subquery, Value
+from django.utils import timezone
+
+from .models import Fine, Issue
+
+# Fine charged per overdue day
+FINE_PER_DAY = Decimal(str(getattr(settings, 'FINE_PER_DAY', 2)))
+
+
+class DaysBetween(Func):
+    """Whole days from the first date expression to the second (``end - start``)."""
+    output_field = IntegerField()
+    arity = 2
+
+    def __init__(self, start, end, **extra):
+        # SQL is generated as "end - start"
+        super().__init__(end, start, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL: date - date is an integer number of days
+        return super().as_sql(compiler, connection, template='(%(expressions)s)', arg_joiner=' - ', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(',
+            **extra_context
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='DATEDIFF', **extra_context)
+
+
+def accrue_fines(today=None, rate=FINE_PER_DAY, batch_size=1000):
+    """Create missing fines and grow unpaid ones for open overdue issues.
+
+    Returns ``(created, updated)``: fines inserted by this run, and existing
+    fines recomputed. Fines of returned or paid issues are left untouched, so
+    their amount is frozen at the last accrual.
+    """
+    today = today or timezone.now().date()
+    rate = Decimal(str(rate))
+    overdue = Issue.objects.filter(returned_date__isnull=True, due_date__lt=today)
+
+    with transaction.atomic():
+        # 1. recompute every unpaid fine of an open overdue issue in one UPDATE (before the
+        #    inserts, so `updated` counts only fines that existed before this run)
+        amount = overdue.filter(pk=OuterRef('issue_id')).annotate(
+            accrued=ExpressionWrapper(
+                DaysBetween('due_date', Value(today, output_field=DateField())) * Value(rate),
+                output_field=DecimalField(max_digits=8, decimal_places=2),
+            )
+        ).values('accrued')[:1]
+        updated = Fine.objects.filter(
+            paid=False,
+            issue__returned_date__isnull=True,
+            issue__due_date__lt=today,
+        ).update(amount=Subquery(amount), calculated_date=today)
+
+        # 2. insert fines for overdue issues that don't have one yet
+        created = 0
+        batch = []
+        missing = overdue.filter(fine__isnull=True).values_list('pk', 'due_date')
+        for issue_id, due_date in missing.iterator(chunk_size=batch_size):
+            batch.append(Fine(issue_id=issue_id, amount=(today - due_date).days * rate))
+            if len(batch) >= batch_size:
+                Fine.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        Fine.objects.bulk_create(batch)
+        created += len(batch)
+
+    return created, updated
@@ -1,6 +1,6 @@
 from django.shortcuts import render
 from django import forms
-from .models import Book, Reader, Issue,Admin
+from .models import Book, Reader, Issue,Admin, normalize_isbn
 
 class BookForm(forms.ModelForm):
     class Meta:
@@ -17,6 +17,10 @@ class BookForm(forms.ModelForm):
             })
         }
 
+    def clean_isbn(self):
+        # normalized before the unique check, so '0-441-01359-7' clashes with '0441013597'
+        return normalize_isbn(self.cleaned_data['isbn'])
+
 # def view_books(request):
 #     books = Book.objects.all()  # fetch all books
 #     return render(request, 'view_books.html', {'books': books})
@@ -0,0 +1,125 @@
+"""FIFO hold queue for out-of-stock books.
+
+When a request cannot be approved because no copy is left, the request stays
+pending and a Hold is queued for the book instead of rejecting it. Every
+return (and every stock increase in edit_book) calls ``allocate_next_hold``,
+which issues the copy to the oldest eligible waiting reader (one indexed
+lookup for the head of the queue) and notifies them, so readers no longer
+have to keep re-requesting popular titles.
+"""
+from datetime import date
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .analytics import record_book_issuance
+from .models import Hold, Issue, Notification
+from .quotas import quota_used
+from .stock import OutOfStock, issue_copy
+
+
+def place_hold(req):
+    """Queue `req` (a pending IssueRequest) for its book. Returns (hold, position in queue)."""
+    hold, created = Hold.objects.get_or_create(request=req, defaults={'book': req.book, 'reader': req.reader})
+    position = queue_position(hold)
+    if created:
+        Notification.objects.create(
+            reader=req.reader,
+            issue=None,
+            notification_type='hold_placed',
+            title=f"On Hold: {req.book.name}",
+            message=(
+                f"'{req.book.name}' is out of stock. You are number {position} in the queue and "
+                f"the next returned copy will be issued to you automatically."
+            ),
+        )
+    return hold, position
+
+
+def queue_position(hold):
+    """1-based position of a waiting hold in its book's queue."""
+    ahead = Q(created_at__lt=hold.created_at) | Q(created_at=hold.created_at, id__lte=hold.id)
+    return Hold.objects.filter(ahead, book_id=hold.book_id, status=Hold.WAITING).count()
+
+
+def cancel_holds(request_ids):
+    """Cancel the waiting holds of the given IssueRequests (e.g. when they are rejected)."""
+    return Hold.objects.filter(request_id__in=request_ids, status=Hold.WAITING).update(
+        status=Hold.CANCELLED, resolved_at=timezone.now()
+    )
+
+
+def _drop_hold(hold, reason):
+    """Cancel a claimed hold, reject its request and tell the reader why."""
+    from .circulation import close_request
+
+    Hold.objects.filter(pk=hold.pk).update(status=Hold.CANCELLED)
+    if hold.request is not None:
+        close_request(hold.request, rejected=True)
+    Notification.objects.create(
+        reader=hold.reader,
+        issue=None,
+        notification_type='hold_cancelled',
+        title=f"Hold Cancelled: {hold.book.name}",
+        message=f"Your hold on '{hold.book.name}' was cancelled: {reason}",
+    )
+
+
+def allocate_next_hold(book_id):
+    """Issue a copy of the book to the first eligible waiting reader.
+
+    Call after a copy has been put back into stock. Holds whose reader is
+    over MAX_ISSUED_PER_READER or already has the book out are cancelled
+    (the reader is notified) and skipped. Returns the new Issue, or None when
+    nobody is waiting or no copy is left.
+    """
+    from .circulation import MAX_ISSUED_PER_READER, close_request, loan_due_date
+
+    while True:
+        with transaction.atomic():
+            hold = (
+                Hold.objects.filter(book_id=book_id, status=Hold.WAITING)
+                .select_related('reader', 'book', 'request')
+                .order_by('created_at', 'id')
+                .first()
+            )
+            if hold is None:
+                return None
+            # claim the hold first so two returns at once cannot both serve it
+            claimed = Hold.objects.filter(pk=hold.pk, status=Hold.WAITING).update(
+                status=Hold.FULFILLED, resolved_at=timezone.now()
+            )
+            if not claimed:
+                continue
+
+            reader, book = hold.reader, hold.book
+            # same rule as approve_request: the held request is already counted as pending
+            if quota_used(reader) > MAX_ISSUED_PER_READER:
+                _drop_hold(hold, f"you have reached the limit of {MAX_ISSUED_PER_READER} books and pending requests.")
+                continue
+            issued_date = date.today()
+            try:
+                issue = issue_copy(Issue(reader=reader, book=book, issued_date=issued_date,
+                                         due_date=loan_due_date(reader, issued_date)))
+            except OutOfStock:
+                # the copy went elsewhere; leave the hold at the head of the queue
+                transaction.set_rollback(True)
+                return None
+            except IntegrityError:
+                # the reader already has this book out (lib_issue_one_open_loan); skip the hold
+                _drop_hold(hold, "you already have this book issued.")
+                continue
+
+            Hold.objects.filter(pk=hold.pk).update(issue=issue)
+            if hold.request is not None:
+                close_request(hold.request, approved=True)
+            Notification.objects.create(
+                reader=reader,
+                issue=issue,
+                notification_type='hold_allocated',
+                title=f"Hold Ready: {book.name}",
+                message=f"A copy of '{book.name}' you were waiting for has been issued to you. Due date: {issue.due_date}",
+            )
+        record_book_issuance(book, issued_date=issued_date)
+        return issue
@@ -0,0 +1,30 @@
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lib.fines import FINE_PER_DAY, accrue_fines
+
+
+class Command(BaseCommand):
+    help = "Create and update fines for all open overdue issues (run nightly, e.g. via cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', default=str(FINE_PER_DAY),
+                            help=f'Fine per overdue day (default {FINE_PER_DAY}, settings.FINE_PER_DAY).')
+        parser.add_argument('--date', help='Accrue as of this date (YYYY-MM-DD). Default: today.')
+
+    def handle(self, *args, **options):
+        try:
+            rate = Decimal(options['rate'])
+        except InvalidOperation:
+            raise CommandError(f"Invalid rate '{options['rate']}'.")
+        if not rate.is_finite() or rate < 0:
+            raise CommandError(f"Invalid rate '{options['rate']}', expected a number >= 0.")
+        try:
+            today = date.fromisoformat(options['date']) if options['date'] else None
+        except ValueError:
+            raise CommandError(f"Invalid date '{options['date']}', expected YYYY-MM-DD.")
+
+        created, updated = accrue_fines(today=today, rate=rate)
+        self.stdout.write(self.style.SUCCESS(f"Fines accrued: {created} created, {updated} updated."))
@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from django.core.management.commands.createcachetable import Command as CreateCacheTable
+from django.db import connections
+from django.test import override_settings
+
+from lib.cache_backends import SQLiteCache
+
+BENCH_DB = 'cache_benchmark'
+BENCH_TABLE = 'lib_cache_benchmark'
+
+
+class _BenchRouter:
+    """Send the database cache's queries to the scratch database."""
+
+    def db_for_read(self, model, **hints):
+        return BENCH_DB if model._meta.app_label == 'django_cache' else None
+
+    db_for_write = db_for_read
+
+
+def _incr_worker(path, key, n):
+    cache = SQLiteCache(path, {})
+    for _ in range(n):
+        cache.incr(key)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time get/set/incr on the shared SQLite cache against LocMemCache and the database cache, "
+        "and check that incr is atomic across processes. The database cache uses a "
+        "temporary SQLite database, so the project database is not touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ops', type=int, default=2000, help='Operations per measurement (default 2000).')
+        parser.add_argument('--processes', type=int, default=4,
+                            help='Worker processes for the cross-process incr check (default 4).')
+
+    def handle(self, *args, **options):
+        ops = options['ops']
+        workdir = tempfile.mkdtemp(prefix='lib-cache-bench-')
+        path = os.path.join(workdir, 'cache.sqlite3')
+        connections.settings[BENCH_DB] = {
+            **connections.settings['default'],
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(workdir, 'dbcache.sqlite3'),
+            'OPTIONS': {},
+        }
+        try:
+            with override_settings(DATABASE_ROUTERS=[_BenchRouter()]):
+                self._run(path, ops, options['processes'])
+        finally:
+            connections[BENCH_DB].close()
+            del connections[BENCH_DB]
+            del connections.settings[BENCH_DB]
+            for name in os.listdir(workdir):
+                os.remove(os.path.join(workdir, name))
+            os.rmdir(workdir)
+
+    def _run(self, path, ops, processes):
+        creator = CreateCacheTable()
+        creator.verbosity = 0
+        creator.create_table(BENCH_DB, BENCH_TABLE, False)
+        backends = [
+            ('locmem', LocMemCache('lib-cache-bench', {'OPTIONS': {'MAX_ENTRIES': ops * 2}})),
+            ('database', DatabaseCache(BENCH_TABLE, {'OPTIONS': {'MAX_ENTRIES': ops * 2}})),
+            ('sqlite-wal', SQLiteCache(path, {'OPTIONS': {'MAX_ENTRIES': ops * 2}})),
+        ]
+        self.stdout.write(f"{'backend':<12}{'set':>10}{'get hit':>10}{'get miss':>10}{'incr':>10}   (us/op)")
+        for name, cache in backends:
+            cache.clear()
+            timings = self._measure(cache, ops)
+            self.stdout.write(f"{name:<12}" + ''.join(f"{t:>10.1f}" for t in timings))
+        self._check_shared_incr(path, processes, ops)
+
+    def _measure(self, cache, ops):
+        value = {'name': 'Dune', 'author': 'Frank Herbert', 'stock': 3, 'tags': ['sf'] * 10}
+
+        def timed(fn):
+            start = time.perf_counter()
+            for i in range(ops):
+                fn(i)
+            return (time.perf_counter() - start) / ops * 1e6
+
+        cache.set('counter', 0, None)
+        return [
+            timed(lambda i: cache.set(f'book:{i}', value)),
+            timed(lambda i: cache.get(f'book:{i}')),
+            timed(lambda i: cache.get(f'missing:{i}')),
+            timed(lambda i: cache.incr('counter')),
+        ]
+
+    def _check_shared_incr(self, path, processes, ops):
+        cache = SQLiteCache(path, {})
+        cache.set('shared-counter', 0, None)
+        per_process = max(ops // processes, 1)
+        ctx = multiprocessing.get_context('spawn')
+        workers = [ctx.Process(target=_incr_worker, args=(path, 'shared-counter', per_process))
+                   for _ in range(processes)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        expected = processes * per_process
+        got = cache.get('shared-counter')
+        message = (f"{processes} processes x {per_process} incr on one sqlite-wal counter: "
+                   f"{got}/{expected} in {elapsed:.2f}s")
+        if got == expected:
+            self.stdout.write(self.style.SUCCESS(message))
+        else:
+            self.stdout.write(self.style.ERROR(message + " (lost increments)"))
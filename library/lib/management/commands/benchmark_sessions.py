@@ -0,0 +1,78 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from lib.middleware import track_queries
+
+WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def _session_view(request):
+    """What the views do with the session: log in, read the principal id, log out."""
+    if request.path == '/login/':
+        request.session['reader_id'] = 1
+        request.session['is_staff_member'] = False
+    elif request.path == '/logout/':
+        request.session.pop('reader_id', None)
+        request.session.pop('is_staff_member', None)
+    else:
+        request.session.get('reader_id')
+    return HttpResponse('ok')
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay login / page views / logout through SessionMiddleware for every profile in "
+        "settings.SESSION_PROFILES and report request latency and django_session reads and writes. "
+        "Sessions created in the default database are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--visitors', type=int, default=200, help='Simulated visitors (default 200).')
+        parser.add_argument('--pages', type=int, default=10, help='Page views per visitor while logged in (default 10).')
+
+    def handle(self, *args, **options):
+        visitors, pages = options['visitors'], options['pages']
+        self.stdout.write(f"{visitors} visitors x (login, {pages} pages, logout); current profile: {settings.SESSION_PROFILE}")
+        self.stdout.write(f"{'profile':<12}{'us/request':>12}{'db reads':>10}{'db writes':>11}{'writes/visitor':>16}")
+        for profile, engine in settings.SESSION_PROFILES.items():
+            with override_settings(SESSION_ENGINE=engine):
+                per_request, reads, writes, keys = self._replay(visitors, pages)
+            Session.objects.filter(session_key__in=keys).delete()
+            if profile == 'cached_db':
+                cache = caches[settings.SESSION_CACHE_ALIAS]
+                cache.delete_many([f'django.contrib.sessions.cached_db{key}' for key in keys])
+            self.stdout.write(f"{profile:<12}{per_request:>12.1f}{reads:>10}{writes:>11}{writes / visitors:>16.2f}")
+        self.stdout.write(self.style.SUCCESS("Session benchmark finished."))
+
+    def _replay(self, visitors, pages):
+        factory = RequestFactory()
+        middleware = SessionMiddleware(_session_view)
+        name = settings.SESSION_COOKIE_NAME
+        keys = set()
+        requests = 0
+        with track_queries() as stats:
+            start = time.perf_counter()
+            for _ in range(visitors):
+                cookie = None
+                for path in ['/login/'] + ['/page/'] * pages + ['/logout/']:
+                    request = factory.get(path)
+                    if cookie:
+                        request.COOKIES[name] = cookie
+                    response = middleware(request)
+                    requests += 1
+                    if name in response.cookies:
+                        cookie = response.cookies[name].value or None
+                    if cookie and len(cookie) <= 40:  # server-side session key, not a signed cookie
+                        keys.add(cookie)
+            elapsed = time.perf_counter() - start
+        session_queries = {shape: n for shape, n in stats.shapes.items() if 'django_session' in shape}
+        writes = sum(n for shape, n in session_queries.items() if shape.lstrip().upper().startswith(WRITE_PREFIXES))
+        reads = sum(session_queries.values()) - writes
+        return elapsed / requests * 1e6, reads, writes, keys
@@ -0,0 +1,37 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lib.analytics import rebuild_issuance_records
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild BookIssuanceRecord and the weekly/monthly rollups from Issue history. "
+        "Existing daily records in the selected range are replaced, one month per transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First issued_date to rebuild (YYYY-MM-DD). Default: beginning of history.')
+        parser.add_argument('--until', help='Last issued_date to rebuild (YYYY-MM-DD). Default: today.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows fetched and inserted per batch (default 1000).')
+
+    def handle(self, *args, **options):
+        since = _parse_date(options['since']) if options['since'] else None
+        until = _parse_date(options['until']) if options['until'] else None
+        if since and until and since > until:
+            raise CommandError("--since must not be after --until.")
+
+        written = rebuild_issuance_records(since=since, until=until, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {written} daily issuance records"
+            f" ({since or 'beginning'} to {until or 'today'})."
+        ))
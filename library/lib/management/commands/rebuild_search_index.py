@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from lib.search import rebuild_index, fts_available
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index (lib_book_fts) from the Book table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of books inserted per executemany batch (default 1000).')
+
+    def handle(self, *args, **options):
+        total = rebuild_index(batch_size=options['batch_size'])
+        if not fts_available():
+            self.stdout.write(self.style.WARNING(
+                "Full-text search is only supported on SQLite with FTS5; nothing was indexed."
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} books into the search index."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from lib.catalog_cache import bump_catalog_version
+from lib.ratings import recompute_rating_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute Book.reader_rating_sum/count/avg from BookRating in one bulk update."
+
+    def handle(self, *args, **options):
+        updated = recompute_rating_stats()
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Recomputed reader rating stats for {updated} books."))
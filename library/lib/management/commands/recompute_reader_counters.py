@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from lib.quotas import recompute_reader_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute Reader.active_loans/pending_requests from Issue and IssueRequest in one bulk update."
+
+    def handle(self, *args, **options):
+        updated = recompute_reader_counters()
+        self.stdout.write(self.style.SUCCESS(f"Recomputed loan counters for {updated} readers."))
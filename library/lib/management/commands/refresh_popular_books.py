@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from lib.popularity import refresh_pool
+
+
+class Command(BaseCommand):
+    help = "Recompute the popular-books pool shown on book detail pages (run periodically, e.g. from cron)."
+
+    def handle(self, *args, **options):
+        pool = refresh_pool()
+        self.stdout.write(self.style.SUCCESS(f"Popular books pool refreshed with {len(pool)} books."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from lib.notifications import create_due_soon_notifications, create_overdue_notifications
+
+
+class Command(BaseCommand):
+    help = "Create due-soon and overdue notifications for open issues (schedule periodically, e.g. hourly via cron)."
+
+    def handle(self, *args, **options):
+        due_soon = create_due_soon_notifications()
+        overdue = create_overdue_notifications()
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {due_soon} due-soon and {overdue} overdue notifications."
+        ))
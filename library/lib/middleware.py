@@ -0,0 +1,218 @@
+"""Request instrumentation middleware.
+
+ServerTimingMiddleware (first in MIDDLEWARE) and ViewTimingMiddleware (last)
+split each request's latency into db, template, view and middleware time.
+The breakdown goes out as a ``Server-Timing`` header (visible in the browser
+devtools) and as one JSON log line on the ``lib.timing`` logger. Template
+time comes from lib.template_backends.TimedDjangoTemplates.
+
+QueryBudgetMiddleware counts the SQL each request runs (via
+``connection.execute_wrapper``), keyed by the resolved URL name from
+lib/urls.py. It logs one line per request to the ``lib.queries`` logger
+and flags two problems:
+
+* N+1 patterns: the same query shape (SQL with parameters stripped) run
+  QUERY_N_PLUS_ONE_THRESHOLD times or more in one request, e.g. a
+  ``SELECT ... FROM lib_book WHERE id = %s`` per row of a list.
+* Budget overruns: more queries than QUERY_BUDGETS[url_name] (or
+  QUERY_BUDGET_DEFAULT for views without an entry).
+
+Problems are logged as warnings; with QUERY_BUDGET_ENFORCE = True (tests/CI)
+they raise QueryBudgetExceeded instead.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('lib.queries')
+timing_logger = logging.getLogger('lib.timing')
+
+# The header reveals internals, so by default it is only sent in DEBUG; the log line is always written.
+SERVER_TIMING_HEADER = getattr(settings, 'SERVER_TIMING_HEADER', settings.DEBUG)
+
+QUERY_BUDGETS = getattr(settings, 'QUERY_BUDGETS', {})
+QUERY_BUDGET_DEFAULT = getattr(settings, 'QUERY_BUDGET_DEFAULT', 25)
+QUERY_N_PLUS_ONE_THRESHOLD = getattr(settings, 'QUERY_N_PLUS_ONE_THRESHOLD', 5)
+QUERY_BUDGET_ENFORCE = getattr(settings, 'QUERY_BUDGET_ENFORCE', False)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_shape(sql):
+    """SQL with literals removed and IN lists collapsed, so per-row queries compare equal."""
+    return _LITERAL.sub('?', _IN_LIST.sub('IN (...)', sql))
+
+
+class QueryStats:
+    """execute_wrapper that tallies query count, time and shapes."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[query_shape(sql)] += 1
+
+    def repeated_shapes(self, threshold=None):
+        threshold = threshold or QUERY_N_PLUS_ONE_THRESHOLD
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+    def problems(self, url_name):
+        """Human readable list of N+1 patterns and budget overruns (empty when fine)."""
+        found = [f"N+1: {n} x {shape[:200]}" for shape, n in self.repeated_shapes().items()]
+        budget = QUERY_BUDGETS.get(url_name, QUERY_BUDGET_DEFAULT)
+        if budget is not None and self.count > budget:
+            found.append(f"{self.count} queries, budget for '{url_name}' is {budget}")
+        return found
+
+
+@contextmanager
+def track_queries():
+    """Install one QueryStats on every database connection: ``with track_queries() as stats: ...``"""
+    stats = QueryStats()
+    with ExitStack() as stack:
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(stats))
+        yield stats
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with track_queries() as stats:
+            response = self.get_response(request)
+        request.query_stats = stats
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match else None
+        problems = stats.problems(url_name)
+        logger.info("%s %s url_name=%s queries=%d db_ms=%.1f",
+                    request.method, request.path, url_name, stats.count, stats.duration * 1000)
+        if problems:
+            if QUERY_BUDGET_ENFORCE:
+                raise QueryBudgetExceeded(f"{request.method} {request.path}: " + "; ".join(problems))
+            for problem in problems:
+                logger.warning("%s %s: %s", request.method, request.path, problem)
+        return response
+
+
+class RequestTiming:
+    """Per-request latency accumulators (seconds), shared through the `_current_timing` context var."""
+
+    def __init__(self, queries):
+        self.queries = queries
+        self.template = 0.0
+        self.template_db = 0.0  # queries run while rendering (lazy querysets), part of view_db too
+        self.view = 0.0
+        self.view_db = 0.0
+
+    def breakdown(self, total):
+        """Milliseconds per phase; db, tpl, view and mw do not overlap and add up to total.
+
+        tpl is rendering without the queries it triggers, view the view body
+        without its db and template time, mw the middleware without its db time.
+        """
+        render = self.template - self.template_db
+        middleware_db = self.queries.duration - self.view_db
+        return {
+            'db': self.queries.duration * 1000,
+            'tpl': max(render, 0.0) * 1000,
+            'view': max(self.view - self.view_db - render, 0.0) * 1000,
+            'mw': max(total - self.view - middleware_db, 0.0) * 1000,
+            'total': total * 1000,
+        }
+
+
+_current_timing = ContextVar('lib_request_timing', default=None)
+
+
+@contextmanager
+def template_timer():
+    """Wrap a top-level render (the instrumented template backend) to add it to the request timing."""
+    timing = _current_timing.get()
+    if timing is None:
+        yield
+        return
+    db_before = timing.queries.duration
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.template += time.perf_counter() - start
+        timing.template_db += timing.queries.duration - db_before
+
+
+class ServerTimingMiddleware:
+    """Outermost timing layer: total time, db time and the Server-Timing header / log line."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with track_queries() as stats:
+            timing = RequestTiming(stats)
+            token = _current_timing.set(timing)
+            try:
+                response = self.get_response(request)
+            finally:
+                _current_timing.reset(token)
+        total = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match else None
+        phases = timing.breakdown(total)
+        if SERVER_TIMING_HEADER:
+            response['Server-Timing'] = ', '.join(
+                f'{name};dur={ms:.1f}' + (f';desc="{stats.count} queries"' if name == 'db' else '')
+                for name, ms in phases.items()
+            )
+        timing_logger.info(json.dumps({
+            'url_name': url_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': stats.count,
+            **{f'{name}_ms': round(ms, 1) for name, ms in phases.items()},
+        }))
+        return response
+
+
+class ViewTimingMiddleware:
+    """Innermost timing layer (last in MIDDLEWARE): everything below it is the view."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = _current_timing.get()
+        if timing is None:
+            return self.get_response(request)
+        db_before = timing.queries.duration
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            timing.view += time.perf_counter() - start
+            timing.view_db += timing.queries.duration - db_before
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+CREATE_FTS_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS lib_book_fts USING fts5("
+    "name, author, isbn, category, description, "
+    "tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Book = apps.get_model('lib', 'Book')
+    schema_editor.execute(CREATE_FTS_SQL)
+    insert_sql = (
+        "INSERT INTO lib_book_fts (rowid, name, author, isbn, category, description) "
+        "VALUES (%s, %s, %s, %s, %s, %s)"
+    )
+    for book in Book.objects.select_related('category').iterator():
+        schema_editor.execute(insert_sql, (
+            book.pk,
+            book.name or '',
+            book.author or '',
+            book.isbn or '',
+            book.category.name if book.category else '',
+            book.description or '',
+        ))
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS lib_book_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0017_admin_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
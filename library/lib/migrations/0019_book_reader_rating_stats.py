@@ -0,0 +1,45 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:06
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_rating_stats(apps, schema_editor):
+    Book = apps.get_model('lib', 'Book')
+    BookRating = apps.get_model('lib', 'BookRating')
+    ratings = BookRating.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    decimal = models.DecimalField()
+    Book.objects.update(
+        reader_rating_sum=Coalesce(Subquery(ratings.annotate(s=Sum('rating')).values('s')), Value(Decimal('0')), output_field=decimal),
+        reader_rating_count=Coalesce(Subquery(ratings.annotate(c=Count('pk')).values('c')), Value(0)),
+        reader_rating_avg=Subquery(ratings.annotate(a=Avg('rating')).values('a'), output_field=decimal),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0018_book_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='reader_rating_avg',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='reader_rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='reader_rating_sum',
+            field=models.DecimalField(decimal_places=1, default=0, max_digits=10),
+        ),
+        migrations.RunPython(populate_rating_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:07
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    BookIssuanceRecord = apps.get_model('lib', 'BookIssuanceRecord')
+    BookIssuanceWeekly = apps.get_model('lib', 'BookIssuanceWeekly')
+    BookIssuanceMonthly = apps.get_model('lib', 'BookIssuanceMonthly')
+    weekly, monthly = {}, {}
+    for book_id, day, quantity in BookIssuanceRecord.objects.values_list('book_id', 'date', 'quantity_issued').iterator():
+        week = (book_id, day - timedelta(days=day.weekday()))
+        month = (book_id, day.replace(day=1))
+        weekly[week] = weekly.get(week, 0) + quantity
+        monthly[month] = monthly.get(month, 0) + quantity
+    BookIssuanceWeekly.objects.bulk_create(
+        [BookIssuanceWeekly(book_id=b, week_start=d, quantity_issued=q) for (b, d), q in weekly.items()],
+        batch_size=1000,
+    )
+    BookIssuanceMonthly.objects.bulk_create(
+        [BookIssuanceMonthly(book_id=b, month_start=d, quantity_issued=q) for (b, d), q in monthly.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0019_book_reader_rating_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookIssuanceMonthly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month_start', models.DateField()),
+                ('quantity_issued', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_issuance_records', to='lib.book')),
+            ],
+            options={
+                'ordering': ['month_start'],
+                'unique_together': {('book', 'month_start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='BookIssuanceWeekly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField()),
+                ('quantity_issued', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_issuance_records', to='lib.book')),
+            ],
+            options={
+                'ordering': ['week_start'],
+                'unique_together': {('book', 'week_start')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0020_issuance_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('issued', 'Book Issued'), ('due_soon', 'Due Soon (2 days)'), ('overdue', 'Overdue'), ('request_rejected', 'Request Rejected'), ('hold_placed', 'Placed On Hold'), ('hold_allocated', 'Hold Allocated')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='Hold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('fulfilled', 'Fulfilled'), ('cancelled', 'Cancelled')], default='waiting', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='lib.book')),
+                ('issue', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='hold', to='lib.issue')),
+                ('reader', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='lib.reader')),
+                ('request', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='hold', to='lib.issuerequest')),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['book', 'status', 'created_at', 'id'], name='lib_hold_queue_idx')],
+            },
+        ),
+    ]
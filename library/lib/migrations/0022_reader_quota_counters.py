@@ -0,0 +1,44 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:15
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_reader_counters(apps, schema_editor):
+    Reader = apps.get_model('lib', 'Reader')
+    Issue = apps.get_model('lib', 'Issue')
+    IssueRequest = apps.get_model('lib', 'IssueRequest')
+    loans = (
+        Issue.objects.filter(reader=OuterRef('pk'), returned_date__isnull=True)
+        .order_by().values('reader').annotate(n=Count('pk')).values('n')
+    )
+    pending = (
+        IssueRequest.objects.filter(reader=OuterRef('pk'), approved=False, rejected=False)
+        .order_by().values('reader').annotate(n=Count('pk')).values('n')
+    )
+    Reader.objects.update(
+        active_loans=Coalesce(Subquery(loans), Value(0)),
+        pending_requests=Coalesce(Subquery(pending), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0021_holds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reader',
+            name='active_loans',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reader',
+            name='pending_requests',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_reader_counters, migrations.RunPython.noop),
+    ]
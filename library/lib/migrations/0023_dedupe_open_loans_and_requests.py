@@ -0,0 +1,63 @@
+"""Resolve rows that would violate the unique constraints added in 0024.
+
+Before 0024 only the views prevented a reader from holding two open loans
+of the same book or filing two pending requests for it, so existing data can
+contain duplicates. For each (reader, book) the oldest row is kept:
+
+* extra open loans are closed as returned today and their copies restocked;
+* extra pending requests are rejected and any hold queued for them cancelled.
+
+The reader quota counters are adjusted to match, and every changed row is
+logged so staff can follow up.
+"""
+import logging
+from datetime import date
+
+from django.db import migrations
+from django.db.models import Count, F
+from django.utils import timezone
+
+logger = logging.getLogger('lib.migrations')
+
+
+def _duplicates(queryset):
+    """Rows of `queryset` beyond the oldest one for their (reader, book)."""
+    pairs = (
+        queryset.order_by().values('reader_id', 'book_id')
+        .annotate(n=Count('pk')).filter(n__gt=1).values_list('reader_id', 'book_id')
+    )
+    extra = []
+    for reader_id, book_id in pairs:
+        extra.extend(queryset.filter(reader_id=reader_id, book_id=book_id).order_by('pk')[1:])
+    return extra
+
+
+def dedupe(apps, schema_editor):
+    Book = apps.get_model('lib', 'Book')
+    Hold = apps.get_model('lib', 'Hold')
+    Issue = apps.get_model('lib', 'Issue')
+    IssueRequest = apps.get_model('lib', 'IssueRequest')
+    Reader = apps.get_model('lib', 'Reader')
+
+    for issue in _duplicates(Issue.objects.filter(returned_date__isnull=True)):
+        Issue.objects.filter(pk=issue.pk).update(returned_date=date.today())
+        Book.objects.filter(pk=issue.book_id).update(number_in_stock=F('number_in_stock') + 1)
+        Reader.objects.filter(pk=issue.reader_id, active_loans__gt=0).update(active_loans=F('active_loans') - 1)
+        logger.warning("Closed duplicate open loan #%s (reader %s, book %s)", issue.pk, issue.reader_id, issue.book_id)
+
+    for req in _duplicates(IssueRequest.objects.filter(approved=False, rejected=False)):
+        IssueRequest.objects.filter(pk=req.pk).update(rejected=True)
+        Hold.objects.filter(request_id=req.pk, status='waiting').update(status='cancelled', resolved_at=timezone.now())
+        Reader.objects.filter(pk=req.reader_id, pending_requests__gt=0).update(pending_requests=F('pending_requests') - 1)
+        logger.warning("Rejected duplicate pending request #%s (reader %s, book %s)", req.pk, req.reader_id, req.book_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0022_reader_quota_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0023_dedupe_open_loans_and_requests'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='issue',
+            constraint=models.UniqueConstraint(condition=models.Q(('returned_date__isnull', True)), fields=('reader', 'book'), name='lib_issue_one_open_loan'),
+        ),
+        migrations.AddConstraint(
+            model_name='issuerequest',
+            constraint=models.UniqueConstraint(condition=models.Q(('approved', False), ('rejected', False)), fields=('reader', 'book'), name='lib_issuerequest_one_pending'),
+        ),
+    ]
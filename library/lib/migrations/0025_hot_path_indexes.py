@@ -0,0 +1,37 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0024_unique_open_loans_and_requests'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['name'], name='lib_book_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fine',
+            index=models.Index(condition=models.Q(('paid', False)), fields=['issue'], name='lib_fine_unpaid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(('returned_date__isnull', True)), fields=['due_date'], name='lib_issue_open_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issuerequest',
+            index=models.Index(condition=models.Q(('approved', False), ('rejected', False)), fields=['request_date'], name='lib_issuereq_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['reader', 'created_at'], name='lib_notif_reader_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('read', False)), fields=['reader', 'created_at'], name='lib_notif_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0027_book_conditional_get'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('issued', 'Book Issued'), ('due_soon', 'Due Soon (2 days)'), ('overdue', 'Overdue'), ('request_rejected', 'Request Rejected'), ('hold_placed', 'Placed On Hold'), ('hold_allocated', 'Hold Allocated'), ('hold_cancelled', 'Hold Cancelled')], max_length=20),
+        ),
+    ]
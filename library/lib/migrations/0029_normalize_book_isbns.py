@@ -0,0 +1,48 @@
+import logging
+
+from django.db import migrations
+
+logger = logging.getLogger('lib.migrations')
+
+
+def _bare(isbn):
+    # lib.models.normalize_isbn as of this migration
+    return str(isbn).replace('-', '').replace(' ', '').strip().upper()
+
+
+def normalize_isbns(apps, schema_editor):
+    """Store every ISBN bare (no hyphens/spaces), as Book.save now does.
+
+    A book whose normalized ISBN is already taken by another book is left
+    unchanged and logged, so staff can merge the two by hand. The search
+    index (0018) is not kept in sync by triggers, so changed rows are
+    updated there as well.
+    """
+    Book = apps.get_model('lib', 'Book')
+    connection = schema_editor.connection
+    fts = connection.vendor == 'sqlite' and 'lib_book_fts' in connection.introspection.table_names()
+    taken = set(Book.objects.values_list('isbn', flat=True))
+    for pk, isbn in Book.objects.values_list('pk', 'isbn'):
+        bare = _bare(isbn)
+        if bare == isbn:
+            continue
+        if bare in taken:
+            logger.warning("Book #%s: ISBN %r left as is, %r belongs to another book", pk, isbn, bare)
+            continue
+        Book.objects.filter(pk=pk).update(isbn=bare)
+        if fts:
+            with connection.cursor() as cursor:
+                cursor.execute("UPDATE lib_book_fts SET isbn = %s WHERE rowid = %s", [bare, pk])
+        taken.discard(isbn)
+        taken.add(bare)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0028_notification_hold_cancelled'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_isbns, migrations.RunPython.noop),
+    ]
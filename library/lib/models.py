@@ -8,6 +8,11 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 def default_due_date():
     return date.today() + timedelta(days=14)
 
+
+def normalize_isbn(value):
+    """Scanners and people type ISBNs with hyphens and spaces; the catalog stores bare digits."""
+    return str(value).replace('-', '').replace(' ', '').strip().upper()
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
 
@@ -23,16 +28,34 @@ class Book(models.Model):
     number_in_stock = models.PositiveIntegerField(default=0)  # Available copies
     description = models.TextField(blank=True, null=True, default="No description available")
     rating = models.DecimalField(max_digits=3, decimal_places=1, default=4.0, validators=[MinValueValidator(1.0), MaxValueValidator(5.0)])  # Rating with 1 decimal place
+    # Denormalized reader rating stats, maintained by lib/ratings.py (recompute_rating_stats rebuilds them)
+    reader_rating_sum = models.DecimalField(max_digits=10, decimal_places=1, default=0)
+    reader_rating_count = models.PositiveIntegerField(default=0)
+    reader_rating_avg = models.DecimalField(max_digits=3, decimal_places=2, blank=True, null=True)
+    # Validators for conditional GET (lib/conditional.py): stock and rating UPDATEs set updated_at
+    # explicitly, analytics writes set analytics_updated_at
+    updated_at = models.DateTimeField(auto_now=True)
+    analytics_updated_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='lib_book_name_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # stored bare so desk scans (lib/circulation.py) match by equality
+        self.isbn = normalize_isbn(self.isbn)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.name} ({self.isbn})"
     
     def avg_reader_rating(self):
         """Return average rating given by readers for this book (float). If none, fall back to admin rating."""
-        from django.db.models import Avg
-        avg = self.reader_ratings.aggregate(avg=Avg('rating'))['avg']
         try:
-            return float(avg) if avg is not None else float(self.rating)
+            if self.reader_rating_count and self.reader_rating_avg is not None:
+                return float(self.reader_rating_avg)
+            return float(self.rating)
         except (TypeError, ValueError):
             return float(self.rating)
 
@@ -65,7 +88,15 @@ class Reader(models.Model):
     image = models.ImageField(upload_to='profile_images/', blank=True, null=True)
     # Flag for college staff members who have different borrowing rules (e.g. longer due dates)
     is_staff_member = models.BooleanField(default=False)
+    # Denormalized quota counters, maintained by lib/quotas.py
+    active_loans = models.PositiveIntegerField(default=0)
+    pending_requests = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # admin reader list, keyset-paginated on (name, id)
+            models.Index(fields=['name'], name='lib_reader_name_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.reader_id})"
@@ -78,6 +109,22 @@ class Issue(models.Model):
     due_date = models.DateField(default=default_due_date)
     returned_date = models.DateField(blank=True, null=True)
 
+    class Meta:
+        constraints = [
+            # a reader can hold at most one open loan of the same book
+            models.UniqueConstraint(
+                fields=['reader', 'book'],
+                condition=models.Q(returned_date__isnull=True),
+                name='lib_issue_one_open_loan',
+            ),
+        ]
+        indexes = [
+            # overdue / due-soon / fine accrual scans only look at open loans
+            models.Index(fields=['due_date'], condition=models.Q(returned_date__isnull=True), name='lib_issue_open_due_idx'),
+            # admin issue list, latest first
+            models.Index(fields=['issued_date'], name='lib_issue_issued_idx'),
+        ]
+
     def __str__(self):
         return f"{self.book.name} issued to {self.reader.name} on {self.issued_date}"
 
@@ -88,6 +135,14 @@ class Fine(models.Model):
     paid = models.BooleanField(default=False)
     calculated_date = models.DateField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # unpaid fines by loan; a reader's unpaid fines walk issue(reader_id) then this index
+            models.Index(fields=['issue'], condition=models.Q(paid=False), name='lib_fine_unpaid_idx'),
+            # admin fine list, latest first
+            models.Index(fields=['calculated_date'], name='lib_fine_calculated_idx'),
+        ]
+
     def __str__(self):
         return f"Fine for {self.issue.book.name} ({self.amount})"
     
@@ -98,16 +153,68 @@ class IssueRequest(models.Model):
     approved = models.BooleanField(default=False)
     rejected = models.BooleanField(default=False)  # <-- new field
 
+    class Meta:
+        constraints = [
+            # at most one pending (neither approved nor rejected) request per reader and book
+            models.UniqueConstraint(
+                fields=['reader', 'book'],
+                condition=models.Q(approved=False, rejected=False),
+                name='lib_issuerequest_one_pending',
+            ),
+        ]
+        indexes = [
+            # pending request queue in request order. Django renders approved=False as
+            # "NOT approved", which cannot seek a (approved, rejected, ...) index, so the
+            # status goes into the index condition instead.
+            models.Index(fields=['request_date'], condition=models.Q(approved=False, rejected=False),
+                         name='lib_issuereq_pending_idx'),
+        ]
+
     def __str__(self):
         return f"{self.book.name} requested by {self.reader.name}"
 
 
+class Hold(models.Model):
+    """A reader waiting for a copy of an out-of-stock book.
+
+    Holds form a FIFO queue per book (oldest ``created_at`` first); when a
+    copy is returned it goes straight to the head of the queue.
+    """
+    WAITING, FULFILLED, CANCELLED = 'waiting', 'fulfilled', 'cancelled'
+    STATUS_CHOICES = [
+        (WAITING, 'Waiting'),
+        (FULFILLED, 'Fulfilled'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    book = models.ForeignKey('Book', on_delete=models.CASCADE, related_name='holds')
+    reader = models.ForeignKey('Reader', on_delete=models.CASCADE, related_name='holds')
+    request = models.OneToOneField('IssueRequest', on_delete=models.CASCADE, related_name='hold', null=True, blank=True)
+    issue = models.OneToOneField('Issue', on_delete=models.SET_NULL, related_name='hold', null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=WAITING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            # head of a book's queue is one index seek
+            models.Index(fields=['book', 'status', 'created_at', 'id'], name='lib_hold_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.reader.name} waiting for {self.book.name} ({self.status})"
+
+
 class Notification(models.Model):
     NOTIFICATION_TYPES = [
         ('issued', 'Book Issued'),
         ('due_soon', 'Due Soon (2 days)'),
         ('overdue', 'Overdue'),
         ('request_rejected', 'Request Rejected'),
+        ('hold_placed', 'Placed On Hold'),
+        ('hold_allocated', 'Hold Allocated'),
+        ('hold_cancelled', 'Hold Cancelled'),
     ]
     
     reader = models.ForeignKey('Reader', on_delete=models.CASCADE, related_name='notifications')
@@ -120,6 +227,11 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # a reader's notifications newest first, and their unread count ("NOT read" is the condition)
+            models.Index(fields=['reader', 'created_at'], name='lib_notif_reader_created_idx'),
+            models.Index(fields=['reader', 'created_at'], condition=models.Q(read=False), name='lib_notif_unread_idx'),
+        ]
 
     def __str__(self):
         return f"Notification for {self.reader.name}: {self.title}"
@@ -139,6 +251,34 @@ class BookIssuanceRecord(models.Model):
         return f"{self.book.name} - {self.date}: {self.quantity_issued} issued"
 
 
+class BookIssuanceWeekly(models.Model):
+    """Weekly rollup of BookIssuanceRecord (weeks start on Monday)."""
+    book = models.ForeignKey('Book', on_delete=models.CASCADE, related_name='weekly_issuance_records')
+    week_start = models.DateField()
+    quantity_issued = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('book', 'week_start')
+        ordering = ['week_start']
+
+    def __str__(self):
+        return f"{self.book.name} - week of {self.week_start}: {self.quantity_issued} issued"
+
+
+class BookIssuanceMonthly(models.Model):
+    """Monthly rollup of BookIssuanceRecord (month_start is the 1st of the month)."""
+    book = models.ForeignKey('Book', on_delete=models.CASCADE, related_name='monthly_issuance_records')
+    month_start = models.DateField()
+    quantity_issued = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('book', 'month_start')
+        ordering = ['month_start']
+
+    def __str__(self):
+        return f"{self.book.name} - {self.month_start:%B %Y}: {self.quantity_issued} issued"
+
+
 class BookRating(models.Model):
     """Per-reader rating for a book."""
     book = models.ForeignKey('Book', on_delete=models.CASCADE, related_name='reader_ratings')
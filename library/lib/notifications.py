@@ -0,0 +1,75 @@
+"""Reader notifications.
+
+Due-soon and overdue reminders are created in batches by
+``python manage.py send_due_notifications`` (run it from cron/a scheduler,
+e.g. every hour) rather than on reader page views.
+"""
+from datetime import timedelta
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Issue, Notification
+
+# Days before the due date at which the "due soon" reminder is sent
+DUE_SOON_DAYS = 2
+
+
+def create_issue_notification(issue):
+    """Create a notification when a book is issued to a reader."""
+    Notification.objects.create(
+        reader=issue.reader,
+        issue=issue,
+        notification_type='issued',
+        title=f"Book Issued: {issue.book.name}",
+        message=f"You have been issued '{issue.book.name}' by {issue.book.author}. Due date: {issue.due_date}"
+    )
+
+
+def _issues_without_notification(notification_type, **filters):
+    """Open issues matching `filters` that have no notification of `notification_type` yet (anti-join)."""
+    already_notified = Notification.objects.filter(issue=OuterRef('pk'), notification_type=notification_type)
+    return (
+        Issue.objects
+        .filter(returned_date__isnull=True, **filters)
+        .filter(~Exists(already_notified))
+        .select_related('book')
+        .only('pk', 'reader_id', 'due_date', 'book__name')
+    )
+
+
+def create_due_soon_notifications(today=None, batch_size=500):
+    """Create notifications for books due in DUE_SOON_DAYS days. Returns how many were created."""
+    today = today or timezone.now().date()
+    target_date = today + timedelta(days=DUE_SOON_DAYS)
+
+    notifications = [
+        Notification(
+            reader_id=issue.reader_id,
+            issue=issue,
+            notification_type='due_soon',
+            title=f"Due Soon: {issue.book.name}",
+            message=f"'{issue.book.name}' is due on {issue.due_date}. Please return it on time to avoid fines."
+        )
+        for issue in _issues_without_notification('due_soon', due_date=target_date).iterator(chunk_size=batch_size)
+    ]
+    Notification.objects.bulk_create(notifications, batch_size=batch_size)
+    return len(notifications)
+
+
+def create_overdue_notifications(today=None, batch_size=500):
+    """Create notifications for overdue books. Returns how many were created."""
+    today = today or timezone.now().date()
+
+    notifications = []
+    for issue in _issues_without_notification('overdue', due_date__lt=today).iterator(chunk_size=batch_size):
+        days_overdue = (today - issue.due_date).days
+        notifications.append(Notification(
+            reader_id=issue.reader_id,
+            issue=issue,
+            notification_type='overdue',
+            title=f"Overdue: {issue.book.name}",
+            message=f"'{issue.book.name}' is {days_overdue} day(s) overdue. Please return it immediately to avoid additional fines."
+        ))
+    Notification.objects.bulk_create(notifications, batch_size=batch_size)
+    return len(notifications)
@@ -0,0 +1,89 @@
+"""Keyset (cursor) pagination helpers.
+
+A cursor is the sort key of the last row on the previous page, serialised as
+URL-safe base64 JSON. Fetching the next page is then a ``WHERE key > cursor``
+range scan instead of an OFFSET, so the cost of a page does not depend on how
+deep into the result set it is.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    """Serialise a sort-key tuple into an opaque cursor token."""
+    raw = json.dumps(list(values), separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, length):
+    """Decode a cursor token back into a list of `length` values.
+
+    Raises InvalidCursor for anything that was not produced by encode_cursor.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, TypeError):
+        raise InvalidCursor('malformed cursor')
+    if not isinstance(values, list) or len(values) != length:
+        raise InvalidCursor('malformed cursor')
+    # sort keys are strings and numbers (dates are encoded as strings)
+    if not all(isinstance(value, (str, int, float)) for value in values):
+        raise InvalidCursor('malformed cursor')
+    return values
+
+
+def keyset_filter(fields, values):
+    """Build a Q selecting rows that sort strictly after `values` on `fields`.
+
+    `fields` are ordering names as passed to order_by() (a leading '-' means
+    descending), e.g. keyset_filter(['name', 'pk'], ['Dune', 42]) gives
+    ``name > 'Dune' OR (name = 'Dune' AND pk > 42)``.
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(fields, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def keyset_page(queryset, ordering, token=None, limit=50):
+    """Fetch one page of `queryset` sorted by `ordering` (which must end in a unique field).
+
+    `token` is the cursor returned for the previous page (None for the first).
+    Returns ``(rows, next_token)``; next_token is None on the last page.
+    Raises InvalidCursor for a bad token.
+    """
+    queryset = queryset.order_by(*ordering)
+    if token:
+        values = decode_cursor(token, len(ordering))
+        try:
+            queryset = queryset.filter(keyset_filter(ordering, values))
+        except (TypeError, ValueError, ValidationError):
+            # well-formed, but the values do not fit the fields (e.g. a text pk)
+            raise InvalidCursor('cursor does not match the ordering')
+    rows = list(queryset[:limit + 1])  # one extra row tells us whether there is a next page
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, field.lstrip('-')) for field in ordering])
+
+
+def parse_limit(value, default, maximum):
+    """Parse a page-size parameter, clamped to 1..maximum."""
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, maximum))
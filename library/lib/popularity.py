@@ -0,0 +1,96 @@
+"""Materialized pool of popular books for the "Most Popular" section.
+
+Instead of sorting every highly rated book by RANDOM() on each detail page,
+the top POPULAR_POOL_SIZE books are ranked once and kept in the cache for
+POPULAR_POOL_TTL seconds (or until a Book is saved/deleted, see
+lib/signals.py). Detail pages then draw a random sample from that pool in
+memory. The time the pool was ranked is cached next to it as its version,
+which the book_details ETag includes (lib/conditional.py).
+``python manage.py refresh_popular_books`` rebuilds it on demand, e.g. from
+cron.
+
+Ranking score = (admin rating + reader average) / 2
+              + POPULAR_RECENT_WEIGHT * min(issues in the last POPULAR_RECENT_DAYS days, POPULAR_RECENT_CAP)
+"""
+import random
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.db.models import F, FloatField, ExpressionWrapper, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Least
+
+from .models import Book, BookIssuanceRecord
+
+POPULAR_POOL_SIZE = getattr(settings, 'POPULAR_POOL_SIZE', 50)
+POPULAR_POOL_TTL = getattr(settings, 'POPULAR_POOL_TTL', 600)
+POPULAR_MIN_RATING = getattr(settings, 'POPULAR_MIN_RATING', 4.5)
+POPULAR_RECENT_DAYS = getattr(settings, 'POPULAR_RECENT_DAYS', 30)
+POPULAR_RECENT_WEIGHT = getattr(settings, 'POPULAR_RECENT_WEIGHT', 0.05)
+POPULAR_RECENT_CAP = getattr(settings, 'POPULAR_RECENT_CAP', 20)
+
+POOL_CACHE_KEY = 'lib:popular_pool'
+POOL_VERSION_KEY = 'lib:popular_pool_version'
+
+
+def compute_pool():
+    """Rank eligible books (admin rating > POPULAR_MIN_RATING) and return the top of the list."""
+    since = date.today() - timedelta(days=POPULAR_RECENT_DAYS)
+    recent = (
+        BookIssuanceRecord.objects
+        .filter(book=OuterRef('pk'), date__gte=since)
+        .order_by().values('book')
+        .annotate(total=Sum('quantity_issued'))
+        .values('total')
+    )
+    rating = Cast('rating', FloatField())
+    reader_avg = Coalesce(Cast('reader_rating_avg', FloatField()), rating)
+    books = (
+        Book.objects
+        .filter(rating__gt=POPULAR_MIN_RATING)
+        .annotate(recent_issues=Coalesce(Subquery(recent), Value(0)))
+        .annotate(popularity=ExpressionWrapper(
+            (rating + reader_avg) / 2.0
+            + POPULAR_RECENT_WEIGHT * Least(F('recent_issues'), Value(POPULAR_RECENT_CAP)),
+            output_field=FloatField(),
+        ))
+        .order_by('-popularity', 'pk')
+    )
+    return list(books[:POPULAR_POOL_SIZE])
+
+
+def refresh_pool():
+    """Recompute the pool and store it in the cache. Returns the pool."""
+    pool = compute_pool()
+    cache.set_many({POOL_CACHE_KEY: pool, POOL_VERSION_KEY: timezone.now()}, POPULAR_POOL_TTL)
+    return pool
+
+
+def invalidate_pool():
+    cache.delete_many([POOL_CACHE_KEY, POOL_VERSION_KEY])
+
+
+def pool_version():
+    """When the current pool was ranked, ranking it first if it is not cached."""
+    version = cache.get(POOL_VERSION_KEY)
+    if version is None or not cache.has_key(POOL_CACHE_KEY):
+        refresh_pool()
+        version = cache.get(POOL_VERSION_KEY)
+    return version
+
+
+def get_pool():
+    pool = cache.get(POOL_CACHE_KEY)
+    if pool is None:
+        pool = refresh_pool()
+    return pool
+
+
+def sample_popular_books(limit=3, exclude_book_id=None):
+    """Return up to `limit` random books from the popularity pool, skipping `exclude_book_id`."""
+    pool = get_pool()
+    # Draw one extra so dropping the excluded book still leaves `limit` picks.
+    picks = random.sample(pool, min(limit + 1, len(pool)))
+    picks = [book for book in picks if book.pk != exclude_book_id]
+    return picks[:limit]
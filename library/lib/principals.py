@@ -0,0 +1,139 @@
+"""The logged-in reader/admin for the current request.
+
+Logins store ``reader_id``/``admin_id`` in the session. PrincipalMiddleware
+puts lazy ``request.reader`` and ``request.admin`` on every request; the
+first access loads the row and later accesses reuse it, so a request that
+passes through several views (e.g. book_details -> reader_book_detail)
+queries it at most once.
+
+Loaded rows are also kept in a small per-process LRU keyed by (kind, pk,
+session key) for PRINCIPAL_CACHE_TTL seconds, so most page views do not
+query the principal at all. Saving or deleting a Reader/Admin (profile
+edits, password changes) drops its entries in this process (see
+lib/signals.py); other workers see the change once their entry expires,
+which is why the TTL is short.
+The quota counters are changed by UPDATE without a save (lib/quotas.py),
+so they are never cached: readers are loaded with those columns deferred,
+reading one queries the current value, and a save() of the cached copy
+only writes the columns that were loaded. Views that save a principal still
+name the columns they change with ``update_fields``.
+
+``reader_required``/``admin_required`` redirect to the login page when no
+principal is logged in and otherwise leave it loaded on the request.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.shortcuts import redirect
+from django.utils.functional import SimpleLazyObject
+
+from .models import Admin, Reader
+
+PRINCIPAL_CACHE_SIZE = getattr(settings, 'PRINCIPAL_CACHE_SIZE', 512)
+PRINCIPAL_CACHE_TTL = getattr(settings, 'PRINCIPAL_CACHE_TTL', 30)
+
+_MODELS = {'reader': Reader, 'admin': Admin}
+# columns kept up to date by F() updates rather than saves, which never invalidate the cache
+_DEFERRED = {'reader': ('active_loans', 'pending_requests'), 'admin': ()}
+
+
+class PrincipalCache:
+    """Thread-safe LRU of loaded principals with a per-entry TTL."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (kind, pk, session_key) -> (expires, obj)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            # each request gets its own copy, so a view editing it cannot leak into other requests
+            return copy.copy(entry[1])
+
+    def set(self, key, obj):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, copy.copy(obj))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, kind, pk):
+        with self._lock:
+            for key in [key for key in self._entries if key[:2] == (kind, pk)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+
+
+def _load(request, kind):
+    memo = request.__dict__.setdefault('_principals', {})
+    pk = request.session.get(f'{kind}_id')
+    if (kind, pk) in memo:
+        return memo[(kind, pk)]
+    obj = None
+    if pk:
+        key = (kind, pk, request.session.session_key)
+        obj = principal_cache.get(key)
+        if obj is None:
+            obj = _MODELS[kind].objects.defer(*_DEFERRED[kind]).filter(pk=pk).first()
+            if obj is not None:
+                principal_cache.set(key, obj)
+    memo[(kind, pk)] = obj
+    return obj
+
+
+def get_reader(request):
+    """The logged-in Reader, or None."""
+    return _load(request, 'reader')
+
+
+def get_admin(request):
+    """The logged-in Admin, or None."""
+    return _load(request, 'admin')
+
+
+class PrincipalMiddleware:
+    """Adds lazy ``request.reader`` and ``request.admin`` (must come after SessionMiddleware)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.reader = SimpleLazyObject(lambda: get_reader(request))
+        request.admin = SimpleLazyObject(lambda: get_admin(request))
+        return self.get_response(request)
+
+
+def _required(kind, login_url):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            obj = _load(request, kind)
+            if obj is None:
+                return redirect(login_url)
+            setattr(request, kind, obj)  # the model instance itself, not the lazy wrapper
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+reader_required = _required('reader', 'login_reader')
+admin_required = _required('admin', 'login_admin')
+
@@ -0,0 +1,61 @@
+"""Per-reader loan quota counters.
+
+``Reader.active_loans`` (open issues) and ``Reader.pending_requests``
+(requests neither approved nor rejected) are shifted with F() updates in the
+same transaction as the loan/request change, so enforcing
+MAX_ISSUED_PER_READER reads one Reader row instead of counting Issue and
+IssueRequest rows. ``python manage.py recompute_reader_counters`` rebuilds
+them if they ever drift (e.g. after edits in the Django admin).
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Issue, IssueRequest, Reader
+
+
+def change_counters(reader_id, loans=0, pending=0):
+    """Atomically shift one reader's active_loans/pending_requests.
+
+    Counters are clamped at 0: a drifted counter (rows edited outside the
+    views) must not make the loan or request change itself fail on the
+    columns' CHECK constraint.
+    """
+    changes = {}
+    if loans:
+        changes['active_loans'] = Greatest(F('active_loans') + loans, Value(0))
+    if pending:
+        changes['pending_requests'] = Greatest(F('pending_requests') + pending, Value(0))
+    if changes:
+        Reader.objects.filter(pk=reader_id).update(**changes)
+
+
+def change_counters_many(loans=None, pending=None):
+    """Apply per-reader deltas ({reader_id: n}) from a batch, one UPDATE per reader."""
+    loans, pending = loans or {}, pending or {}
+    for reader_id in set(loans) | set(pending):
+        change_counters(reader_id, loans.get(reader_id, 0), pending.get(reader_id, 0))
+
+
+def quota_used(reader):
+    """Books out plus requests pending, as counted against MAX_ISSUED_PER_READER."""
+    return reader.active_loans + reader.pending_requests
+
+
+def recompute_reader_counters(reader_model=Reader, issue_model=Issue, request_model=IssueRequest):
+    """Rebuild every reader's counters from Issue/IssueRequest in one UPDATE.
+
+    Returns the number of Reader rows updated. The model arguments let data
+    migrations pass historical models.
+    """
+    loans = (
+        issue_model.objects.filter(reader=OuterRef('pk'), returned_date__isnull=True)
+        .order_by().values('reader').annotate(n=Count('pk')).values('n')
+    )
+    pending = (
+        request_model.objects.filter(reader=OuterRef('pk'), approved=False, rejected=False)
+        .order_by().values('reader').annotate(n=Count('pk')).values('n')
+    )
+    return reader_model.objects.update(
+        active_loans=Coalesce(Subquery(loans), Value(0)),
+        pending_requests=Coalesce(Subquery(pending), Value(0)),
+    )
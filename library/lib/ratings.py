@@ -0,0 +1,72 @@
+"""Maintenance of the denormalized reader rating stats on Book.
+
+``Book.reader_rating_sum``/``reader_rating_count``/``reader_rating_avg`` are
+updated incrementally with a single UPDATE whenever a BookRating is created,
+changed or deleted, so pages can show averages without aggregating
+BookRating per row.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, When, F, Value, Sum, Count, Avg, Subquery, OuterRef, DecimalField, ExpressionWrapper, FloatField
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from .models import Book, BookRating
+
+
+def apply_rating_change(book_id, sum_delta, count_delta):
+    """Atomically shift a book's rating sum/count and recompute the cached average."""
+    sum_delta = Decimal(str(sum_delta))
+    new_sum = F('reader_rating_sum') + sum_delta
+    new_count = F('reader_rating_count') + count_delta
+    Book.objects.filter(pk=book_id).update(
+        reader_rating_sum=new_sum,
+        reader_rating_count=new_count,
+        # the right-hand side sees the old column values, so reuse the shifted expressions;
+        # SQLite stores a whole sum like 9.0 as the integer 9, so cast before dividing
+        reader_rating_avg=Case(
+            When(reader_rating_count__gt=-count_delta,
+                 then=ExpressionWrapper(Cast(new_sum, FloatField()) / new_count, output_field=DecimalField())),
+            default=Value(None),
+            output_field=DecimalField(),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def set_reader_rating(book, reader, rating):
+    """Create or update `reader`'s rating of `book` and update the book's stats.
+
+    Returns the BookRating. The stats change is applied in the same
+    transaction as the rating write.
+    """
+    rating = Decimal(str(round(float(rating), 1)))
+    with transaction.atomic():
+        existing = BookRating.objects.select_for_update().filter(book=book, reader=reader).first()
+        if existing is None:
+            br = BookRating.objects.create(book=book, reader=reader, rating=rating)
+            apply_rating_change(book.pk, rating, 1)
+        else:
+            delta = rating - existing.rating
+            existing.rating = rating
+            existing.save(update_fields=['rating', 'updated_at'])
+            br = existing
+            if delta:
+                apply_rating_change(book.pk, delta, 0)
+    return br
+
+
+def recompute_rating_stats():
+    """Rebuild every book's stats from BookRating in one set-based UPDATE.
+
+    Returns the number of Book rows updated.
+    """
+    ratings = BookRating.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    decimal = DecimalField()
+    return Book.objects.update(
+        reader_rating_sum=Coalesce(Subquery(ratings.annotate(s=Sum('rating')).values('s')), Value(Decimal('0')), output_field=decimal),
+        reader_rating_count=Coalesce(Subquery(ratings.annotate(c=Count('pk')).values('c')), Value(0)),
+        reader_rating_avg=Subquery(ratings.annotate(a=Avg('rating')).values('a'), output_field=decimal),
+        updated_at=timezone.now(),
+    )
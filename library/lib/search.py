@@ -0,0 +1,187 @@
+"""Full-text search over the book catalog.
+
+Books are mirrored into an SQLite FTS5 virtual table (``lib_book_fts``) whose
+rowid is the book's primary key. The table is created by migration 0018,
+kept in sync by the signal handlers in ``lib/signals.py`` and can be rebuilt
+from scratch with ``python manage.py rebuild_search_index``.
+
+On databases without FTS5 every helper degrades gracefully: writes become
+no-ops and ``search_books`` falls back to the old ``icontains`` filters.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q, Case, When, Value, IntegerField
+
+FTS_TABLE = 'lib_book_fts'
+
+# bm25() weights, one per indexed column (same order as FTS_COLUMNS).
+# A hit in the title counts the most, then author, ISBN, category, description.
+FTS_COLUMNS = ('name', 'author', 'isbn', 'category', 'description')
+BM25_WEIGHTS = (10.0, 5.0, 3.0, 2.0, 1.0)
+
+CREATE_FTS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    + ', '.join(FTS_COLUMNS)
+    + ", tokenize = 'unicode61 remove_diacritics 2')"
+)
+DROP_FTS_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Databases (by NAME) on which the FTS table is known to exist, so the
+# sqlite_master lookup only happens once per process.
+_fts_ready = set()
+
+
+def fts_available():
+    """Return True when the FTS table exists on the current database."""
+    if connection.vendor != 'sqlite':
+        return False
+    db_name = str(connection.settings_dict['NAME'])
+    if db_name in _fts_ready:
+        return True
+    if FTS_TABLE in connection.introspection.table_names():
+        _fts_ready.add(db_name)
+        return True
+    return False
+
+
+def build_match_expression(query, columns=None):
+    """Turn free-form user input into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term (``"harr"*``) and all terms must
+    match, so typing "harry pot" finds "Harry Potter". Returns None when the
+    input contains no searchable words.
+    """
+    tokens = _TOKEN_RE.findall(query or '')
+    if not tokens:
+        return None
+    terms = ' '.join(f'"{t}"*' for t in tokens)
+    if columns:
+        return '{%s} : (%s)' % (' '.join(columns), terms)
+    return terms
+
+
+def _book_row(book):
+    category = book.category.name if book.category_id and book.category else ''
+    return (
+        book.pk,
+        book.name or '',
+        book.author or '',
+        book.isbn or '',
+        category,
+        book.description or '',
+    )
+
+
+def index_book(book):
+    """Insert or replace a single book in the FTS table."""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [book.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s)",
+            _book_row(book),
+        )
+
+
+def remove_book(book_id):
+    """Remove a book from the FTS table."""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [book_id])
+
+
+def rename_category(category):
+    """Propagate a category rename to every indexed book in that category."""
+    if not fts_available():
+        return
+    from .models import Book
+    # Only the category column changes; re-index the affected books in one pass.
+    book_ids = list(Book.objects.filter(category=category).values_list('pk', flat=True))
+    if not book_ids:
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(book_ids), 500):
+            chunk = book_ids[start:start + 500]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f"UPDATE {FTS_TABLE} SET category = %s WHERE rowid IN ({placeholders})",
+                [category.name] + chunk,
+            )
+
+
+def clear_category(category_name):
+    """Blank out a deleted category (books fall back to no category)."""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"UPDATE {FTS_TABLE} SET category = '' WHERE category = %s", [category_name])
+
+
+def rebuild_index(batch_size=1000):
+    """Drop and repopulate the FTS table from the Book table. Returns the number of books indexed."""
+    if connection.vendor != 'sqlite':
+        return 0
+    from .models import Book
+    total = 0
+    with connection.cursor() as cursor:
+        cursor.execute(DROP_FTS_SQL)
+        cursor.execute(CREATE_FTS_SQL)
+        books = Book.objects.select_related('category').order_by('pk').iterator(chunk_size=batch_size)
+        batch = []
+        insert_sql = f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s)"
+        for book in books:
+            batch.append(_book_row(book))
+            if len(batch) >= batch_size:
+                cursor.executemany(insert_sql, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(insert_sql, batch)
+            total += len(batch)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+def search_books(queryset, query, columns=None):
+    """Filter `queryset` to books matching `query`, best matches first.
+
+    Uses the FTS index ranked by bm25 when available; the resulting queryset
+    is annotated with ``search_rank`` (lower is better) and ordered by it, then
+    by name. `columns` restricts matching to a subset of FTS_COLUMNS.
+    """
+    match = build_match_expression(query, columns)
+    if match is not None and fts_available():
+        weights = ', '.join(str(w) for w in BM25_WEIGHTS)
+        book_table = queryset.model._meta.db_table
+        return queryset.extra(
+            select={'search_rank': f"bm25({FTS_TABLE}, {weights})"},
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE}.rowid = {book_table}.id", f"{FTS_TABLE} MATCH %s"],
+            params=[match],
+        ).order_by('search_rank', 'name')
+
+    # Fallback: substring matching, prioritising name (0) > author (1) > other matches (2)
+    fields = columns or ('name', 'author', 'isbn', 'category')
+    lookups = {
+        'name': 'name__icontains',
+        'author': 'author__icontains',
+        'isbn': 'isbn__icontains',
+        'category': 'category__name__icontains',
+        'description': 'description__icontains',
+    }
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{lookups[field]: query})
+    return queryset.filter(condition).annotate(
+        search_rank=Case(
+            When(name__icontains=query, then=Value(0)),
+            When(author__icontains=query, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField()
+        )
+    ).order_by('search_rank', 'name')
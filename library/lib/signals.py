@@ -0,0 +1,97 @@
+"""Signal handlers that keep derived catalog data in sync with the models."""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import search
+from .catalog_cache import bump_catalog_version
+from .popularity import invalidate_pool
+from .autocomplete import index as autocomplete_index
+from .models import Admin, Book, BookRating, Category, Issue, IssueRequest, Reader
+from .principals import principal_cache
+from .quotas import change_counters
+from .ratings import apply_rating_change
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_book(instance)
+    autocomplete_index.add_book(instance)
+    invalidate_pool()
+    bump_catalog_version()
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    search.remove_book(instance.pk)
+    autocomplete_index.remove_book(instance.pk)
+    invalidate_pool()
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    bump_catalog_version()
+    if not created:
+        search.rename_category(instance)
+        # book pages show the category name
+        instance.books.update(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    # the books' category is set to NULL with an UPDATE that does not touch updated_at
+    instance.books.update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    search.clear_category(instance.name)
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=BookRating)
+def book_rating_saved(sender, instance, raw=False, **kwargs):
+    # the book's reader average (shown in catalog lists, part of the popularity score) changes with it
+    if not raw:
+        bump_catalog_version()
+        transaction.on_commit(invalidate_pool)  # after apply_rating_change has updated the average
+
+
+@receiver(post_delete, sender=BookRating)
+def book_rating_deleted(sender, instance, **kwargs):
+    # Keep Book.reader_rating_* in step when ratings go away (e.g. a reader is deleted)
+    apply_rating_change(instance.book_id, -instance.rating, -1)
+    bump_catalog_version()
+    transaction.on_commit(invalidate_pool)
+
+
+@receiver(post_delete, sender=Issue)
+def issue_deleted(sender, instance, **kwargs):
+    # e.g. a book is deleted with loans still open
+    if instance.returned_date is None:
+        change_counters(instance.reader_id, loans=-1)
+
+
+@receiver(post_delete, sender=IssueRequest)
+def issue_request_deleted(sender, instance, **kwargs):
+    if not instance.approved and not instance.rejected:
+        change_counters(instance.reader_id, pending=-1)
+
+
+@receiver(post_save, sender=Reader)
+@receiver(post_delete, sender=Reader)
+def reader_changed(sender, instance, **kwargs):
+    # profile edits and password changes must not be served from the principal cache
+    principal_cache.invalidate('reader', instance.pk)
+
+
+@receiver(post_save, sender=Admin)
+@receiver(post_delete, sender=Admin)
+def admin_changed(sender, instance, **kwargs):
+    principal_cache.invalidate('admin', instance.pk)
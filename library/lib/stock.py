@@ -0,0 +1,67 @@
+"""Concurrency-safe stock handling for issuing and returning books.
+
+Stock is never read, changed in Python and saved back. A copy is reserved
+with a conditional ``UPDATE ... SET number_in_stock = number_in_stock - 1
+WHERE number_in_stock > 0`` and the Issue row is written in the same short
+transaction, so two librarians issuing the last copy at the same moment
+cannot both succeed and stock can never go negative or drift.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .catalog_cache import bump_catalog_version
+from .models import Book, Issue
+from .quotas import change_counters
+
+
+class OutOfStock(Exception):
+    """No copy of the book is left to issue."""
+
+
+def reserve_copy(book_id):
+    """Take one copy of the book out of stock. Returns False if none is left."""
+    taken = Book.objects.filter(pk=book_id, number_in_stock__gt=0).update(
+        number_in_stock=F('number_in_stock') - 1, updated_at=timezone.now()
+    ) == 1
+    if taken:
+        bump_catalog_version()  # catalog pages show stock
+    return taken
+
+
+def release_copy(book_id):
+    """Put one copy of the book back into stock."""
+    Book.objects.filter(pk=book_id).update(number_in_stock=F('number_in_stock') + 1, updated_at=timezone.now())
+    bump_catalog_version()
+
+
+def issue_copy(issue):
+    """Reserve a copy of ``issue.book`` and save the (unsaved) `issue` atomically.
+
+    The reader's ``active_loans`` counter is bumped in the same transaction.
+
+    Raises OutOfStock, leaving nothing written, when no copy is available.
+    """
+    with transaction.atomic():
+        if not reserve_copy(issue.book_id):
+            raise OutOfStock(issue.book_id)
+        issue.save()
+        change_counters(issue.reader_id, loans=1)
+    return issue
+
+
+def return_copy(issue, returned_date=None):
+    """Mark `issue` returned and put the copy back into stock.
+
+    Returns False (and changes nothing) if the issue was already returned,
+    so a double-submitted return cannot inflate stock.
+    """
+    returned_date = returned_date or timezone.now().date()
+    with transaction.atomic():
+        closed = Issue.objects.filter(pk=issue.pk, returned_date__isnull=True).update(returned_date=returned_date)
+        if not closed:
+            return False
+        release_copy(issue.book_id)
+        change_counters(issue.reader_id, loans=-1)
+    issue.returned_date = returned_date
+    return True
@@ -1,3 +1,1276 @@
-from django.test import TestCase
+import re
+import threading
+import time
+import unittest
+from datetime import date, timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, OperationalError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from .models import Admin, Book, Category, Fine, Hold, Issue, IssueRequest, Notification, Reader
+from .stock import OutOfStock, issue_copy, reserve_copy, return_copy
+
+# the tests must not read or clear the live cache file (SQLiteCache has its own tests)
+_test_cache = override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'lib-tests'},
+})
+
+
+def setUpModule():
+    _test_cache.enable()
+
+
+def tearDownModule():
+    _test_cache.disable()
+
+
+def run_concurrently(worker, count):
+    """Start `count` threads running worker(i) at the same moment and wait for them."""
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def target(i):
+        try:
+            barrier.wait()
+            worker(i)
+        except Exception as exc:  # surfaced by the test
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def retry_locked(fn, attempts=50):
+    """SQLite reports write contention as 'database is locked'; retry like a client would."""
+    for attempt in range(attempts - 1):
+        try:
+            return fn()
+        except OperationalError as exc:
+            if 'locked' not in str(exc):
+                raise
+            # 'table is locked' in the shared in-memory test database ignores the busy timeout
+            time.sleep(0.001 * (attempt + 1))
+    return fn()
+
+
+def make_reader(n, **fields):
+    fields.setdefault('name', f'Reader {n}')
+    return Reader.objects.create(reader_id=f'R{n}', date_of_birth=date(2000, 1, 1),
+                                 phone_number=f'98{n:08d}', address='Kathmandu', **fields)
+
+
+def make_book(n, **fields):
+    fields.setdefault('number_in_stock', 1)
+    fields.setdefault('name', f'Book {n}')
+    fields.setdefault('isbn', f'978{n:010d}')
+    fields.setdefault('author', f'Author {n}')
+    return Book.objects.create(**fields)
+
+
+class StockConcurrencyTests(TransactionTestCase):
+    THREADS = 12
+
+    def setUp(self):
+        self.book = Book.objects.create(name='Dune', isbn='9780441172719', author='Frank Herbert', number_in_stock=3)
+        self.readers = [
+            Reader.objects.create(reader_id=f'R{i}', name=f'Reader {i}', date_of_birth=date(2000, 1, 1),
+                                  phone_number=f'98000000{i:02d}', address='Kathmandu')
+            for i in range(self.THREADS)
+        ]
+
+    def test_concurrent_checkouts_never_oversell(self):
+        issued = []
+
+        def checkout(i):
+            def attempt():
+                try:
+                    issue_copy(Issue(reader=self.readers[i], book_id=self.book.pk, due_date=date(2099, 1, 1)))
+                    issued.append(i)
+                except OutOfStock:
+                    pass
+            retry_locked(attempt)
+
+        errors = run_concurrently(checkout, self.THREADS)
+
+        self.assertEqual(errors, [])
+        self.book.refresh_from_db()
+        self.assertEqual(len(issued), 3)
+        self.assertEqual(self.book.number_in_stock, 0)
+        self.assertEqual(Issue.objects.filter(book=self.book).count(), 3)
+
+    def test_concurrent_returns_restock_once(self):
+        issue = issue_copy(Issue(reader=self.readers[0], book_id=self.book.pk, due_date=date(2099, 1, 1)))
+        returned = []
+
+        def give_back(i):
+            if retry_locked(lambda: return_copy(Issue.objects.get(pk=issue.pk))):
+                returned.append(i)
+
+        errors = run_concurrently(give_back, self.THREADS)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(returned), 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.number_in_stock, 3)
+
+    def test_mixed_checkouts_and_returns_do_not_drift(self):
+        self.book.number_in_stock = 5
+        self.book.save()
+        open_issues = [
+            issue_copy(Issue(reader=self.readers[i], book_id=self.book.pk, due_date=date(2099, 1, 1)))
+            for i in range(3)
+        ]
+
+        def work(i):
+            if i < len(open_issues):
+                retry_locked(lambda: return_copy(Issue.objects.get(pk=open_issues[i].pk)))
+            else:
+                def attempt():
+                    try:
+                        issue_copy(Issue(reader=self.readers[i], book_id=self.book.pk, due_date=date(2099, 1, 1)))
+                    except OutOfStock:
+                        pass
+                retry_locked(attempt)
+
+        errors = run_concurrently(work, self.THREADS)
+
+        self.assertEqual(errors, [])
+        self.book.refresh_from_db()
+        still_out = Issue.objects.filter(book=self.book, returned_date__isnull=True).count()
+        self.assertGreaterEqual(self.book.number_in_stock, 0)
+        self.assertEqual(self.book.number_in_stock + still_out, 5)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'query plans are checked with SQLite EXPLAIN QUERY PLAN')
+class HotQueryPlanTests(TestCase):
+    """The SQL the hot views (and the batch commands) actually run must be served by an index.
+
+    Each test captures the statements run while serving a page or command
+    and checks their EXPLAIN QUERY PLAN. A plan line "SCAN <table>" without
+    "USING ... INDEX" means a full table scan; the keyset-paginated lists must
+    also not need a temp B-tree to sort.
+    """
+    # tiny lookup tables that are read whole on purpose
+    SCAN_ALLOWED = {'lib_category'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = date.today()
+        cls.admin = Admin.objects.create(admin_id='A1', name='Admin')
+        cls.reader = make_reader(1)
+        for n in range(1, 4):
+            book = make_book(n)
+            issue = Issue.objects.create(reader=cls.reader, book=book, due_date=cls.today + timedelta(days=n - 2))
+            Fine.objects.create(issue=issue, amount=10)
+            Notification.objects.create(reader=cls.reader, issue=issue, notification_type='overdue',
+                                        title=f'Overdue {n}', message='Please return it.')
+            IssueRequest.objects.create(reader=make_reader(10 + n), book=book)
+
+    def setUp(self):
+        cache.clear()  # plan the queries, not cache hits
+
+    def captured(self, action):
+        """SQL of the lib_* statements run by action()."""
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            action()
+        return [query['sql'] for query in ctx.captured_queries if 'lib_' in query['sql']]
+
+    def page_sql(self, url_name, params=None, **session):
+        login_session(self.client, **session)
+
+        def get():
+            self.assertEqual(self.client.get(reverse(url_name), params or {}).status_code, 200)
+        return self.captured(get)
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return '\n'.join(row[3] for row in cursor.fetchall())
+
+    def assertNoFullScan(self, statements):
+        self.assertTrue(statements, "no statements captured")
+        for sql in statements:
+            plan = self.plan(sql)
+            full_scans = [line for line in plan.splitlines()
+                          if re.search(r'\bSCAN \w+', line) and 'INDEX' not in line
+                          and line.split()[1] not in self.SCAN_ALLOWED]
+            self.assertEqual(full_scans, [], f"full table scan in plan of\n{sql}\n{plan}")
+
+    def assertIndexedOrder(self, statements):
+        self.assertNoFullScan(statements)
+        for sql in statements:
+            if 'ORDER BY' in sql:
+                plan = self.plan(sql)
+                self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan, f"sort not served by an index:\n{sql}\n{plan}")
+
+    def test_overdue_books(self):
+        self.assertIndexedOrder(self.page_sql('overdue_books', admin_id=self.admin.pk))
+
+    def test_due_notification_and_fine_commands(self):
+        from io import StringIO
+        from django.core.management import call_command
+        for command in ('send_due_notifications', 'accrue_fines'):
+            with self.subTest(command=command):
+                self.assertNoFullScan(self.captured(lambda: call_command(command, stdout=StringIO())))
+
+    def test_pending_issue_requests(self):
+        statements = self.page_sql('admin_issue_requests', admin_id=self.admin.pk)
+        self.assertNoFullScan(statements)
+        # the hold list is sorted by book name (a join); the pending list must come off an index
+        self.assertIndexedOrder([sql for sql in statements if 'FROM "lib_issuerequest"' in sql])
+
+    def test_reader_pages(self):
+        self.assertIndexedOrder(self.page_sql('reader_notifications', reader_id=self.reader.pk))
+        for url_name in ('reader_dashboard', 'reader_issued_books', 'reader_view_books'):
+            with self.subTest(url_name=url_name):
+                self.assertNoFullScan(self.page_sql(url_name, reader_id=self.reader.pk))
+
+    def test_catalog_pages(self):
+        self.assertIndexedOrder(self.page_sql('public_books'))
+
+    def test_admin_list_pages(self):
+        # first and later pages of the keyset-paginated admin lists
+        from .pagination import encode_cursor
+        lists = [
+            ('view_books', ['Book 1', 1]), ('view_readers', ['Reader 1', 1]), ('view_issues', [self.today, 1]),
+            ('view_fines', [self.today, 1]), ('overdue_books', [self.today, 1]),
+        ]
+        for url_name, cursor in lists:
+            for params in ({}, {'cursor': encode_cursor(cursor)}):
+                with self.subTest(url_name=url_name, **params):
+                    self.assertIndexedOrder(self.page_sql(url_name, params, admin_id=self.admin.pk))
+
+    def test_plan_check_catches_full_scans(self):
+        statements = self.captured(lambda: list(Notification.objects.filter(title='x')))
+        with self.assertRaises(AssertionError):
+            self.assertNoFullScan(statements)
+
+
+def assert_within_query_budget(test_case, client, url_name, *args, **kwargs):
+    """GET `url_name` and fail if it ran over its QUERY_BUDGETS entry or repeated a query shape (N+1).
+
+    The counts come from QueryBudgetMiddleware (request.query_stats). Returns the response.
+    """
+    response = client.get(reverse(url_name, args=args, kwargs=kwargs))
+    test_case.assertLess(response.status_code, 400, f"{url_name} returned {response.status_code}")
+    stats = response.wsgi_request.query_stats
+    test_case.assertEqual(stats.problems(url_name), [], f"{url_name} ran {stats.count} queries")
+    return response
+
+
+def login_session(client, **values):
+    """Store `values` in the test client's session, whichever SESSION_PROFILE is active."""
+    session = client.session
+    session.update(values)
+    session.save()
+    # with signed cookies the cookie value *is* the session, so it changes on every save
+    client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+
+class ViewQueryBudgetTests(TestCase):
+    """Every page in lib/urls.py must stay within its query budget with a realistic amount of data."""
+    ROWS = 12  # comfortably above QUERY_N_PLUS_ONE_THRESHOLD
+
+    # every named URL in lib/urls.py is either a page below (url name -> (who is logged in, argument))
+    PAGES = {
+        'home': (None, None), 'public_books': (None, None), 'book_details': (None, 'book'),
+        'book_description': (None, 'book'), 'register_reader': (None, None), 'login_reader': (None, None),
+        'register_admin': (None, None), 'login_admin': (None, None),
+
+        'admin_dashboard': ('admin', None), 'admin_profile': ('admin', None), 'edit_admin_profile': ('admin', None),
+        'change_admin_password': ('admin', None), 'view_books': ('admin', None), 'add_book': ('admin', None),
+        'admin_book_details': ('admin', 'book'), 'edit_book': ('admin', 'book'), 'delete_book': ('admin', 'book'),
+        'book_analytics_api': ('admin', 'book'), 'view_readers': ('admin', None),
+        'reader_details': ('admin', 'reader'), 'edit_reader': ('admin', 'reader'),
+        'delete_reader': ('admin', 'reader'), 'issue_book': ('admin', None), 'view_issues': ('admin', None),
+        'return_book': ('admin', 'issue'), 'overdue_books': ('admin', None), 'view_fines': ('admin', None),
+        'pay_fine': ('admin', 'fine'), 'admin_issue_requests': ('admin', None), 'view_categories': ('admin', None),
+        'add_category': ('admin', None), 'edit_category': ('admin', 'category'), 'ajax_search_books': ('admin', None),
+
+        'reader_dashboard': ('reader', None), 'reader_profile': ('reader', None), 'edit_profile': ('reader', None),
+        'change_password': ('reader', None), 'reader_view_books': ('reader', None),
+        'reader_book_detail': ('reader', 'book'), 'reader_issued_books': ('reader', None),
+        'reader_notifications': ('reader', None),
+    }
+    # ... or an action: POST-only, or a GET that changes data, so there is no page to measure
+    ACTIONS = {
+        'logout_reader', 'logout_admin', 'rate_book', 'issue_request', 'mark_all_notifications_read',
+        'desk_scan_batch', 'bulk_issue_requests', 'approve_request', 'reject_request', 'delete_category',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Fiction')
+        cls.admin = Admin.objects.create(admin_id='A1', name='Admin')
+        cls.books = [
+            Book.objects.create(name=f'Book {i}', isbn=f'97800000000{i:02d}', author=f'Author {i}',
+                                category=cls.category, number_in_stock=5)
+            for i in range(cls.ROWS)
+        ]
+        cls.reader = Reader.objects.create(reader_id='R0', name='Reader 0', date_of_birth=date(2000, 1, 1),
+                                           phone_number='9800000000', address='Kathmandu')
+        past = date.today() - timedelta(days=40)
+        for i, book in enumerate(cls.books):
+            reader = Reader.objects.create(reader_id=f'R{i + 1}', name=f'Reader {i + 1}', date_of_birth=date(2000, 1, 1),
+                                           phone_number=f'98100000{i:02d}', address='Kathmandu')
+            issue = Issue.objects.create(reader=cls.reader, book=book, due_date=past + timedelta(days=14))
+            Issue.objects.filter(pk=issue.pk).update(issued_date=past)
+            Fine.objects.create(issue=issue, amount=10)
+            IssueRequest.objects.create(reader=reader, book=book)
+            Notification.objects.create(reader=cls.reader, issue=issue, notification_type='overdue',
+                                        title=f'Overdue {i}', message='Please return it.')
+
+    def setUp(self):
+        cache.clear()  # measure the uncached catalog pages
+
+    def test_every_named_url_is_covered(self):
+        from .urls import urlpatterns
+        names = {pattern.name for pattern in urlpatterns if pattern.name}
+        self.assertEqual(names - self.PAGES.keys() - self.ACTIONS, set(), "add new URLs to PAGES or ACTIONS")
+        self.assertEqual((self.PAGES.keys() | self.ACTIONS) - names, set())
+
+    def test_pages(self):
+        issue = Issue.objects.filter(reader=self.reader).first()
+        args = {
+            None: (), 'book': (self.books[0].pk,), 'reader': (self.reader.pk,), 'issue': (issue.pk,),
+            'fine': (issue.fine.pk,), 'category': (self.category.pk,),
+        }
+        sessions = {None: {}, 'admin': {'admin_id': self.admin.pk}, 'reader': {'reader_id': self.reader.pk}}
+        for url_name, (role, arg) in self.PAGES.items():
+            with self.subTest(url_name=url_name):
+                self.client.cookies.clear()
+                cache.clear()
+                login_session(self.client, **sessions[role])
+                response = assert_within_query_budget(self, self.client, url_name, *args[arg])
+                self.assertEqual(response.status_code, 200)  # the page itself, not a login redirect
+
+    def test_detector_flags_n_plus_one(self):
+        from .middleware import track_queries
+        with track_queries() as stats:
+            for issue in Issue.objects.all():
+                issue.book.name
+        self.assertTrue(stats.repeated_shapes())
+
+
+class KeysetPaginationTests(TestCase):
+    NAMES = ['Cy', 'Ann', 'Bob', 'Ann', 'Cy', 'Ann', 'Bob']  # ties on the sort key
+
+    def setUp(self):
+        self.readers = [make_reader(i, name=name) for i, name in enumerate(self.NAMES, 1)]
+        login_session(self.client, admin_id=Admin.objects.create(admin_id='A1', name='Admin').pk)
+
+    def walk(self, limit):
+        seen, cursor = [], None
+        while True:
+            params = {'limit': limit, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get(reverse('view_readers'), params)
+            page = list(response.context['readers'])
+            self.assertLessEqual(len(page), limit)
+            self.assertEqual(response.context['pager']['is_first_page'], cursor is None)
+            seen.extend(page)
+            cursor = response.context['pager']['next_cursor']
+            if cursor is None:
+                return seen
+
+    def test_pages_cover_every_row_once_in_order(self):
+        expected = sorted(self.readers, key=lambda reader: (reader.name, reader.pk))
+        for limit in (1, 2, 3, len(self.NAMES), 50):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.walk(limit), expected)
+
+    def test_bad_cursors_are_rejected(self):
+        from .pagination import InvalidCursor, encode_cursor, keyset_page
+        bad = {
+            'garbage': '!!not a cursor!!',
+            'not json': encode_cursor([]) + 'x%%',
+            'too short': encode_cursor(['Ann']),
+            'wrong type': encode_cursor(['Ann', 'x']),
+            'null': encode_cursor(['Ann', None]),
+            'nested': encode_cursor([{'name': 'Ann'}, 1]),
+        }
+        for label, token in bad.items():
+            with self.subTest(label):
+                with self.assertRaises(InvalidCursor):
+                    keyset_page(Reader.objects.all(), ['name', 'pk'], token, 2)
+                # the admin lists start over at the first page
+                response = self.client.get(reverse('view_readers'), {'cursor': token, 'limit': 2})
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.context['pager']['is_first_page'])
+                self.assertEqual([reader.name for reader in response.context['readers']], ['Ann', 'Ann'])
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.book = Book.objects.create(name='Dune', isbn='9780441013593', author='Frank Herbert', number_in_stock=2)
+
+    def test_cached_until_catalog_changes(self):
+        from .middleware import track_queries
+        self.client.get(reverse('public_books'))
+        with track_queries() as stats:
+            response = self.client.get(reverse('public_books'))
+        self.assertContains(response, 'Dune')
+        self.assertFalse([shape for shape in stats.shapes if 'lib_book' in shape])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.name = 'Dune Messiah'
+            self.book.save()
+        self.assertContains(self.client.get(reverse('public_books')), 'Dune Messiah')
+
+
+    def test_pages_fresh_after_stock_and_rating_writes(self):
+        from decimal import Decimal
+        from django.test import Client
+        from .ratings import set_reader_rating
+        reader = make_reader(1)
+        admin = Admin.objects.create(admin_id='A1', name='Admin')
+        clients = {'anonymous': Client(), 'admin': Client(), 'reader': Client()}
+        login_session(clients['admin'], admin_id=admin.pk)
+        login_session(clients['reader'], reader_id=reader.pk)
+
+        def from_context(role, url_name):
+            response = clients[role].get(reverse(url_name))
+            book = next(b for b in response.context['books'] if b.pk == self.book.pk)
+            return book.number_in_stock, book.reader_rating_avg
+
+        def from_search():
+            response = clients['anonymous'].get(reverse('ajax_search_books'), {'fields': 'stock,avg_reader_rating'})
+            book = next(b for b in response.json()['books'] if b['pk'] == self.book.pk)
+            return book['stock'], Decimal(str(book['avg_reader_rating'])) if self.book.reader_rating_count else None
+
+        def snapshot():
+            self.book.refresh_from_db()
+            return {
+                'home': from_context('anonymous', 'home'),
+                'view_books': from_context('admin', 'view_books'),
+                'reader_view_books': from_context('reader', 'reader_view_books'),
+                'ajax_search_books': from_search(),
+            }
+
+        self.assertEqual(set(snapshot().values()), {(2, None)})  # now cached
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(reserve_copy(self.book.pk))
+        self.assertEqual(set(snapshot().values()), {(1, None)})
+        with self.captureOnCommitCallbacks(execute=True):
+            set_reader_rating(self.book, reader, 3)
+        self.assertEqual(set(snapshot().values()), {(1, Decimal('3'))})
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(name='Dune', isbn='9780441013593', author='Frank Herbert', number_in_stock=2)
+
+    def test_analytics_api_not_modified_until_book_or_analytics_change(self):
+        from .analytics import record_book_issuance
+        from .middleware import track_queries
+        url = reverse('book_analytics_api', args=[self.book.pk])
+        etag = self.client.get(url)['ETag']
+        with track_queries() as stats:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(stats.count, 1)
+
+        record_book_issuance(self.book)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get(url)['ETag']
+        self.assertTrue(reserve_copy(self.book.pk))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_analytics_window_bounds(self):
+        url = reverse('book_analytics_api', args=[self.book.pk])
+        for days in ('0', '-5', '3651', '1000000000'):
+            with self.subTest(days=days):
+                self.assertEqual(self.client.get(url, {'days': days}).status_code, 400)
+        response = self.client.get(url, {'days': '3650'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['granularity'], 'monthly')
+
+    def test_rebuild_changes_analytics_etag(self):
+        from .analytics import rebuild_issuance_records
+        url = reverse('book_analytics_api', args=[self.book.pk])
+        etag = self.client.get(url)['ETag']
+        Issue.objects.create(reader=make_reader(1), book=self.book, due_date=date.today() + timedelta(days=14))
+        rebuild_issuance_records()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_issued'], 1)
+
+    def test_book_details_revalidates_when_popular_pool_changes(self):
+        from .popularity import invalidate_pool
+        url = reverse('book_details', args=[self.book.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        invalidate_pool()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_book_description_ignores_popular_pool(self):
+        from .middleware import track_queries
+        from .popularity import invalidate_pool
+        url = reverse('book_description', args=[self.book.pk])
+        etag = self.client.get(url)['ETag']
+        invalidate_pool()
+        with track_queries() as stats:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(stats.count, 1)  # the Book version lookup, no pool refresh
+
+    def test_book_details_etag_depends_on_viewer(self):
+        url = reverse('book_details', args=[self.book.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        reader = Reader.objects.create(reader_id='R1', name='Reader', date_of_birth=date(2000, 1, 1),
+                                       phone_number='9800000001', address='Kathmandu')
+        login_session(self.client, reader_id=reader.pk)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SQLiteCacheTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from .cache_backends import SQLiteCache
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = f'{self.dir.name}/cache.sqlite3'
+        self.cache = SQLiteCache(self.path, {'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_INTERVAL': 1}})
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_shared_between_instances(self):
+        from .cache_backends import SQLiteCache
+        other = SQLiteCache(self.path, {})
+        self.cache.set('version', 1, None)
+        self.assertEqual(other.incr('version'), 2)
+        self.assertEqual(self.cache.get('version'), 2)
+        self.cache.set('book', {'name': 'Dune'})
+        self.assertEqual(other.get('book'), {'name': 'Dune'})
+        with self.assertRaises(ValueError):
+            other.incr('missing')
+
+    def test_ttl_and_add(self):
+        self.cache.set('gone', 'x', -1)
+        self.assertIsNone(self.cache.get('gone'))
+        self.assertTrue(self.cache.add('gone', 'y'))  # expired rows can be replaced
+        self.assertFalse(self.cache.add('gone', 'z'))
+        self.assertEqual(self.cache.get('gone'), 'y')
+
+    def test_lru_eviction(self):
+        self.cache.set('hot', 1)
+        for i in range(20):
+            self.cache._conn().execute("UPDATE cache SET accessed = accessed + 1000 WHERE key LIKE '%hot'")
+            self.cache.set(f'cold{i}', i)
+        self.assertEqual(self.cache.get('hot'), 1)
+        self.assertLessEqual(self.cache._conn().execute('SELECT COUNT(*) FROM cache').fetchone()[0], 10)
+
+
+class PrincipalTests(TestCase):
+    def setUp(self):
+        self.reader = Reader.objects.create(reader_id='R1', name='Reader', date_of_birth=date(2000, 1, 1),
+                                            phone_number='9800000001', address='Kathmandu')
+        login_session(self.client, reader_id=self.reader.pk)
+
+    def reader_queries(self, url_name):
+        from .middleware import track_queries
+        with track_queries() as stats:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return response, sum(n for shape, n in stats.shapes.items() if 'FROM "lib_reader"' in shape)
+
+    def test_principal_cached_until_profile_changes(self):
+        self.reader_queries('reader_profile')
+        _, queries = self.reader_queries('reader_profile')
+        self.assertEqual(queries, 0)
+
+        self.reader.name = 'Renamed Reader'
+        self.reader.save()
+        response, queries = self.reader_queries('reader_profile')
+        self.assertEqual(queries, 1)
+        self.assertContains(response, 'Renamed Reader')
+
+    def test_cached_reader_save_keeps_counters(self):
+        self.reader_queries('reader_profile')  # cache the reader
+        book = make_book(1)
+        self.client.post(reverse('issue_request', args=[book.pk]))
+        self.reader.refresh_from_db()
+        self.assertEqual(self.reader.pending_requests, 1)
+
+        self.client.post(reverse('change_password'), {'password': 'n3w-secret', 'confirm_password': 'n3w-secret'})
+        self.reader.refresh_from_db()
+        self.assertEqual(self.reader.password, 'n3w-secret')
+        self.assertEqual(self.reader.pending_requests, 1)
+
+    def test_login_required(self):
+        self.client.cookies.clear()  # no session, no reader
+        self.assertRedirects(self.client.get(reverse('reader_profile')), reverse('login_reader'),
+                             fetch_redirect_response=False)
+
+
+class PopularityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = make_reader(1)
+
+    def test_pool_ranks_rating_then_recent_issues(self):
+        from .analytics import _upsert_increments
+        from .popularity import compute_pool
+        plain = make_book(1, rating=4.8)
+        busy = make_book(2, rating=4.8)
+        top = make_book(3, rating=5.0)
+        make_book(4, rating=4.5)  # not above POPULAR_MIN_RATING
+        _upsert_increments({(busy.pk, date.today()): 3})
+        self.assertEqual(compute_pool(), [top, busy, plain])
+
+    def test_reader_average_counts_half(self):
+        from .popularity import compute_pool
+        from .ratings import set_reader_rating
+        liked, disliked = make_book(1, rating=4.6), make_book(2, rating=4.9)
+        set_reader_rating(disliked, self.reader, 1)
+        set_reader_rating(liked, self.reader, 5)
+        self.assertEqual(compute_pool(), [liked, disliked])
+
+    def test_pool_size_cut_off(self):
+        from unittest import mock
+        from .popularity import refresh_pool
+        books = [make_book(i, rating=4.6 + i / 10) for i in range(1, 4)]
+        with mock.patch('lib.popularity.POPULAR_POOL_SIZE', 2):
+            self.assertEqual(refresh_pool(), [books[2], books[1]])
+
+    def test_sample_comes_from_the_pool_without_the_excluded_book(self):
+        from .popularity import get_pool, sample_popular_books
+        books = [make_book(i, rating=4.9) for i in range(1, 6)]
+        make_book(6, rating=3.0)
+        for _ in range(20):
+            picks = sample_popular_books(limit=3, exclude_book_id=books[0].pk)
+            self.assertEqual(len(picks), 3)
+            self.assertEqual(len(set(picks)), 3)
+            self.assertNotIn(books[0], picks)
+            self.assertTrue(set(picks) <= set(books[1:]))
+        with self.assertNumQueries(0):
+            get_pool()
+
+    def test_book_and_rating_writes_invalidate_the_pool(self):
+        from .popularity import POOL_CACHE_KEY, refresh_pool
+        from .ratings import set_reader_rating
+        book = make_book(1, rating=4.9)
+        refresh_pool()
+        book.save()
+        self.assertIsNone(cache.get(POOL_CACHE_KEY))
+
+        refresh_pool()
+        with self.captureOnCommitCallbacks(execute=True):
+            rating = set_reader_rating(book, self.reader, 2)
+        self.assertIsNone(cache.get(POOL_CACHE_KEY))
+
+        refresh_pool()
+        with self.captureOnCommitCallbacks(execute=True):
+            rating.delete()
+        self.assertIsNone(cache.get(POOL_CACHE_KEY))
+
+
+class RatingStatsTests(TestCase):
+    def test_non_integer_mean(self):
+        from .ratings import recompute_rating_stats, set_reader_rating
+        book = make_book(1)
+        set_reader_rating(book, make_reader(1), 4)
+        set_reader_rating(book, make_reader(2), 5)
+        book.refresh_from_db()
+        self.assertEqual(book.reader_rating_count, 2)
+        self.assertEqual(float(book.reader_rating_avg), 4.5)
+
+        Book.objects.filter(pk=book.pk).update(reader_rating_avg=None)
+        recompute_rating_stats()
+        book.refresh_from_db()
+        self.assertEqual(float(book.reader_rating_avg), 4.5)
+
+    def test_edit_book_keeps_a_rating_that_lands_meanwhile(self):
+        from unittest import mock
+        from django.shortcuts import get_object_or_404
+        from .ratings import set_reader_rating
+        book = make_book(1)
+        reader = make_reader(1)
+        login_session(self.client, admin_id=Admin.objects.create(admin_id='A1', name='Admin').pk)
+
+        def load_then_rate(*args, **kwargs):
+            loaded = get_object_or_404(*args, **kwargs)
+            set_reader_rating(book, reader, 5)  # another request, after the form's copy was loaded
+            return loaded
+
+        with mock.patch('lib.views.get_object_or_404', side_effect=load_then_rate):
+            self.client.post(reverse('edit_book', args=[book.pk]), {
+                'name': 'Renamed', 'isbn': book.isbn, 'author': book.author,
+                'category': Category.objects.create(name='Fiction').pk, 'number_in_stock': 1,
+                'description': '', 'rating': '4.0',
+            })
+        book.refresh_from_db()
+        self.assertEqual(book.name, 'Renamed')
+        self.assertEqual((book.reader_rating_count, float(book.reader_rating_avg)), (1, 5.0))
+
+
+class DuplicateLoanTests(TestCase):
+    def setUp(self):
+        self.admin = Admin.objects.create(admin_id='A1', name='Admin')
+        self.reader = make_reader(1, active_loans=1, pending_requests=1)
+        self.book = make_book(1, number_in_stock=0)
+        Issue.objects.create(reader=self.reader, book=self.book, due_date=date.today() + timedelta(days=14))
+        login_session(self.client, admin_id=self.admin.pk)
+
+    def test_approve_rejects_duplicate_before_holding(self):
+        req = IssueRequest.objects.create(reader=self.reader, book=self.book)
+        self.client.get(reverse('approve_request', args=[req.pk]))
+        req.refresh_from_db()
+        self.assertTrue(req.rejected)
+        self.assertEqual(Reader.objects.get(pk=self.reader.pk).pending_requests, 0)
+        self.assertFalse(Hold.objects.exists())
+        self.assertFalse(Notification.objects.filter(notification_type='hold_placed').exists())
+
+    def test_issue_book_rejects_duplicate(self):
+        response = self.client.post(reverse('issue_book'), {
+            'reader': self.reader.pk, 'book': self.book.pk,
+            'due_date': (date.today() + timedelta(days=14)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'already')
+        self.assertEqual(Issue.objects.count(), 1)
+
+
+class IssuanceAnalyticsTests(TestCase):
+    def setUp(self):
+        self.book = make_book(1)
+        self.day = date(2026, 3, 4)  # a Wednesday
+
+    def quantities(self):
+        from .models import BookIssuanceMonthly, BookIssuanceRecord, BookIssuanceWeekly
+        return [list(model.objects.values_list('quantity_issued', flat=True))
+                for model in (BookIssuanceRecord, BookIssuanceWeekly, BookIssuanceMonthly)]
+
+    def test_upsert_adds_to_every_granularity(self):
+        from .analytics import _upsert_increments
+        _upsert_increments({(self.book.pk, self.day): 2})
+        _upsert_increments({(self.book.pk, self.day): 1, (self.book.pk, self.day + timedelta(days=1)): 4})
+        self.assertEqual([sorted(q) for q in self.quantities()], [[3, 4], [7], [7]])
+        self.assertIsNotNone(Book.objects.get(pk=self.book.pk).analytics_updated_at)
+
+    def test_buffer_flushes_after_the_callers_commit(self):
+        from .analytics import IssuanceBuffer
+        buffer = IssuanceBuffer(max_events=2, max_age=3600)
+        try:
+            with self.captureOnCommitCallbacks() as callbacks:
+                buffer.add(self.book.pk, self.day)
+                buffer.add(self.book.pk, self.day)
+                buffer.add(self.book.pk, self.day)
+                self.assertEqual(self.quantities(), [[], [], []])
+            self.assertEqual(len(callbacks), 1)  # one flush scheduled, not one per event
+            callbacks[0]()
+            self.assertEqual(self.quantities(), [[3], [3], [3]])
+        finally:
+            buffer._timer.cancel()
+
+    def test_rebuild_matches_issue_history(self):
+        from .analytics import _upsert_increments, rebuild_issuance_records
+        from .models import BookIssuanceMonthly, BookIssuanceRecord
+        reader = make_reader(1)
+        days = [date(2026, 1, 30), date(2026, 1, 30), date(2026, 2, 2), date(2026, 4, 15)]
+        for day in days:
+            issue = Issue.objects.create(reader=reader, book=self.book, due_date=day + timedelta(days=14),
+                                         returned_date=day + timedelta(days=1))
+            Issue.objects.filter(pk=issue.pk).update(issued_date=day)
+        _upsert_increments({(self.book.pk, date(2026, 2, 2)): 7, (self.book.pk, date(2025, 12, 1)): 1})
+
+        self.assertEqual(rebuild_issuance_records(since=date(2026, 2, 1), until=date(2026, 2, 28)), 1)
+        self.assertEqual(BookIssuanceRecord.objects.get(date=date(2026, 2, 2)).quantity_issued, 1)
+        self.assertFalse(BookIssuanceRecord.objects.filter(date=date(2026, 1, 30)).exists())  # outside the range
+
+        self.assertEqual(rebuild_issuance_records(), 3)
+        self.assertEqual(dict(BookIssuanceRecord.objects.values_list('date', 'quantity_issued')),
+                         {date(2026, 1, 30): 2, date(2026, 2, 2): 1, date(2026, 4, 15): 1})
+        self.assertEqual(dict(BookIssuanceMonthly.objects.values_list('month_start', 'quantity_issued')),
+                         {date(2026, 1, 1): 2, date(2026, 2, 1): 1, date(2026, 4, 1): 1})
+
+    def test_rebuild_touches_only_changed_books(self):
+        from .analytics import rebuild_issuance_records
+        from .middleware import track_queries
+        other = make_book(2)
+        for book in (self.book, other):
+            issue = Issue.objects.create(reader=make_reader(book.pk), book=book, due_date=self.day,
+                                         returned_date=self.day)
+            Issue.objects.filter(pk=issue.pk).update(issued_date=self.day - timedelta(days=60))
+        rebuild_issuance_records()
+        Book.objects.update(analytics_updated_at=None)
+        Issue.objects.filter(book=self.book).update(issued_date=self.day - timedelta(days=30))
+
+        with track_queries() as stats:
+            rebuild_issuance_records(since=self.day - timedelta(days=90), until=self.day)
+        self.assertEqual(list(Book.objects.filter(analytics_updated_at__isnull=False)), [self.book])
+        touches = [shape for shape in stats.shapes if shape.startswith('UPDATE "lib_book"')]
+        self.assertEqual(sum(stats.shapes[shape] for shape in touches), 1)  # once, not once per month
+
+
+class IssuanceBufferTimerTests(TransactionTestCase):
+    def test_timer_flushes_idle_buffer(self):
+        from .analytics import IssuanceBuffer
+        from .models import BookIssuanceRecord
+        book = make_book(1)
+        buffer = IssuanceBuffer(max_events=100, max_age=0.05)
+        buffer.add(book.pk, date.today())
+        timer = buffer._timer
+        timer.join(5)
+        self.assertFalse(timer.is_alive())
+        self.assertEqual(BookIssuanceRecord.objects.get(book=book).quantity_issued, 1)
+        self.assertIsNone(buffer._timer)
+
+
+class ServerTimingTests(TestCase):
+    def test_breakdown_counts_template_queries_once(self):
+        from .middleware import QueryStats, RequestTiming
+        queries = QueryStats()
+        queries.duration = 0.030  # 5ms in middleware, 25ms in the view, 10ms of that while rendering
+        timing = RequestTiming(queries)
+        timing.view, timing.view_db = 0.100, 0.025
+        timing.template, timing.template_db = 0.040, 0.010
+        phases = timing.breakdown(0.120)
+        self.assertEqual({name: round(ms, 6) for name, ms in phases.items()},
+                         {'db': 30.0, 'tpl': 30.0, 'view': 45.0, 'mw': 15.0, 'total': 120.0})
+
+    def test_header_and_log_line(self):
+        import json
+        from unittest import mock
+        make_book(1)
+        cache.clear()  # time a real render, not a cached page
+        with mock.patch('lib.middleware.SERVER_TIMING_HEADER', True), \
+                self.assertLogs('lib.timing', 'INFO') as logs:
+            response = self.client.get(reverse('public_books'))
+        header = dict(part.split(';')[0:2] for part in response['Server-Timing'].split(', '))
+        self.assertEqual(list(header), ['db', 'tpl', 'view', 'mw', 'total'])
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line['url_name'], 'public_books')
+        self.assertEqual(line['status'], 200)
+        self.assertGreater(line['queries'], 0)
+        parts = sum(line[f'{name}_ms'] for name in ('db', 'tpl', 'view', 'mw'))
+        self.assertAlmostEqual(parts, line['total_ms'], delta=0.5)
+
+
+class HoldTests(TestCase):
+    def setUp(self):
+        self.admin = Admin.objects.create(admin_id='A1', name='Admin')
+        self.book = make_book(1, number_in_stock=0)
+        self.readers = [make_reader(i, pending_requests=1) for i in range(1, 4)]
+        self.requests = [IssueRequest.objects.create(reader=r, book=self.book) for r in self.readers]
+        login_session(self.client, admin_id=self.admin.pk)
+        for req in self.requests:
+            self.client.get(reverse('approve_request', args=[req.pk]))
+
+    def waiting(self):
+        return list(Hold.objects.filter(status=Hold.WAITING).order_by('created_at', 'id')
+                    .values_list('reader_id', flat=True))
+
+    def test_out_of_stock_requests_queue_in_order(self):
+        from .holds import queue_position
+        self.assertEqual(self.waiting(), [r.pk for r in self.readers])
+        self.assertEqual([queue_position(h) for h in Hold.objects.order_by('id')], [1, 2, 3])
+        self.assertEqual(Notification.objects.filter(notification_type='hold_placed').count(), 3)
+        self.assertFalse(IssueRequest.objects.filter(approved=True).exists())
+
+    def test_return_allocates_head_of_queue(self):
+        other = make_reader(9, active_loans=1)
+        issue = Issue.objects.create(reader=other, book=self.book, due_date=date.today() + timedelta(days=14))
+        self.client.post(reverse('return_book', args=[issue.pk]))
+
+        first = self.readers[0]
+        self.assertTrue(Issue.objects.filter(reader=first, book=self.book, returned_date__isnull=True).exists())
+        self.assertTrue(IssueRequest.objects.get(pk=self.requests[0].pk).approved)
+        self.assertEqual(Hold.objects.get(reader=first).status, Hold.FULFILLED)
+        self.assertTrue(Notification.objects.filter(reader=first, notification_type='hold_allocated').exists())
+        self.assertEqual(self.waiting(), [r.pk for r in self.readers[1:]])
+        self.assertEqual(Book.objects.get(pk=self.book.pk).number_in_stock, 0)
+
+    def test_reject_cancels_hold(self):
+        self.client.get(reverse('reject_request', args=[self.requests[1].pk]))
+        self.assertEqual(Hold.objects.get(reader=self.readers[1]).status, Hold.CANCELLED)
+        self.assertEqual(self.waiting(), [self.readers[0].pk, self.readers[2].pk])
+
+    def test_over_quota_reader_is_skipped_and_notified(self):
+        from .circulation import MAX_ISSUED_PER_READER
+        from .holds import allocate_next_hold
+        Reader.objects.filter(pk=self.readers[0].pk).update(active_loans=MAX_ISSUED_PER_READER)
+        Book.objects.filter(pk=self.book.pk).update(number_in_stock=1)
+
+        issue = allocate_next_hold(self.book.pk)
+        self.assertEqual(issue.reader_id, self.readers[1].pk)
+        self.assertEqual(Hold.objects.get(reader=self.readers[0]).status, Hold.CANCELLED)
+        self.assertTrue(IssueRequest.objects.get(pk=self.requests[0].pk).rejected)
+        self.assertTrue(Notification.objects.filter(reader=self.readers[0], notification_type='hold_cancelled').exists())
+
+    def test_stock_increase_in_edit_book_allocates(self):
+        self.client.post(reverse('edit_book', args=[self.book.pk]), {
+            'name': self.book.name, 'isbn': self.book.isbn, 'author': self.book.author,
+            'category': Category.objects.create(name='Fiction').pk, 'number_in_stock': 2, 'description': '', 'rating': '4.0',
+        })
+        self.assertEqual(Issue.objects.filter(book=self.book).count(), 2)
+        self.assertEqual(self.waiting(), [self.readers[2].pk])
+        self.assertEqual(Book.objects.get(pk=self.book.pk).number_in_stock, 0)
+
+
+class DeskScanTests(TestCase):
+    def setUp(self):
+        self.admin = Admin.objects.create(admin_id='A1', name='Admin')
+        self.reader = make_reader(1)
+        self.books = [make_book(1, isbn='978-0-441-0'), make_book(2, number_in_stock=0), make_book(3)]
+        login_session(self.client, admin_id=self.admin.pk)
+
+    def scan(self, action, isbns, reader_id='R1'):
+        import json
+        return self.client.post(reverse('desk_scan_batch'), json.dumps(
+            {'reader_id': reader_id, 'action': action, 'isbns': isbns}), content_type='application/json')
+
+    def test_isbns_are_stored_normalized(self):
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).isbn, '97804410')
+
+    def test_issue_batch_outcomes(self):
+        Issue.objects.create(reader=self.reader, book=self.books[2], due_date=date.today() + timedelta(days=14))
+        response = self.scan('issue', ['978 0441 0', '97804410', self.books[1].isbn, self.books[2].isbn, '123'])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], ['issued', 'failed', 'failed', 'failed', 'failed'])
+        self.assertEqual([r['message'] for r in results[1:]], [
+            'Scanned twice in this batch.', "'Book 2' is out of stock!",
+            "Reader 1 already has 'Book 3' issued.", 'No book with this ISBN.',
+        ])
+        self.assertEqual(Issue.objects.filter(reader=self.reader, returned_date__isnull=True).count(), 2)
+        self.assertEqual(Reader.objects.get(pk=self.reader.pk).active_loans, 1)
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).number_in_stock, 0)
+
+    def test_return_batch_outcomes(self):
+        self.scan('issue', [self.books[0].isbn])
+        results = self.scan('return', ['978-0441-0', '97804410', self.books[2].isbn]).json()['results']
+        self.assertEqual([r['status'] for r in results], ['returned', 'failed', 'failed'])
+        self.assertEqual(results[1]['message'], 'Scanned twice in this batch.')
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).number_in_stock, 1)
+        self.assertEqual(Reader.objects.get(pk=self.reader.pk).active_loans, 0)
+
+    def test_isbn_migration_updates_search_index(self):
+        import importlib
+        from types import SimpleNamespace
+        from django.apps import apps
+        from .search import index_book, search_books
+        migration = importlib.import_module('lib.migrations.0029_normalize_book_isbns')
+        Book.objects.filter(pk=self.books[0].pk).update(isbn='978-0-441-0')
+        Book.objects.filter(pk=self.books[1].pk).update(isbn='978-0000000003')  # Book 3's ISBN once normalized
+        for book in Book.objects.filter(pk__in=[self.books[0].pk, self.books[1].pk]):
+            index_book(book)
+        with self.assertLogs('lib.migrations', 'WARNING') as logs:
+            migration.normalize_isbns(apps, SimpleNamespace(connection=connection))
+        self.assertIn('belongs to another book', logs.output[0])
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).isbn, '97804410')
+        self.assertEqual(Book.objects.get(pk=self.books[1].pk).isbn, '978-0000000003')
+        self.assertEqual(list(search_books(Book.objects.all(), '97804410', columns=['isbn'])), [self.books[0]])
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.scan('issue', []).status_code, 400)
+        self.assertEqual(self.scan('renew', ['1']).status_code, 400)
+        self.assertEqual(self.scan('issue', ['1'], reader_id='nobody').status_code, 404)
+        self.client.cookies.clear()
+        self.assertEqual(self.scan('issue', ['1']).status_code, 403)
+
+
+class BulkRequestTests(TestCase):
+    def setUp(self):
+        from .circulation import MAX_ISSUED_PER_READER
+        admin = Admin.objects.create(admin_id='A1', name='Admin')
+        login_session(self.client, admin_id=admin.pk)
+        self.book, self.gone = make_book(1, number_in_stock=2), make_book(2, number_in_stock=0)
+        self.fine = make_reader(1, pending_requests=1)
+        self.over = make_reader(2, active_loans=MAX_ISSUED_PER_READER, pending_requests=1)
+        self.has_it = make_reader(3, active_loans=1, pending_requests=1)
+        self.waits = make_reader(4, pending_requests=1)
+        Issue.objects.create(reader=self.has_it, book=self.book, due_date=date.today() + timedelta(days=14))
+        self.reqs = [
+            IssueRequest.objects.create(reader=self.fine, book=self.book),
+            IssueRequest.objects.create(reader=self.over, book=self.book),
+            IssueRequest.objects.create(reader=self.has_it, book=self.book),
+            IssueRequest.objects.create(reader=self.waits, book=self.gone),
+            IssueRequest.objects.create(reader=make_reader(5), book=self.book, rejected=True),
+        ]
+
+    def bulk(self, action, ids):
+        response = self.client.post(reverse('bulk_issue_requests'), {'action': action, 'request_ids': ids},
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_approve_mixed_batch(self):
+        results = self.bulk('approve', [req.pk for req in self.reqs] + [9999])
+        self.assertEqual([r['status'] for r in results],
+                         ['approved', 'rejected', 'rejected', 'held', 'skipped', 'skipped'])
+        self.assertIn('exceeds the limit', results[1]['message'])
+        self.assertIn("already has 'Book 1' issued", results[2]['message'])
+
+        self.assertTrue(Issue.objects.filter(reader=self.fine, book=self.book).exists())
+        self.assertEqual(Book.objects.get(pk=self.book.pk).number_in_stock, 1)
+        self.assertEqual(Hold.objects.get().reader, self.waits)
+        counters = dict(Reader.objects.values_list('pk', 'pending_requests'))
+        self.assertEqual([counters[r.pk] for r in (self.fine, self.over, self.has_it, self.waits)], [0, 0, 0, 1])
+        self.assertEqual(Reader.objects.get(pk=self.fine.pk).active_loans, 1)
+
+    def test_reject_batch_cancels_holds(self):
+        self.bulk('approve', [self.reqs[3].pk])
+        results = self.bulk('reject', [self.reqs[0].pk, self.reqs[3].pk, self.reqs[4].pk])
+        self.assertEqual([r['status'] for r in results], ['rejected', 'rejected', 'skipped'])
+        self.assertEqual(Hold.objects.get().status, Hold.CANCELLED)
+        self.assertEqual(Notification.objects.filter(notification_type='request_rejected').count(), 2)
+        self.assertEqual(Reader.objects.get(pk=self.waits.pk).pending_requests, 0)
+
+    def test_form_post_redirects_with_messages(self):
+        response = self.client.post(reverse('bulk_issue_requests'), {'action': 'approve', 'request_ids': [self.reqs[0].pk]})
+        self.assertRedirects(response, reverse('admin_issue_requests'), fetch_redirect_response=False)
+        self.assertEqual(self.client.post(reverse('bulk_issue_requests'), {'action': 'approve'},
+                                          HTTP_X_REQUESTED_WITH='XMLHttpRequest').status_code, 400)
+
+
+class QuotaCounterTests(TestCase):
+    def setUp(self):
+        admin = Admin.objects.create(admin_id='A1', name='Admin')
+        login_session(self.client, admin_id=admin.pk)
+        self.reader = make_reader(1)  # counters drifted: the request below is not counted
+        self.book = make_book(1)
+        self.req = IssueRequest.objects.create(reader=self.reader, book=self.book)
+
+    def test_drifted_counter_does_not_block_approval(self):
+        self.client.get(reverse('approve_request', args=[self.req.pk]))
+        self.assertTrue(IssueRequest.objects.get(pk=self.req.pk).approved)
+        reader = Reader.objects.get(pk=self.reader.pk)
+        self.assertEqual((reader.active_loans, reader.pending_requests), (1, 0))
+
+    def test_approval_is_all_or_nothing(self):
+        from unittest import mock
+        Reader.objects.filter(pk=self.reader.pk).update(pending_requests=1)
+        with mock.patch('lib.stock.change_counters', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.get(reverse('approve_request', args=[self.req.pk]))
+        self.assertFalse(IssueRequest.objects.get(pk=self.req.pk).approved)
+        self.assertEqual(Reader.objects.get(pk=self.reader.pk).pending_requests, 1)
+        self.assertFalse(Issue.objects.exists())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        from .autocomplete import index
+        cache.clear()
+        self.fiction, self.poetry = Category.objects.create(name='Fiction'), Category.objects.create(name='Poetry')
+        self.dune = make_book(1, name='Dune', author='Frank Herbert', category=self.fiction)
+        self.odes = make_book(2, name='Dune Odes', author='Ann Poet', category=self.poetry)
+        index.load()  # the index is per process; drop books left by other tests
+
+    def search(self, **params):
+        return self.client.get(reverse('ajax_search_books'), params)
+
+    def names(self, **params):
+        response = self.search(**params)
+        self.assertEqual(response.status_code, 200)
+        return [book['name'] for book in response.json()['books']]
+
+    def test_category_filter_and_validation(self):
+        self.assertEqual(self.names(q='dune', category=self.poetry.pk), ['Dune Odes'])
+        self.assertEqual(self.names(q='', category=self.fiction.pk), ['Dune'])
+        for params in ({'q': 'dune', 'category': 'poetry'}, {'q': '', 'category': '1.5'}):
+            with self.subTest(**params):
+                response = self.search(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], 'invalid category')
+        self.assertEqual(self.search(q='dune', cursor='garbage').json()['error'], 'invalid cursor')
+
+    def walk(self, **params):
+        names, cursor = [], None
+        while True:
+            payload = self.search(**params, limit=1, **({'cursor': cursor} if cursor else {})).json()
+            self.assertLessEqual(len(payload['books']), 1)
+            names.extend(book['name'] for book in payload['books'])
+            cursor = payload['next_cursor']
+            if cursor is None:
+                return names
+
+    def test_next_cursor_walks_every_result_once(self):
+        for i in range(3, 7):
+            make_book(i, name=f'Dune {i}')
+        make_book(7, name='Arrakis')
+        for q in ('dune', ''):  # autocomplete index / ORM path
+            with self.subTest(q=q):
+                everything = self.names(q=q)
+                self.assertEqual(self.walk(q=q), everything)
+                self.assertEqual(len(everything), len(set(everything)))
+                self.assertEqual(len(everything), 6 if q else 7)
+
+    def test_limit_is_clamped(self):
+        from unittest import mock
+        for i in range(3, 6):
+            make_book(i, name=f'Dune {i}')
+        with mock.patch('lib.views.AJAX_SEARCH_MAX_LIMIT', 2), mock.patch('lib.views.AJAX_SEARCH_DEFAULT_LIMIT', 3):
+            for q in ('dune', ''):
+                with self.subTest(q=q):
+                    self.assertEqual(len(self.names(q=q, limit=1000)), 2)
+                    self.assertEqual(len(self.names(q=q, limit=0)), 1)
+                    self.assertEqual(len(self.names(q=q, limit=-5)), 1)
+                    self.assertEqual(len(self.names(q=q, limit='many')), 3)
+
+    def test_fields_restrict_the_payload(self):
+        from .views import AJAX_SEARCH_FIELDS
+        books = self.search(q='dune', fields='name, stock,password').json()['books']
+        self.assertEqual([set(book) for book in books], [{'pk', 'name', 'stock'}] * 2)
+        books = self.search(q='', fields='bogus').json()['books']
+        self.assertEqual([set(book) for book in books], [{'pk'}] * 2)
+        full = self.search(q='dune').json()['books'][0]
+        self.assertEqual(set(full), set(AJAX_SEARCH_FIELDS))
+
+    def fts(self, query):
+        from .search import fts_available, search_books
+        self.assertTrue(fts_available())
+        return [book.name for book in search_books(Book.objects.all(), query)]
+
+    def test_full_text_index_follows_book_changes(self):
+        self.assertEqual(self.fts('herbert'), ['Dune'])
+        created = make_book(3, name='Children of Dune', author='Frank Herbert')
+        self.assertEqual(sorted(self.fts('herbert')), ['Children of Dune', 'Dune'])
+
+        created.name = 'God Emperor of Dune'
+        created.save()
+        self.assertEqual(self.fts('children'), [])
+        self.assertEqual(self.fts('emperor'), ['God Emperor of Dune'])
+
+        created.delete()
+        self.assertEqual(self.fts('emperor'), [])
+        self.assertEqual(self.fts('herbert'), ['Dune'])
+
+    def test_full_text_index_follows_category_changes(self):
+        self.assertEqual(self.fts('poetry'), ['Dune Odes'])
+        self.poetry.name = 'Verse'
+        self.poetry.save()
+        self.assertEqual(self.fts('poetry'), [])
+        self.assertEqual(self.fts('verse'), ['Dune Odes'])
+
+        self.poetry.delete()
+        self.assertEqual(self.fts('verse'), [])
+        self.assertEqual(self.fts('odes'), ['Dune Odes'])
+
+    def test_autocomplete_tiers(self):
+        from .autocomplete import (TIER_AUTHOR_PREFIX, TIER_AUTHOR_SUBSTRING, TIER_FUZZY, TIER_NAME_PREFIX,
+                                   TIER_NAME_SUBSTRING, TIER_NAME_WORD, index)
+        potter = make_book(3, name='Harry Potter', author='J. K. Rowling')
+        harriet = make_book(4, name='Pottery Basics', author='Harriet Clay')
+
+        def tiers(query, **kwargs):
+            return [(tier, pk) for tier, _, pk in index.search(query, **kwargs)]
+
+        self.assertEqual(tiers('harr'), [(TIER_NAME_PREFIX, potter.pk), (TIER_AUTHOR_PREFIX, harriet.pk)])
+        self.assertEqual(tiers('potter'), [(TIER_NAME_PREFIX, harriet.pk), (TIER_NAME_WORD, potter.pk)])
+        self.assertEqual(tiers('otte'), [(TIER_NAME_SUBSTRING, potter.pk), (TIER_NAME_SUBSTRING, harriet.pk)])
+        self.assertEqual(tiers('owli'), [(TIER_AUTHOR_SUBSTRING, potter.pk)])
+        typos = tiers('hary poter')
+        self.assertEqual(typos[0], (TIER_FUZZY, potter.pk))
+        self.assertEqual({tier for tier, _ in typos}, {TIER_FUZZY})
+        self.assertEqual(tiers('harr', category_id=self.fiction.pk), [])
+
+    def test_text_queries_bypass_the_shared_cache(self):
+        from unittest import mock
+        with mock.patch('lib.views.cached_catalog', side_effect=AssertionError('cached')):
+            self.assertEqual(self.names(q='odes'), ['Dune Odes'])
+        with mock.patch('lib.views.cached_catalog', return_value={'books': [], 'next_cursor': None}) as cached:
+            self.assertEqual(self.names(q='', category=self.poetry.pk), [])
+        cached.assert_called_once()
+
+
+class FineAccrualTests(TestCase):
+    def setUp(self):
+        self.today = date(2026, 5, 20)
+        self.reader = make_reader(1)
+
+    def loan(self, n, overdue_days, **fields):
+        return Issue.objects.create(reader=self.reader, book=make_book(n),
+                                    due_date=self.today - timedelta(days=overdue_days), **fields)
+
+    def test_accrual(self):
+        from decimal import Decimal
+        from .fines import accrue_fines
+        late = self.loan(1, 5)
+        self.loan(2, -3)  # not due yet
+        returned = self.loan(3, 10, returned_date=self.today - timedelta(days=2))
+        kept = self.loan(4, 8, returned_date=self.today)
+        Fine.objects.create(issue=kept, amount=Decimal('12'))
+        paid = self.loan(5, 6)
+        Fine.objects.create(issue=paid, amount=Decimal('4'), paid=True)
+
+        created, updated = accrue_fines(today=self.today, rate=Decimal('2'))
+        self.assertEqual((created, updated), (1, 0))
+        self.assertEqual(set(Fine.objects.values_list('issue_id', flat=True)), {late.pk, kept.pk, paid.pk})
+        self.assertEqual(Fine.objects.get(issue=late).amount, Decimal('10'))
+
+        # the next night the open fine grows; returned and paid ones stay frozen
+        created, updated = accrue_fines(today=self.today + timedelta(days=3), rate=Decimal('2'))
+        self.assertEqual((created, updated), (0, 1))
+        self.assertEqual(Fine.objects.get(issue=late).amount, Decimal('16'))
+        self.assertEqual(Fine.objects.get(issue=late).calculated_date, self.today + timedelta(days=3))
+        self.assertEqual(Fine.objects.get(issue=kept).amount, Decimal('12'))
+        self.assertEqual(Fine.objects.get(issue=paid).amount, Decimal('4'))
+        self.assertFalse(Fine.objects.filter(issue=returned).exists())
+
+    def test_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        self.loan(1, 5)
+        out = StringIO()
+        call_command('accrue_fines', '--date', self.today.isoformat(), '--rate', '1.5', stdout=out)
+        self.assertIn('1 created, 0 updated', out.getvalue())
+        self.assertEqual(float(Fine.objects.get().amount), 7.5)
+
+    def test_command_rejects_bad_rates(self):
+        from django.core.management import CommandError, call_command
+        self.loan(1, 5)
+        for rate in ('-1', 'NaN', 'Infinity', 'two'):
+            with self.subTest(rate=rate), self.assertRaisesMessage(CommandError, f"Invalid rate '{rate}'"):
+                call_command('accrue_fines', '--rate', rate)
+        self.assertFalse(Fine.objects.exists())
+
+
+class DueNotificationTests(TestCase):
+    def test_rerun_creates_no_duplicates(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .notifications import DUE_SOON_DAYS
+        reader, today = make_reader(1), date.today()
+        for n, due_in, returned in [(1, DUE_SOON_DAYS, None), (2, -3, None), (3, -3, today), (4, 7, None)]:
+            Issue.objects.create(reader=reader, book=make_book(n), due_date=today + timedelta(days=due_in),
+                                 returned_date=returned)
+
+        outputs = []
+        for _ in range(2):
+            out = StringIO()
+            call_command('send_due_notifications', stdout=out)
+            outputs.append(out.getvalue())
+        self.assertIn('Created 1 due-soon and 1 overdue notifications.', outputs[0])
+        self.assertIn('Created 0 due-soon and 0 overdue notifications.', outputs[1])
+        self.assertEqual(sorted(Notification.objects.values_list('notification_type', 'issue__book__name')),
+                         [('due_soon', 'Book 1'), ('overdue', 'Book 2')])
+
+
+class SessionProfileTests(SimpleTestCase):
+    def load_settings(self, profile):
+        import runpy
+        from unittest import mock
+        with mock.patch.dict('os.environ', {'LIBRARY_SESSION_PROFILE': profile}):
+            return runpy.run_path(settings.BASE_DIR / 'library' / 'settings.py')
+
+    def test_known_profile_picks_its_engine(self):
+        self.assertEqual(self.load_settings('cookie')['SESSION_ENGINE'],
+                         'django.contrib.sessions.backends.signed_cookies')
+
+    def test_unknown_profile_is_rejected(self):
+        from django.core.exceptions import ImproperlyConfigured
+        with self.assertRaisesMessage(ImproperlyConfigured, 'choose one of: cached_db, cookie, db'):
+            self.load_settings('redis')
@@ -30,6 +30,7 @@ urlpatterns=[
     path('issues/', views.view_issues, name='view_issues'),
     path('issues/<int:pk>/return/', views.return_book, name='return_book'),
     path('issues/overdue/', views.overdue_books, name='overdue_books'),
+    path('issues/scan/', views.desk_scan_batch, name='desk_scan_batch'),
     #fine related
     path('fines/', views.view_fines, name='view_fines'),
     path('fines/<int:pk>/pay/', views.pay_fine, name='pay_fine'),
@@ -55,6 +56,7 @@ urlpatterns=[
     path('admin/profile/change-password/', views.change_admin_password, name='change_admin_password'),
     path('admin/logout/', views.logout_admin, name='logout_admin'),
     path('admin/issue-requests/', views.admin_issue_requests, name='admin_issue_requests'),
+    path('admin/issue-requests/bulk/', views.bulk_issue_requests, name='bulk_issue_requests'),
     path('admin/issue-requests/<int:request_id>/approve/', views.approve_request, name='approve_request'),
     path('admin/issue-requests/<int:request_id>/reject/', views.reject_request, name='reject_request'),
 
@@ -1,27 +1,49 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import HttpResponse, JsonResponse
 from .forms import BookForm,ReaderForm,IssueForm,ReaderRegisterForm, ReaderProfileForm, AdminProfileForm, PasswordChangeForm
-from .models import Book,Reader,Issue,Fine,IssueRequest,Admin,Category,Notification,BookIssuanceRecord, BookRating
-from django.db.models import Q, Count, Avg, Case, When, Value, F, IntegerField
+from .models import Book,Reader,Issue,Fine,IssueRequest,Admin,Category,Notification,BookIssuanceRecord, BookRating, Hold
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Count, Avg, Case, When, Value, F, IntegerField, Exists, OuterRef
+from .search import search_books
+from .autocomplete import index as autocomplete_index, normalize as normalize_query
+from .ratings import set_reader_rating
+from .popularity import sample_popular_books
+from .stock import OutOfStock, issue_copy, return_copy
+from .notifications import create_issue_notification
+from .holds import allocate_next_hold, cancel_holds, place_hold
+from .circulation import (
+    MAX_ISSUED_PER_READER, bulk_approve_requests, bulk_reject_requests, checkout_batch, close_request, loan_due_date,
+    return_batch,
+)
+from .quotas import change_counters, quota_used
+from .analytics import (
+    record_book_issuance, get_book_analytics_data, MAX_DAYS as ANALYTICS_MAX_DAYS, ROLLUPS as ANALYTICS_GRANULARITIES,
+)
+from .catalog_cache import cached_catalog, catalog_categories, catalog_context, viewer_role
+from .conditional import book_data_condition, book_description_condition, book_page_condition
+from .principals import admin_required, get_admin, get_reader, reader_required
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_filter, keyset_page, parse_limit
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.utils.timezone import now
 from django.contrib.auth.hashers import make_password, check_password
 from datetime import timedelta,date
 from django.contrib import messages
 from django.urls import reverse
 import json
+from bisect import bisect_right
 from django.conf import settings
 
-# maximum number of books a reader can have at once (including pending requests)
-MAX_ISSUED_PER_READER = getattr(settings, 'MAX_ISSUED_PER_READER', 5)
-
 
 
 
 def home(request):
-    categories = Category.objects.all()
+    # catalog data comes from the versioned catalog cache and is only loaded if the template uses it
+    categories = SimpleLazyObject(catalog_categories)
     # show a small selection of books on the homepage (e.g., latest or popular)
-    books = Book.objects.all().order_by('-id')[:6]
+    books = SimpleLazyObject(lambda: cached_catalog(
+        'home_books', (), lambda: list(Book.objects.select_related('category').order_by('-id')[:6])
+    ))
     return render(request, 'home.html', {
         'year': now().year,
         'categories': categories,
@@ -39,38 +61,32 @@ def public_books(request):
     q = request.GET.get('q', '').strip()
     category_id = request.GET.get('category', '').strip()
 
-    books = Book.objects.all()
-    if q:
-        books = books.filter(
-            Q(name__icontains=q) |
-            Q(author__icontains=q) |
-            Q(isbn__icontains=q) |
-            Q(category__name__icontains=q)
-        ).annotate(
-            # Prioritize: name match (0) > author match (1) > other matches (2)
-            match_priority=Case(
-                When(name__icontains=q, then=Value(0)),
-                When(author__icontains=q, then=Value(1)),
-                default=Value(2),
-                output_field=IntegerField()
-            )
-        ).order_by('match_priority', 'name')
-    else:
-        books = books.order_by('name')  # sorted alphabetically
-    
-    if category_id:
-        try:
-            cid = int(category_id)
-            books = books.filter(category_id=cid)
-        except ValueError:
-            pass
-
-    categories = Category.objects.all()
+    def load_books():
+        books = Book.objects.select_related('category')
+        if q:
+            # Full-text search ranked by bm25 (see lib/search.py)
+            books = search_books(books, q)
+        else:
+            books = books.order_by('name')  # sorted alphabetically
+
+        if category_id:
+            try:
+                cid = int(category_id)
+                books = books.filter(category_id=cid)
+            except ValueError:
+                pass
+        return list(books)
+
+    # Results are cached per (query, category) in the versioned catalog cache, and the rendered
+    # rows per (query, category, role) by {% cache %} in the template; when the fragment is
+    # cached the lazy list is never loaded.
+    books = SimpleLazyObject(lambda: cached_catalog('public_books', (q, category_id), load_books))
     return render(request, 'public_books.html', {
         'books': books,
-        'categories': categories,
+        'categories': catalog_categories(),
         'query': q,
         'selected_category': category_id,
+        **catalog_context(request),
     })
 
 
@@ -92,9 +108,19 @@ def add_book(request):
 def edit_book(request, pk):
     book = get_object_or_404(Book, pk=pk)
     if request.method == 'POST':
+        old_stock = book.number_in_stock
         form = BookForm(request.POST, request.FILES, instance=book)
         if form.is_valid():
-            form.save()
+            book = form.save(commit=False)
+            # only the edited columns: the reader rating stats and analytics_updated_at are kept
+            # current by UPDATEs (lib/ratings.py, lib/analytics.py) that may have landed meanwhile
+            book.save(update_fields=[*form.Meta.fields, 'updated_at'])
+            # new copies go to readers waiting on a hold first
+            for _ in range(book.number_in_stock - old_stock):
+                allocated = allocate_next_hold(book.pk)
+                if allocated is None:
+                    break
+                messages.info(request, f"New copy of '{book.name}' issued to {allocated.reader.name} (hold).")
             return redirect('view_books')
     else:
         form = BookForm(instance=book)
@@ -109,19 +135,56 @@ def delete_book(request, pk):
 
 
 
+# Page size for the admin lists (books, readers, issues, fines, overdue)
+ADMIN_LIST_PAGE_SIZE = getattr(settings, 'ADMIN_LIST_PAGE_SIZE', 50)
+ADMIN_LIST_MAX_PAGE_SIZE = getattr(settings, 'ADMIN_LIST_MAX_PAGE_SIZE', 200)
+
+
+def admin_list_page(request, queryset, ordering):
+    """One keyset page of an admin list, plus the context for partials/list_pager.html.
+
+    `ordering` is the list's sort key and must end in 'pk' (or '-pk') so every
+    row has a unique position. A stale or malformed ?cursor= starts over at
+    the first page.
+    """
+    limit = parse_limit(request.GET.get('limit'), ADMIN_LIST_PAGE_SIZE, ADMIN_LIST_MAX_PAGE_SIZE)
+    cursor = request.GET.get('cursor') or None
+    try:
+        rows, next_cursor = keyset_page(queryset, ordering, cursor, limit)
+    except InvalidCursor:
+        cursor = None
+        rows, next_cursor = keyset_page(queryset, ordering, None, limit)
+    pager = {
+        'next_cursor': next_cursor,
+        'is_first_page': cursor is None,
+        'page_limit': request.GET.get('limit', ''),
+    }
+    return rows, pager
+
+
 def view_books(request):
     """
-    Display all books in the library.
+    Display all books in the library, one page at a time (sorted by name).
     """
-    books = Book.objects.all().order_by('name')  # optional: sort by name
+    books = (
+        Book.objects.select_related('category')
+        .only('name', 'isbn', 'author', 'number_in_stock', 'image', 'rating',
+              'reader_rating_count', 'reader_rating_avg', 'category__name')
+    )
+    books, pager = cached_catalog(
+        'view_books', (request.GET.get('cursor'), request.GET.get('limit')),
+        lambda: admin_list_page(request, books, ['name', 'pk']),
+    )
     context = {
         'books': books,
-        'categories': Category.objects.all(),
+        'pager': pager,
+        'categories': catalog_categories(),
     }
     return render(request, 'view_books.html', context)
 
 
 
+@book_page_condition
 def book_details(request, pk):
     # Render different detail pages depending on who is viewing:
     # - Admins: show admin_book_details.html (with admin controls)
@@ -147,6 +210,7 @@ def book_details(request, pk):
     })
 
 
+@book_description_condition
 def book_description(request, pk):
     """Render a simple page that shows the book title and its full description.
 
@@ -156,12 +220,9 @@ def book_description(request, pk):
     return render(request, 'book_description.html', {'book': book})
 
 
+@admin_required
 def admin_book_details(request, pk):
     """Admin-only book details view. Requires admin session; otherwise redirects to admin login."""
-    admin_id = request.session.get('admin_id')
-    if not admin_id:
-        return redirect('login_admin')
-
     book = get_object_or_404(Book, pk=pk)
     analytics = get_book_analytics_data(book, days=90)
     popular_books = get_popular_books(limit=3, exclude_book_id=pk)
@@ -186,8 +247,9 @@ def add_reader(request):
     return render(request, 'add_reader.html', {'form': form})
 
 def view_readers(request):
-    readers = Reader.objects.all().order_by('name')
-    return render(request, 'view_readers.html', {'readers': readers})
+    readers = Reader.objects.only('reader_id', 'name', 'date_of_birth', 'phone_number', 'address')
+    readers, pager = admin_list_page(request, readers, ['name', 'pk'])
+    return render(request, 'view_readers.html', {'readers': readers, 'pager': pager})
 
 
 def edit_reader(request, pk):
@@ -210,7 +272,7 @@ def delete_reader(request, pk):
 
 def reader_details(request, pk):
     reader = get_object_or_404(Reader, pk=pk)
-    issues = reader.issues.all()  # uses related_name='issues' from Issue model
+    issues = reader.issues.select_related('book')  # uses related_name='issues' from Issue model
     return render(request, 'reader_details.html', {'reader': reader, 'issues': issues})
 
 ###  Issue or borrow related
@@ -220,7 +282,8 @@ def issue_book(request):
         if form.is_valid():
             issue = form.save(commit=False)
 
-            #  Prevent duplicate issue: same reader + same book + not returned
+            #  Prevent duplicate issue: same reader + same book + not returned (checked before stock,
+            #  so an out-of-stock title still reports the duplicate)
             if Issue.objects.filter(reader=issue.reader, book=issue.book, returned_date__isnull=True).exists():
                 form.add_error('book', f"{issue.reader.name} already has '{issue.book.name}' issued.")
             else:
@@ -242,14 +305,19 @@ def issue_book(request):
 
                 # proceed if no due_date errors
                 if not form.errors:
-                    if issue.book.number_in_stock > 0:
-                        issue.book.number_in_stock -= 1
-                        issue.book.save()
-                        issue.save()
+                    try:
+                        # decrements stock and saves the issue in one transaction; a duplicate opened
+                        # since the check above is refused by the lib_issue_one_open_loan constraint
+                        issue_copy(issue)
+                    except OutOfStock:
+                        form.add_error('book', 'This book is out of stock!')
+                    except IntegrityError:
+                        form.add_error('book', f"{issue.reader.name} already has '{issue.book.name}' issued.")
+                    else:
+                        # Record issuance for analytics
+                        record_book_issuance(issue.book, issued_date=issue.issued_date)
                         messages.success(request, f"'{issue.book.name}' issued to {issue.reader.name}.")
                         return redirect('view_issues')
-                    else:
-                        form.add_error('book', 'This book is out of stock!')
     else:
         form = IssueForm()
 
@@ -257,36 +325,85 @@ def issue_book(request):
 
 
 
+def desk_scan_batch(request):
+    """Barcode-station endpoint: issue or return a batch of scanned ISBNs for one reader.
+
+    POST a JSON body ``{"reader_id": "...", "action": "issue" | "return", "isbns": [...]}``.
+    Responds with one result per scanned ISBN; the batch is written in a single transaction.
+    """
+    if get_admin(request) is None:
+        return JsonResponse({'error': 'admin login required'}, status=403)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    try:
+        payload = json.loads(request.body)
+        action = payload['action']
+        isbns = payload['isbns']
+        reader_id = payload['reader_id']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'expected JSON with reader_id, action and isbns'}, status=400)
+    if action not in ('issue', 'return') or not isinstance(isbns, list) or not isbns:
+        return JsonResponse({'error': "action must be 'issue' or 'return' and isbns a non-empty list"}, status=400)
+
+    reader = Reader.objects.filter(reader_id=reader_id).first()
+    if reader is None:
+        return JsonResponse({'error': f"no reader with id '{reader_id}'"}, status=404)
+
+    try:
+        if action == 'issue':
+            results = checkout_batch(reader, isbns)
+        else:
+            results = return_batch(reader, isbns)
+    except IntegrityError:
+        # another desk opened one of these loans while the batch was being checked; nothing was written
+        return JsonResponse({'error': 'loans changed while scanning, please rescan the batch'}, status=409)
+    return JsonResponse({'reader': reader.name, 'action': action, 'results': results})
+
+
 def view_issues(request):
-    issues = Issue.objects.all().order_by('-issued_date')  # latest first
-    return render(request, 'view_issues.html', {'issues': issues})
+    issues = (
+        Issue.objects.select_related('reader', 'book')
+        .only('issued_date', 'due_date', 'returned_date', 'reader__name', 'book__name')
+    )
+    issues, pager = admin_list_page(request, issues, ['-issued_date', '-pk'])  # latest first
+    return render(request, 'view_issues.html', {'issues': issues, 'pager': pager})
 
 def return_book(request, pk):
     issue = get_object_or_404(Issue, pk=pk)
     
     if request.method == 'POST':
-        if not issue.returned_date:  # only if not already returned
-            issue.returned_date = timezone.now().date()
-            issue.book.number_in_stock += 1  # increase book stock
-            issue.book.save()
-            issue.save()
+        # closes the issue and restocks the copy only if it was still open,
+        # then hands that copy to the first reader waiting on a hold
+        if return_copy(issue):
+            allocated = allocate_next_hold(issue.book_id)
+            if allocated:
+                messages.info(request, f"Returned copy of '{issue.book.name}' issued to {allocated.reader.name} (hold).")
         return redirect('view_issues')
     
     return render(request, 'return_book.html', {'issue': issue})
 
 def overdue_books(request):
     today = timezone.now().date()
-    overdue_issues = Issue.objects.filter(returned_date__isnull=True, due_date__lt=today).select_related('reader', 'book').order_by('due_date')
-    
+    overdue_issues = (
+        Issue.objects.filter(returned_date__isnull=True, due_date__lt=today)
+        .select_related('reader', 'book')
+        .only('issued_date', 'due_date', 'reader__name', 'book__name')
+    )
+    overdue_issues, pager = admin_list_page(request, overdue_issues, ['due_date', 'pk'])
+
     # Calculate days overdue for each issue
     for issue in overdue_issues:
         issue.days_overdue = (today - issue.due_date).days
 
-    return render(request, 'overdue_books.html', {'overdue_issues': overdue_issues})
+    return render(request, 'overdue_books.html', {'overdue_issues': overdue_issues, 'pager': pager})
 ### for fines
 def view_fines(request):
-    fines = Fine.objects.select_related('issue__reader', 'issue__book').all().order_by('-calculated_date')
-    return render(request, 'view_fines.html', {'fines': fines})
+    fines = (
+        Fine.objects.select_related('issue__reader', 'issue__book')
+        .only('amount', 'paid', 'calculated_date', 'issue__reader__name', 'issue__book__name')
+    )
+    fines, pager = admin_list_page(request, fines, ['-calculated_date', '-pk'])
+    return render(request, 'view_fines.html', {'fines': fines, 'pager': pager})
 
 def pay_fine(request, pk):
     fine = get_object_or_404(Fine, pk=pk)
@@ -339,30 +456,17 @@ def logout_reader(request):
 
 
 # reader dashboard
+@reader_required
 def reader_dashboard(request):
-    reader_id = request.session.get('reader_id')
-    if not reader_id:
-        return redirect('login_reader')  # redirect if not logged in
-
-    reader = Reader.objects.get(id=reader_id)
+    reader = request.reader
 
     # All books issued to this reader
-    issues = reader.issues.all().order_by('-issued_date')  # uses related_name='issues'
+    issues = reader.issues.select_related('book').order_by('-issued_date')  # uses related_name='issues'
 
-    # Calculate fines for overdue books if not already created
-    today = timezone.now().date()
-    for issue in issues:
-        if not issue.returned_date and issue.due_date < today:
-            # Create fine if it doesn't exist
-            fine, created = Fine.objects.get_or_create(issue=issue, defaults={
-                'amount': (today - issue.due_date).days * 2  # example: $2 per overdue day
-            })
-    
-    # Check and create notifications for due soon and overdue books
-    check_and_create_due_soon_notifications()
-    check_and_create_overdue_notifications()
-    
-    fines = Fine.objects.filter(issue__reader=reader, paid=False)
+    # Fines are accrued nightly by the accrue_fines command and due-soon/overdue
+    # notifications by send_due_notifications; the dashboard only reads them.
+
+    fines = Fine.objects.filter(issue__reader=reader, paid=False).select_related('issue__book')
     unread_notif_count = reader.notifications.filter(read=False).count()
 
     return render(request, 'reader_dashboard.html', {
@@ -373,8 +477,11 @@ def reader_dashboard(request):
     })
 
 def reader_view_books(request):
-    books = Book.objects.all().order_by('name')
-    return render(request, 'books.html', {'books': books, 'categories': Category.objects.all()})
+    # rows contain per-user CSRF tokens, so only the query result is cached, not the fragment
+    books = cached_catalog(
+        'reader_books', (), lambda: list(Book.objects.select_related('category').order_by('name'))
+    )
+    return render(request, 'books.html', {'books': books, 'categories': catalog_categories()})
 
 def reader_book_detail(request, pk):
     """
@@ -383,25 +490,17 @@ def reader_book_detail(request, pk):
     book = get_object_or_404(Book, pk=pk)
     analytics = get_book_analytics_data(book, days=90)
     popular_books = get_popular_books(limit=3, exclude_book_id=pk)
-    # compute average rating given by readers
-    avg_reader_rating = BookRating.objects.filter(book=book).aggregate(avg=Avg('rating'))['avg']
-    if avg_reader_rating is None:
-        avg_reader_rating = float(book.rating)
-    else:
-        avg_reader_rating = float(avg_reader_rating)
-
-    combined_rating = round((float(book.rating) + avg_reader_rating) / 2.0, 1)
+    # reader average comes from the denormalized stats on Book (falls back to admin rating)
+    avg_reader_rating = book.avg_reader_rating()
+    combined_rating = book.combined_rating()
 
     # current user's rating (if logged in)
     user_rating = None
-    reader_obj = None
-    reader_id = request.session.get('reader_id')
-    if reader_id:
-        reader_obj = Reader.objects.filter(id=reader_id).first()
-        if reader_obj:
-            ur = BookRating.objects.filter(book=book, reader=reader_obj).first()
-            if ur:
-                user_rating = float(ur.rating)
+    reader_obj = get_reader(request)
+    if reader_obj:
+        ur = BookRating.objects.filter(book=book, reader=reader_obj).first()
+        if ur:
+            user_rating = float(ur.rating)
 
     return render(request, 'reader_book_detail.html', {
         'book': book,
@@ -418,11 +517,10 @@ def rate_book(request, pk):
     if request.method != 'POST':
         return JsonResponse({'error': 'POST required'}, status=405)
 
-    reader_id = request.session.get('reader_id')
-    if not reader_id:
+    reader = get_reader(request)
+    if reader is None:
         return JsonResponse({'error': 'login required'}, status=403)
 
-    reader = get_object_or_404(Reader, id=reader_id)
     book = get_object_or_404(Book, pk=pk)
 
     try:
@@ -433,15 +531,12 @@ def rate_book(request, pk):
     if rating < 1 or rating > 5:
         return JsonResponse({'error': 'rating out of range (1-5)'}, status=400)
 
-    br, created = BookRating.objects.update_or_create(
-        book=book,
-        reader=reader,
-        defaults={'rating': rating}
-    )
+    # Writes the rating and shifts the book's rating sum/count in one transaction
+    br = set_reader_rating(book, reader, rating)
+    book.refresh_from_db(fields=['reader_rating_sum', 'reader_rating_count', 'reader_rating_avg'])
 
-    avg_reader = BookRating.objects.filter(book=book).aggregate(avg=Avg('rating'))['avg'] or float(book.rating)
-    avg_reader = float(avg_reader)
-    combined = round((float(book.rating) + avg_reader) / 2.0, 1)
+    avg_reader = book.avg_reader_rating()
+    combined = book.combined_rating()
 
     return JsonResponse({
         'combined_rating': combined,
@@ -449,87 +544,19 @@ def rate_book(request, pk):
         'user_rating': float(br.rating),
     })
 
-def approve_request(request, request_id):
-    admin_id = request.session.get('admin_id')
-    if not admin_id:
-        return redirect('login_admin')
-
-    req = get_object_or_404(IssueRequest, pk=request_id, approved=False, rejected=False)
-    book = req.book
-    reader = req.reader
-    # Enforce per-reader limit: count currently issued books and pending requests
-    current_issued = Issue.objects.filter(reader=reader, returned_date__isnull=True).count()
-    current_pending = IssueRequest.objects.filter(reader=reader, approved=False, rejected=False).count()
-    total_count = current_issued + current_pending
-
-    # If total already exceeds the allowed maximum, reject approval
-    if total_count > MAX_ISSUED_PER_READER:
-        messages.error(request, (
-            f"Cannot approve request: {reader.name} already has {total_count} books/pending requests, "
-            f"which exceeds the limit of {MAX_ISSUED_PER_READER}."
-        ))
-        req.rejected = True
-        req.save()
-        return redirect('admin_issue_requests')
-
-    # 🚨 Check if reader already has this book issued
-    if Issue.objects.filter(reader=reader, book=book, returned_date__isnull=True).exists():
-        messages.error(request, f"{reader.name} already has '{book.name}' issued.")
-        req.rejected = True
-        req.save()
-        return redirect('admin_issue_requests')
-
-    # 🚨 Check stock availability
-    if book.number_in_stock <= 0:
-        messages.error(request, f"No copies of '{book.name}' are available.")
-        req.rejected = True
-        req.save()
-        return redirect('admin_issue_requests')
-
-    # ✅ Approve request and issue the book
-    # compute due_date depending on whether the reader is a staff member
-    issued_date = date.today()
-    if getattr(reader, 'is_staff_member', False):
-        due = issued_date + timedelta(days=182)  # ~6 months
-    else:
-        due = issued_date + timedelta(days=14)
-
-    issue = Issue.objects.create(
-        reader=reader,
-        book=book,
-        issued_date=issued_date,
-        due_date=due
-    )
-    book.number_in_stock -= 1
-    book.save()
-
-    # Create a notification for the issued book
-    create_issue_notification(issue)
-    
-    # Record issuance for analytics
-    record_book_issuance(book, issued_date=issue.issued_date)
-
-    req.approved = True
-    req.save()
-
-    messages.success(request, f"Issue request approved: '{book.name}' issued to {reader.name}.")
-    return redirect('admin_issue_requests')
-
+@reader_required
 def issue_request(request, book_id):
     # Check if reader is logged in
-    reader_id = request.session.get('reader_id')
-    if not reader_id:
-        return redirect('login_reader')  # redirect if not logged in
-
-    reader = get_object_or_404(Reader, id=reader_id)
+    reader = request.reader
+    # the quota counters are deferred on the (possibly cached) principal; load both at once
+    reader.refresh_from_db(fields=['active_loans', 'pending_requests'])
     book = get_object_or_404(Book, id=book_id)
 
     # Enforce per-reader limit: current issued books + pending requests must be < MAX
-    current_issued = Issue.objects.filter(reader=reader, returned_date__isnull=True).count()
-    current_pending = IssueRequest.objects.filter(reader=reader, approved=False, rejected=False).count()
-    if current_issued + current_pending >= MAX_ISSUED_PER_READER:
+    # (read from the counters on the Reader row)
+    if quota_used(reader) >= MAX_ISSUED_PER_READER:
         messages.error(request, (
-            f"You cannot request more books. You already have {current_issued} issued and {current_pending} pending "
+            f"You cannot request more books. You already have {reader.active_loans} issued and {reader.pending_requests} pending "
             f"(limit is {MAX_ISSUED_PER_READER}). Return a book or cancel a pending request first."
         ))
         return redirect('reader_view_books')
@@ -539,24 +566,23 @@ def issue_request(request, book_id):
         messages.error(request, f"You already have '{book.name}' issued.")
         return redirect('reader_view_books')
 
-    # ✅ Prevent duplicate pending requests
-    if IssueRequest.objects.filter(reader=reader, book=book, approved=False, rejected=False).exists():
+    # ✅ Create new request; a second pending request for the same book is refused
+    # by the lib_issuerequest_one_pending constraint
+    try:
+        with transaction.atomic():
+            IssueRequest.objects.create(reader=reader, book=book)
+            change_counters(reader.pk, pending=1)
+    except IntegrityError:
         messages.warning(request, f"You already have a pending request for '{book.name}'.")
         return redirect('reader_view_books')
-
-    # ✅ Create new request
-    IssueRequest.objects.create(reader=reader, book=book)
     messages.success(request, f"Issue request for '{book.name}' submitted successfully!")
 
     return redirect('reader_view_books')
 
+@reader_required
 def reader_issued_books(request):
-    reader_id = request.session.get('reader_id')
-    if not reader_id:
-        return redirect('login_reader')
-
-    reader = Reader.objects.get(id=reader_id)
-    issued_books = Issue.objects.filter(reader=reader).order_by('-issued_date')
+    reader = request.reader
+    issued_books = Issue.objects.filter(reader=reader).select_related('book').order_by('-issued_date')
 
     return render(request, 'reader_issued_books.html', {
         'reader': reader,
@@ -564,16 +590,13 @@ def reader_issued_books(request):
     })
 
 
+@reader_required
 def edit_profile(request):
     """Allow logged-in reader to edit their profile and change password.
 
     If password is changed, the current session will be logged out and user redirected to login.
     """
-    reader_id = request.session.get('reader_id')
-    if not reader_id:
-        return redirect('login_reader')
-
-    reader = get_object_or_404(Reader, id=reader_id)
+    reader = request.reader
 
     if request.method == 'POST':
         form = ReaderProfileForm(request.POST, request.FILES, instance=reader)
@@ -601,8 +624,9 @@ def edit_profile(request):
             else:
                 instance.image = original_image
 
-            # Save the instance with updated fields
-            instance.save()
+            # Save only the edited columns: the reader may be a cached copy whose other
+            # columns (e.g. the quota counters) are out of date
+            instance.save(update_fields=[*form.Meta.fields, 'password'])
 
             if pw_changed:
                 # Log out the current session as requested
@@ -628,13 +652,10 @@ def edit_profile(request):
     return render(request, 'edit_profile.html', {'form': form, 'reader': reader})
 
 
+@reader_required
 def change_password(request):
     """Allow logged-in reader to change password on a separate page."""
-    reader_id = request.session.get('reader_id')
-    if not reader_id:
-        return redirect('login_reader')
-
-    reader = get_object_or_404(Reader, id=reader_id)
+    reader = request.reader
 
     if request.method == 'POST':
         form = PasswordChangeForm(request.POST)
@@ -642,7 +663,7 @@ def change_password(request):
             new_pw = form.cleaned_data['password']
             # Keep reader passwords plain-text for now (consistent with existing behavior)
             reader.password = new_pw
-            reader.save()
+            reader.save(update_fields=['password'])
             # Invalidate session and ask to login again
             if 'reader_id' in request.session:
                 del request.session['reader_id']
@@ -656,13 +677,10 @@ def change_password(request):
     return render(request, 'change_password.html', {'form': form, 'reader': reader})
 
 
+@reader_required
 def reader_profile(request):
     """Display the logged-in reader's profile on a dedicated page."""
-    reader_id = request.session.get('reader_id')
-    if not reader_id:
-        return redirect('login_reader')
-
-    reader = get_object_or_404(Reader, id=reader_id)
+    reader = request.reader
     unread_notif_count = reader.notifications.filter(read=False).count()
     return render(request, 'reader_profile.html', {
         'reader': reader,
@@ -702,11 +720,9 @@ def login_admin(request):
     return render(request, 'login_admin.html', {'error': error})
 
 # Admin Dashboard
+@admin_required
 def admin_dashboard(request):
-    admin_id = request.session.get('admin_id')
-    if not admin_id:
-        return redirect('login_admin')
-    admin = Admin.objects.get(id=admin_id)
+    admin = request.admin
     
     total_books = Book.objects.count()
     total_readers = Reader.objects.count()
@@ -724,13 +740,10 @@ def logout_admin(request):
     return redirect('home')
 
 
+@admin_required
 def edit_admin_profile(request):
     """Allow logged-in admin to edit their profile including picture and password."""
-    admin_id = request.session.get('admin_id')
-    if not admin_id:
-        return redirect('login_admin')
-
-    admin = get_object_or_404(Admin, id=admin_id)
+    admin = request.admin
 
     if request.method == 'POST':
         form = AdminProfileForm(request.POST, request.FILES, instance=admin)
@@ -757,7 +770,7 @@ def edit_admin_profile(request):
             else:
                 instance.image = original_image
 
-            instance.save()
+            instance.save(update_fields=[*form.Meta.fields, 'password'])
 
             if pw_changed:
                 # log out admin session
@@ -774,23 +787,17 @@ def edit_admin_profile(request):
     return render(request, 'edit_admin_profile.html', {'form': form, 'admin': admin})
 
 
+@admin_required
 def admin_profile(request):
     """Display admin's profile page with image and details."""
-    admin_id = request.session.get('admin_id')
-    if not admin_id:
-        return redirect('login_admin')
-
-    admin = get_object_or_404(Admin, id=admin_id)
+    admin = request.admin
     return render(request, 'admin_profile.html', {'admin': admin})
 
 
+@admin_required
 def change_admin_password(request):
     """Allow logged-in admin to change password on a separate page."""
-    admin_id = request.session.get('admin_id')
-    if not admin_id:
-        return redirect('login_admin')
-
-    admin = get_object_or_404(Admin, id=admin_id)
+    admin = request.admin
 
     if request.method == 'POST':
         form = PasswordChangeForm(request.POST)
@@ -798,7 +805,7 @@ def change_admin_password(request):
             new_pw = form.cleaned_data['password']
             # Admin passwords are stored hashed — use make_password
             admin.password = make_password(new_pw)
-            admin.save()
+            admin.save(update_fields=['password'])
             # Invalidate admin session
             if 'admin_id' in request.session:
                 del request.session['admin_id']
@@ -811,27 +818,77 @@ def change_admin_password(request):
 
 
 # View all pending requests
+@admin_required
 def admin_issue_requests(request):
-    admin_id = request.session.get('admin_id')
-    if not admin_id:
-        return redirect('login_admin')
+    # requests waiting on a hold are served automatically on return, so list them separately
+    waiting = Hold.objects.filter(request=OuterRef('pk'), status=Hold.WAITING)
+    pending_requests = (
+        IssueRequest.objects.filter(approved=False, rejected=False)
+        .exclude(Exists(waiting))
+        .select_related('reader', 'book')
+        .order_by('request_date')
+    )
+    holds = Hold.objects.filter(status=Hold.WAITING).select_related('reader', 'book').order_by('book__name', 'created_at', 'id')
+    return render(request, 'admin_issue_requests.html', {'pending_requests': pending_requests, 'holds': holds})
 
-    pending_requests = IssueRequest.objects.filter(approved=False, rejected=False).order_by('request_date')
-    return render(request, 'admin_issue_requests.html', {'pending_requests': pending_requests})
 
+@admin_required
+def bulk_issue_requests(request):
+    """Approve or reject several pending requests in one POST.
+
+    Expects ``request_ids`` (repeated) and ``action`` ('approve' or 'reject').
+    AJAX callers get a JSON report with the outcome of every request;
+    form posts get flash messages and a redirect back to the list.
+    """
+    if request.method != 'POST':
+        return redirect('admin_issue_requests')
+
+    action = request.POST.get('action')
+    try:
+        request_ids = [int(pk) for pk in request.POST.getlist('request_ids')]
+    except ValueError:
+        request_ids = None
+    wants_json = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+
+    if action not in ('approve', 'reject') or not request_ids:
+        if wants_json:
+            return JsonResponse({'error': 'select at least one request and an action'}, status=400)
+        messages.error(request, 'Select at least one request to approve or reject.')
+        return redirect('admin_issue_requests')
+
+    try:
+        if action == 'approve':
+            results = bulk_approve_requests(request_ids)
+        else:
+            results = bulk_reject_requests(request_ids)
+    except IntegrityError:
+        # a duplicate open loan appeared concurrently; the whole batch was rolled back
+        if wants_json:
+            return JsonResponse({'error': 'loans changed while approving, please retry'}, status=409)
+        messages.error(request, 'Loans changed while approving these requests; nothing was saved, please retry.')
+        return redirect('admin_issue_requests')
+
+    if wants_json:
+        return JsonResponse({'results': results})
+
+    done = [r for r in results if r['status'] == ('approved' if action == 'approve' else 'rejected')]
+    if done:
+        messages.success(request, f"{len(done)} request(s) {'approved' if action == 'approve' else 'rejected'}.")
+    for r in results:
+        if r['status'] == 'held':
+            messages.warning(request, f"Request #{r['request_id']}: {r['message']}")
+        elif r not in done:
+            messages.error(request, f"Request #{r['request_id']}: {r['message']}")
+    return redirect('admin_issue_requests')
 
-def approve_request(request, request_id):
-    admin_id = request.session.get('admin_id')
-    if not admin_id:
-        return redirect('login_admin')
 
+@admin_required
+def approve_request(request, request_id):
     req = get_object_or_404(IssueRequest, pk=request_id, approved=False, rejected=False)
     book = req.book
     reader = req.reader
-    # Enforce per-reader limit: count currently issued books and pending requests
-    current_issued = Issue.objects.filter(reader=reader, returned_date__isnull=True).count()
-    current_pending = IssueRequest.objects.filter(reader=reader, approved=False, rejected=False).count()
-    total_count = current_issued + current_pending
+    # Enforce per-reader limit: currently issued books and pending requests (Reader counters)
+    total_count = quota_used(reader)
 
     # If total already exceeds the allowed maximum, reject approval
     if total_count > MAX_ISSUED_PER_READER:
@@ -839,40 +896,46 @@ def approve_request(request, request_id):
             f"Cannot approve request: {reader.name} already has {total_count} books/pending requests, "
             f"which exceeds the limit of {MAX_ISSUED_PER_READER}."
         ))
-        req.rejected = True
-        req.save()
+        close_request(req, rejected=True)
         return redirect('admin_issue_requests')
 
-    #  Check if reader already has this book issued
+    # A reader who already has the book is rejected before stock is looked at (otherwise an
+    # out-of-stock title would put the duplicate request on hold)
     if Issue.objects.filter(reader=reader, book=book, returned_date__isnull=True).exists():
         messages.error(request, f"{reader.name} already has '{book.name}' issued.")
-        req.rejected = True
-        req.save()
-        return redirect('admin_issue_requests')
-
-    #  Check stock availability
-    if book.number_in_stock <= 0:
-        messages.error(request, f"No copies of '{book.name}' are available.")
-        req.rejected = True
-        req.save()
+        close_request(req, rejected=True)
         return redirect('admin_issue_requests')
 
     #  Approve request and issue the book
-    # compute due_date depending on whether the reader is a staff member
+    # compute due_date depending on whether the reader is a staff member (~6 months vs 2 weeks)
     issued_date = date.today()
-    if getattr(reader, 'is_staff_member', False):
-        due = issued_date + timedelta(days=182)  # ~6 months
-    else:
-        due = issued_date + timedelta(days=14)
+    due = loan_due_date(reader, issued_date)
 
-    issue = Issue.objects.create(
-        reader=reader,
-        book=book,
-        issued_date=issued_date,
-        due_date=due
-    )
-    book.number_in_stock -= 1
-    book.save()
+    #  Reserve a copy, create the issue and close the request atomically (fails if no copy is
+    #  left, or if the reader already has this book issued - see the lib_issue_one_open_loan
+    #  constraint), so active_loans and pending_requests always change together
+    try:
+        with transaction.atomic():
+            if not close_request(req, approved=True):
+                # approved or rejected meanwhile (e.g. a double click); nothing to do
+                return redirect('admin_issue_requests')
+            issue = issue_copy(Issue(
+                reader=reader,
+                book=book,
+                issued_date=issued_date,
+                due_date=due
+            ))
+    except OutOfStock:
+        # keep the request pending and queue it; the next returned copy goes to the queue head
+        req.approved = False  # rolled back with the loan
+        _, position = place_hold(req)
+        messages.warning(request, f"No copies of '{book.name}' are available. {reader.name} is number {position} in the hold queue.")
+        return redirect('admin_issue_requests')
+    except IntegrityError:
+        req.approved = False  # rolled back with the loan
+        messages.error(request, f"{reader.name} already has '{book.name}' issued.")
+        close_request(req, rejected=True)
+        return redirect('admin_issue_requests')
 
     # Create a notification for the issued book
     create_issue_notification(issue)
@@ -880,20 +943,14 @@ def approve_request(request, request_id):
     # Record issuance for analytics
     record_book_issuance(book, issued_date=issue.issued_date)
 
-    req.approved = True
-    req.save()
-
     messages.success(request, f"Issue request approved: '{book.name}' issued to {reader.name}.")
     return redirect('admin_issue_requests')
 
+@admin_required
 def reject_request(request, request_id):
-    admin_id = request.session.get('admin_id')
-    if not admin_id:
-        return redirect('login_admin')
-
     req = get_object_or_404(IssueRequest, pk=request_id, approved=False, rejected=False)
-    req.rejected = True
-    req.save()
+    close_request(req, rejected=True)
+    cancel_holds([req.pk])
 
     # Create a notification for the reader informing them their request was rejected
     try:
@@ -912,20 +969,14 @@ def reject_request(request, request_id):
 
 #category for admin
 
+@admin_required
 def view_categories(request):
-    admin_id = request.session.get('admin_id')
-    if not admin_id:
-        return redirect('login_admin')
-
     categories = Category.objects.all()
     return render(request, 'admin_view_categories.html', {'categories': categories})
 
 # Add new category
+@admin_required
 def add_category(request):
-    admin_id = request.session.get('admin_id')
-    if not admin_id:
-        return redirect('login_admin')
-
     if request.method == 'POST':
         name = request.POST.get('name')
         if name:
@@ -935,11 +986,8 @@ def add_category(request):
     return render(request, 'admin_add_category.html')
 
 # Edit category
+@admin_required
 def edit_category(request, category_id):
-    admin_id = request.session.get('admin_id')
-    if not admin_id:
-        return redirect('login_admin')
-
     category = get_object_or_404(Category, id=category_id)
 
     if request.method == 'POST':
@@ -952,11 +1000,8 @@ def edit_category(request, category_id):
     return render(request, 'admin_edit_category.html', {'category': category})
 
 # Delete category
+@admin_required
 def delete_category(request, category_id):
-    admin_id = request.session.get('admin_id')
-    if not admin_id:
-        return redirect('login_admin')
-
     category = get_object_or_404(Category, id=category_id)
     category.delete()
     return redirect('view_categories')
@@ -964,132 +1009,142 @@ def delete_category(request, category_id):
 ### Searching books
 
 
-def ajax_search_books(request):
-    query = request.GET.get('q', '')
-    category_id = request.GET.get('category', '')
+# Page size for the live search (``limit`` query parameter)
+AJAX_SEARCH_DEFAULT_LIMIT = getattr(settings, 'AJAX_SEARCH_DEFAULT_LIMIT', 50)
+AJAX_SEARCH_MAX_LIMIT = getattr(settings, 'AJAX_SEARCH_MAX_LIMIT', 200)
+# Fields a caller may ask for with ``fields=name,author,...`` ('pk' is always included)
+AJAX_SEARCH_FIELDS = (
+    'name', 'author', 'isbn', 'category', 'category_id', 'image',
+    'pk', 'url', 'stock', 'avg_reader_rating', 'combined_rating',
+)
 
-    books = Book.objects.all()
-    # Restrict AJAX search to book name only (case-insensitive)
-    if query:
-        books = books.filter(
-            Q(name__icontains=query)
-        )
-    if category_id:
-        books = books.filter(category_id=category_id)
-
-    # If no query provided, return books ordered alphabetically by name for consistent results
-    if not query:
-        books = books.order_by('name')
 
-    data = []
-    for book in books:
-        # Choose correct detail URL depending on who is viewing
-        if request.session.get('admin_id'):
-            url = reverse('admin_book_details', args=[book.pk])  # admin book detail
-        elif request.session.get('reader_id'):
-            url = reverse('reader_book_detail', args=[book.pk])  # logged-in reader detail
-        else:
-            url = reverse('book_details', args=[book.pk])  # public/detail view for anonymous users
+def _search_books_payload(query, category_id, limit, cursor, fields, detail_view):
+    """One page of ajax_search_books results (`category_id` is an int or None).
 
-        # Debug print
-        print(f"User: {request.user}, is_staff: {getattr(request.user, 'is_staff', False)}, Book URL: {url}")
+    Raises InvalidCursor/TypeError/ValueError on a bad cursor.
+    """
+    # Simple title/author lookups (optionally within a category) are answered by the
+    # in-memory autocomplete index; anything else goes through the ORM/full-text path.
+    use_index = bool(normalize_query(query))
 
-        # compute reader average and combined rating for this book
-        try:
-            avg_reader = BookRating.objects.filter(book=book).aggregate(avg=Avg('rating'))['avg'] or float(book.rating)
-            avg_reader = float(avg_reader)
-        except Exception:
-            avg_reader = float(book.rating)
-        combined = round((float(book.rating) + avg_reader) / 2.0, 1)
-
-        data.append({
-            'name': book.name,
-            'author': book.author,
-            'isbn': getattr(book, 'isbn', ''),
-            'category': book.category.name if book.category else '',
-            'category_id': book.category.id if book.category else '',
-            'image': book.image.url if getattr(book, 'image', None) else '',
-            'pk': book.pk,
-            'url': url,
-            'stock': book.number_in_stock,
-            'avg_reader_rating': round(avg_reader, 1),
-            'combined_rating': combined,
-        })
-
-    return JsonResponse({'books': data})
+    books = Book.objects.all()
+    if 'category' in fields:
+        books = books.select_related('category')
+
+    if use_index:
+        # Ranked results are keyed on (match tier, normalised name, pk)
+        ranked = autocomplete_index.search(query, category_id=category_id)
+        start = bisect_right(ranked, tuple(decode_cursor(cursor, 3))) if cursor else 0
+        page_keys = ranked[start:start + limit]
+        by_pk = books.in_bulk([pk for _, _, pk in page_keys])
+        page = [by_pk[pk] for _, _, pk in page_keys if pk in by_pk]
+        has_more = start + limit < len(ranked)
+        next_key = list(page_keys[-1]) if page_keys else None
+    else:
+        if query:
+            # Match title and author, ranked by the full-text index
+            books = search_books(books, query, columns=['name', 'author'])
+        if category_id is not None:
+            books = books.filter(category_id=category_id)
+        # Keyset pagination on (name, pk)
+        books = books.order_by('name', 'pk')
+        if cursor:
+            books = books.filter(keyset_filter(['name', 'pk'], decode_cursor(cursor, 2)))
+        page = list(books[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        next_key = [page[-1].name, page[-1].pk] if page else None
 
+    data = []
+    for book in page:
+        item = {'pk': book.pk}
+        if 'name' in fields:
+            item['name'] = book.name
+        if 'author' in fields:
+            item['author'] = book.author
+        if 'isbn' in fields:
+            item['isbn'] = book.isbn
+        if 'category' in fields:
+            item['category'] = book.category.name if book.category else ''
+        if 'category_id' in fields:
+            item['category_id'] = book.category_id or ''
+        if 'image' in fields:
+            item['image'] = book.image.url if book.image else ''
+        if 'url' in fields:
+            item['url'] = reverse(detail_view, args=[book.pk])
+        if 'stock' in fields:
+            item['stock'] = book.number_in_stock
+        # reader average and combined rating read from the denormalized stats on Book
+        if 'avg_reader_rating' in fields:
+            item['avg_reader_rating'] = round(book.avg_reader_rating(), 1)
+        if 'combined_rating' in fields:
+            item['combined_rating'] = book.combined_rating()
+        data.append(item)
 
+    return {
+        'books': data,
+        'next_cursor': encode_cursor(next_key) if has_more and next_key else None,
+    }
 
-# (Removed commented-out example rate_book handler — ratings implemented elsewhere)
 
+def ajax_search_books(request):
+    """Live book search returning one page of results as JSON.
 
-### Notification system
+    Query parameters:
+    - q, category: search text and optional category filter
+    - limit: page size (default AJAX_SEARCH_DEFAULT_LIMIT, max AJAX_SEARCH_MAX_LIMIT)
+    - cursor: the ``next_cursor`` token from the previous page
+    - fields: comma separated subset of AJAX_SEARCH_FIELDS to return
+    """
+    query = request.GET.get('q', '')
+    try:
+        category_id = int(request.GET['category']) if request.GET.get('category') else None
+    except ValueError:
+        return JsonResponse({'error': 'invalid category'}, status=400)
+    limit = parse_limit(request.GET.get('limit'), AJAX_SEARCH_DEFAULT_LIMIT, AJAX_SEARCH_MAX_LIMIT)
+    cursor = request.GET.get('cursor', '')
 
-def create_issue_notification(issue):
-    """Create a notification when a book is issued to a reader."""
-    Notification.objects.create(
-        reader=issue.reader,
-        issue=issue,
-        notification_type='issued',
-        title=f"Book Issued: {issue.book.name}",
-        message=f"You have been issued '{issue.book.name}' by {issue.book.author}. Due date: {issue.due_date}"
-    )
+    fields = set(AJAX_SEARCH_FIELDS)
+    if request.GET.get('fields'):
+        fields = {f.strip() for f in request.GET['fields'].split(',')} & fields
+        fields.add('pk')
 
+    if request.session.get('admin_id'):
+        detail_view = 'admin_book_details'  # admin book detail
+    elif request.session.get('reader_id'):
+        detail_view = 'reader_book_detail'  # logged-in reader detail
+    else:
+        detail_view = 'book_details'  # public/detail view for anonymous users
 
-def check_and_create_due_soon_notifications():
-    """Create notifications for books due in 2 days. Call this periodically (e.g., via cron/celery)."""
-    today = timezone.now().date()
-    target_date = today + timedelta(days=2)
-    
-    # Find issues that are due in 2 days and not yet notified
-    issues = Issue.objects.filter(
-        due_date=target_date,
-        returned_date__isnull=True
-    ).select_related('reader', 'book')
-    
-    for issue in issues:
-        # Check if notification already exists for this issue
-        if not Notification.objects.filter(issue=issue, notification_type='due_soon').exists():
-            Notification.objects.create(
-                reader=issue.reader,
-                issue=issue,
-                notification_type='due_soon',
-                title=f"Due Soon: {issue.book.name}",
-                message=f"'{issue.book.name}' is due on {issue.due_date}. Please return it on time to avoid fines."
+    # Pages are cached in the versioned catalog cache; errors are not cached. Text queries are
+    # not: they are answered from this process's autocomplete index, which picks up other
+    # workers' edits only when it reloads, and a page cached from it would serve that lag to
+    # every worker until the next catalog change
+    build = lambda: _search_books_payload(query, category_id, limit, cursor, fields, detail_view)
+    try:
+        if normalize_query(query):
+            payload = build()
+        else:
+            payload = cached_catalog(
+                'ajax_search', (query, category_id, limit, cursor, sorted(fields), detail_view), build,
             )
+    except (InvalidCursor, TypeError, ValueError):
+        # tampered cursor (wrong shape or value types)
+        return JsonResponse({'error': 'invalid cursor'}, status=400)
+    return JsonResponse(payload)
 
 
-def check_and_create_overdue_notifications():
-    """Create notifications for overdue books. Call this periodically (e.g., via cron/celery)."""
-    today = timezone.now().date()
-    
-    # Find overdue issues (not returned and due date passed) and not yet notified
-    overdue_issues = Issue.objects.filter(
-        due_date__lt=today,
-        returned_date__isnull=True
-    ).select_related('reader', 'book')
-    
-    for issue in overdue_issues:
-        # Check if notification already exists for this issue
-        if not Notification.objects.filter(issue=issue, notification_type='overdue').exists():
-            days_overdue = (today - issue.due_date).days
-            Notification.objects.create(
-                reader=issue.reader,
-                issue=issue,
-                notification_type='overdue',
-                title=f"Overdue: {issue.book.name}",
-                message=f"'{issue.book.name}' is {days_overdue} day(s) overdue. Please return it immediately to avoid additional fines."
-            )
+# (Removed commented-out example rate_book handler — ratings implemented elsewhere)
+
 
+### Notification system
 
+@reader_required
 def reader_notifications(request):
     """Display all notifications for the logged-in reader."""
-    reader_id = request.session.get('reader_id')
-    if not reader_id:
-        return redirect('login_reader')
-    
-    reader = Reader.objects.get(id=reader_id)
-    notifications = reader.notifications.all()
+    reader = request.reader
+    notifications = reader.notifications.select_related('issue__book')
     unread_count = notifications.filter(read=False).count()
     
     # Mark as read if requested
@@ -1108,13 +1163,10 @@ def reader_notifications(request):
     })
 
 
+@reader_required
 def mark_all_notifications_read(request):
     """Mark all notifications as read for the logged-in reader."""
-    reader_id = request.session.get('reader_id')
-    if not reader_id:
-        return redirect('login_reader')
-    
-    reader = Reader.objects.get(id=reader_id)
+    reader = request.reader
     reader.notifications.filter(read=False).update(read=True)
     
     return redirect('reader_notifications')
@@ -1122,42 +1174,7 @@ def mark_all_notifications_read(request):
 
 ### Analytics
 
-def record_book_issuance(book, issued_date=None):
-    """Record a book issuance in the analytics."""
-    if issued_date is None:
-        issued_date = date.today()
-    
-    record, created = BookIssuanceRecord.objects.get_or_create(
-        book=book,
-        date=issued_date,
-        defaults={'quantity_issued': 0}
-    )
-    record.quantity_issued += 1
-    record.save()
-
-
-def get_book_analytics_data(book, days=90):
-    """Get analytics data for a book over the last N days."""
-    end_date = date.today()
-    start_date = end_date - timedelta(days=days)
-    
-    records = BookIssuanceRecord.objects.filter(
-        book=book,
-        date__gte=start_date,
-        date__lte=end_date
-    ).order_by('date')
-    
-    dates = [str(r.date) for r in records]
-    quantities = [r.quantity_issued for r in records]
-    
-    return {
-        'dates': dates,
-        'quantities': quantities,
-        'total_issued': sum(quantities),
-        'avg_per_day': sum(quantities) / max(len(records), 1) if records else 0,
-    }
-
-
+@book_data_condition
 def book_analytics_api(request, pk):
     """API endpoint to return analytics data as JSON."""
     book = get_object_or_404(Book, pk=pk)
@@ -1167,18 +1184,19 @@ def book_analytics_api(request, pk):
         days = int(days)
     except (ValueError, TypeError):
         days = 90
+    # each day of window is a loop step and a chart point, so bound it
+    if not 1 <= days <= ANALYTICS_MAX_DAYS:
+        return JsonResponse({'error': f'days out of range (1-{ANALYTICS_MAX_DAYS})'}, status=400)
     
-    data = get_book_analytics_data(book, days=days)
+    # Granularity (daily/weekly/monthly) is picked from `days` unless requested explicitly
+    granularity = request.GET.get('granularity')
+    if granularity not in ANALYTICS_GRANULARITIES:
+        granularity = None
+
+    data = get_book_analytics_data(book, days=days, granularity=granularity)
     return JsonResponse(data)
 
 
 def get_popular_books(limit=3, exclude_book_id=None):
-    """Get random popular books with rating > 4.5."""
-    books = Book.objects.filter(rating__gt=4.5)
-    
-    if exclude_book_id:
-        books = books.exclude(pk=exclude_book_id)
-    
-    # Order by random and limit
-    books = books.order_by('?')[:limit]
-    return books
\ No newline at end of file
+    """Get random popular books (rating > 4.5) sampled from the precomputed popularity pool."""
+    return sample_popular_books(limit=limit, exclude_book_id=exclude_book_id)
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,20 +44,25 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'lib.middleware.ServerTimingMiddleware',
+    'lib.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'lib.principals.PrincipalMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'lib.middleware.ViewTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'library.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also reports render time to the Server-Timing header
+        'BACKEND': 'lib.template_backends.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -82,6 +90,44 @@ DATABASES = {
 }
 
 
+# Cache
+# One SQLite file shared by every worker process on this host (see lib/cache_backends.py);
+# benchmark against LocMem and the database cache with `python manage.py benchmark_cache`.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'lib.cache_backends.SQLiteCache',
+        'LOCATION': str(BASE_DIR / 'cache.sqlite3'),
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+
+# Sessions
+# The views only keep reader_id/admin_id/is_staff_member (plus flash messages) in the session.
+# Pick a profile with LIBRARY_SESSION_PROFILE; compare them with `python manage.py benchmark_sessions`.
+#   cached_db: read from the shared cache, written through to django_session (default)
+#   cookie:    signed cookie, no server-side storage at all; a logged-out cookie stays
+#              valid until it expires, so keep SESSION_COOKIE_AGE short
+#   db:        Django's database backend, one django_session SELECT per request
+
+SESSION_PROFILES = {
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cookie': 'django.contrib.sessions.backends.signed_cookies',
+    'db': 'django.contrib.sessions.backends.db',
+}
+SESSION_PROFILE = os.environ.get('LIBRARY_SESSION_PROFILE', 'cached_db')
+if SESSION_PROFILE not in SESSION_PROFILES:
+    raise ImproperlyConfigured(
+        f"Unknown LIBRARY_SESSION_PROFILE {SESSION_PROFILE!r}; choose one of: {', '.join(SESSION_PROFILES)}"
+    )
+SESSION_ENGINE = SESSION_PROFILES[SESSION_PROFILE]
+SESSION_COOKIE_HTTPONLY = True
+if SESSION_PROFILE == 'cookie':
+    SESSION_COOKIE_AGE = 60 * 60 * 24  # one day instead of two weeks
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -135,3 +181,38 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Per-view SQL query budgets (by URL name) checked by lib.middleware.QueryBudgetMiddleware.
+# Views without an entry get QUERY_BUDGET_DEFAULT. Set QUERY_BUDGET_ENFORCE = True to raise
+# instead of logging a warning.
+QUERY_BUDGET_DEFAULT = 25
+QUERY_BUDGETS = {
+    'view_books': 6,
+    'view_readers': 6,
+    'view_issues': 6,
+    'view_fines': 6,
+    'overdue_books': 6,
+    'admin_issue_requests': 8,
+    'reader_details': 6,
+}
+
+# Per-request timing (lib.timing, one JSON line per request) and query budget (lib.queries) logs.
+# The console handler only prints while DEBUG is on; point these loggers at a file or log
+# shipper in production.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'require_debug_true': {'()': 'django.utils.log.RequireDebugTrue'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'filters': ['require_debug_true']},
+        'stderr': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'lib.timing': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'lib.queries': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        # rows changed or skipped by data migrations, shown whatever DEBUG is
+        'lib.migrations': {'handlers': ['stderr'], 'level': 'WARNING', 'propagate': False},
+    },
+}